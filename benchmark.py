@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import statistics
+from datetime import datetime
+
+import numpy as np
+import torch
+from PIL import Image
+
+# اضافه کردن مسیر پروژه به sys.path از طریق ماژول متمرکز
+try:
+    from src.utils import paths
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from src.utils import paths
+
+from src.processors.color_quantizer import ColorQuantizer
+from src.processors.dithering import DITHER_METHODS
+from src.processors.speckle_cleaner import SpeckleCleaner
+from src.processors.symmetry_maker import SymmetryMaker
+from src.models.edge_detector import EdgeDetector
+from src.models.sam_segmenter import SAMSegmenter
+
+DEFAULT_SIZES = "512x768,1024x1536,2048x3072"
+DEFAULT_PALETTES = "8,16,32"
+QUICK_SIZES = "256x384"
+QUICK_PALETTES = "8,16"
+# پروفایل‌های سنجش تولید طرح روی CPU: (برچسب، تنظیمات cpu_inference)
+CPU_GENERATION_PROFILES = [
+    ('float32', {'dtype': 'float32', 'channels_last': False}),
+    ('float32+channels_last', {'dtype': 'float32', 'channels_last': True}),
+    ('bfloat16+channels_last', {'dtype': 'bfloat16', 'channels_last': True}),
+    ('float32+int8', {'dtype': 'float32', 'channels_last': True, 'quantize_int8': True}),
+]
+
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        width, height = item.lower().split('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+def make_synthetic_design(width, height, seed=0):
+    """
+    تصویر مصنوعی و تکرارپذیر شبیه طرح فرش: ترنج مرکزی، نقوش تکرارشونده و کمی نویز.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    x /= width
+    y /= height
+    radius = np.sqrt((x - 0.5) ** 2 + (y - 0.5) ** 2)
+    red = 128 + 100 * np.sin(12 * np.pi * x) * np.cos(8 * np.pi * y)
+    green = 100 + 80 * np.cos(20 * np.pi * radius)
+    blue = 90 + 70 * np.sin(6 * np.pi * (x + y))
+    image = np.stack([red, green, blue], axis=-1)
+    image += rng.normal(0, 12, image.shape).astype(np.float32)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+def make_synthetic_mask(width, height):
+    """ماسک بیضی مرکزی (شیء اصلی) برای سنجش اعمال ماسک."""
+    y, x = np.mgrid[0:height, 0:width]
+    return ((x - width / 2) / (width * 0.4)) ** 2 + ((y - height / 2) / (height * 0.4)) ** 2 <= 1
+
+def make_palette(n_colors, seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(n_colors, 3), dtype=np.uint8)
+
+def time_call(func, repeat=3, warmup=1):
+    """اجرای تابع (با خروجی متنی خاموش) و بازگرداندن آمار زمان اجرا به ثانیه."""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            func()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return {
+        'min_s': round(min(timings), 5),
+        'median_s': round(statistics.median(timings), 5),
+        'mean_s': round(statistics.mean(timings), 5),
+        'repeat': repeat
+    }
+
+
+class BenchmarkSuite:
+    """
+    مجموعه سنجش کارایی پردازشگرها و مدل‌های سبک (قابل اجرا به صورت آفلاین روی CPU)
+    روی ماتریسی از ابعاد نقشه گره و اندازه پالت.
+    """
+    def __init__(self, sizes, palettes, repeat=3, include_e2e=True, config_path=paths.DEFAULT_CONFIG_PATH):
+        self.sizes = sizes
+        self.palettes = palettes
+        self.repeat = repeat
+        self.include_e2e = include_e2e
+        self.config_path = config_path
+        self.results = []
+
+    def _record(self, name, size, n_colors, func, repeat=None):
+        stats = time_call(func, repeat=repeat or self.repeat)
+        megapixels = size[0] * size[1] / 1_000_000
+        record = {'name': name, 'size': list(size), 'n_colors': n_colors}
+        record.update(stats)
+        record['mpix_per_s'] = round(megapixels / stats['median_s'], 3) if stats['median_s'] > 0 else None
+        self.results.append(record)
+        palette_text = f" | {n_colors} رنگ" if n_colors else ""
+        print(f"   ⏱️ {name:<34} {size[0]}x{size[1]}{palette_text}: {stats['median_s'] * 1000:9.1f} ms")
+        return record
+
+    def run_generation(self, base_model, controlnet, size=(512, 512), steps=10, threads=0, compile_unet=False):
+        """
+        سنجش ثانیه بر گام (step) نمونه‌برداری ControlNet روی CPU برای هر پروفایل CPU_GENERATION_PROFILES.
+        زمان هر گام از فاصله callbackهای پایان گام به دست می‌آید (گام اول که کدگذاری پرامپت را هم دارد حذف می‌شود).
+        """
+        from src.models.controlnet_generator import ControlNetGenerator, cpu_bf16_native
+
+        profiles = list(CPU_GENERATION_PROFILES)
+        if compile_unet:
+            profiles.append(('float32+channels_last+compile', {'dtype': 'float32', 'channels_last': True, 'compile': True}))
+        control_image = Image.fromarray((make_synthetic_mask(*size) * 255).astype(np.uint8)).convert('RGB')
+        print(f"\n🎨 سنجش تولید طرح روی CPU ({size[0]}x{size[1]}، {steps} گام)")
+        for label, options in profiles:
+            if options['dtype'] == 'bfloat16' and not cpu_bf16_native():
+                print(f"   ⏭️ {label}: این CPU از bfloat16 سخت‌افزاری پشتیبانی نمی‌کند.")
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):
+                generator = ControlNetGenerator(base_model, controlnet, device='cpu',
+                                                cpu_options=dict(options, threads=threads))
+            generator.pipe.set_progress_bar_config(disable=True)
+            stamps = []
+
+            def on_step_end(pipe, step, timestep, callback_kwargs):
+                stamps.append(time.perf_counter())
+                return callback_kwargs
+
+            def generate(num_steps):
+                return generator.pipe(prompt="persian carpet design", image=control_image, num_inference_steps=num_steps,
+                                      width=size[0], height=size[1], generator=torch.Generator('cpu').manual_seed(0),
+                                      callback_on_step_end=on_step_end)
+
+            with torch.inference_mode():
+                generate(2)  # گرم کردن (و کامپایل در صورت فعال بودن)
+                stamps.clear()
+                generate(steps)
+            step_times = np.diff(stamps)
+            record = {'name': f'controlnet.step[cpu,{label}]', 'size': list(size), 'n_colors': None,
+                      'min_s': round(float(step_times.min()), 5),
+                      'median_s': round(float(np.median(step_times)), 5),
+                      'mean_s': round(float(step_times.mean()), 5),
+                      'repeat': len(step_times), 'threads': torch.get_num_threads()}
+            self.results.append(record)
+            print(f"   ⏱️ {record['name']:<34} {size[0]}x{size[1]}: {record['median_s']:7.3f} s/step")
+            generator.unload()
+            del generator
+        return self.results
+
+    def run(self):
+        symmetry_maker = SymmetryMaker()
+        edge_detector = EdgeDetector(method="Canny", device="cpu")
+        segmenter = SAMSegmenter(device="cpu")
+        pipeline = self._build_pipeline() if self.include_e2e else None
+
+        for size in self.sizes:
+            width, height = size
+            print(f"\n📐 ابعاد نقشه گره: {width}x{height}")
+            image = make_synthetic_design(width, height)
+            mask = make_synthetic_mask(width, height)
+
+            for n_colors in self.palettes:
+                quantizer = ColorQuantizer(n_colors=n_colors)
+                palette = make_palette(n_colors)
+                self._record('color_quantizer.quantize_with_dithering', size, n_colors,
+                             lambda: quantizer.quantize_with_dithering(image))
+                self._record('color_quantizer.apply_palette_with_dithering', size, n_colors,
+                             lambda: quantizer.apply_palette_with_dithering(image, palette))
+                # روش‌های ماژول dithering (floyd_steinberg اینجا نسخه برداری نواری است، نه PIL)
+                for method in DITHER_METHODS:
+                    self._record(f'color_quantizer.apply_palette[{method}]', size, n_colors,
+                                 lambda: quantizer.apply_palette(image, palette, dither=method))
+                self._record('color_quantizer.extract_palette', size, n_colors,
+                             lambda: quantizer.extract_palette(image))
+                knot_map, _ = quantizer.quantize_with_dithering(image, indexed=True)
+                self._record('speckle_cleaner.clean', size, n_colors,
+                             lambda: SpeckleCleaner(min_knots=4).clean(knot_map))
+
+            self._record('symmetry_maker.create_mirror_horizontal', size, None,
+                         lambda: symmetry_maker.create_mirror_horizontal(image))
+            self._record('symmetry_maker.create_four_way_mirror', size, None,
+                         lambda: symmetry_maker.create_four_way_mirror(image))
+            self._record('symmetry_maker.create_medallion_layout', size, None,
+                         lambda: symmetry_maker.create_medallion_layout(image, canvas_size=size))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                edges = np.array(edge_detector.detect_edges(image))
+            self._record('edge_detector.detect_edges[Canny]', size, None,
+                         lambda: edge_detector.detect_edges(image))
+            self._record('edge_detector.refine_edges', size, None,
+                         lambda: edge_detector.refine_edges(edges, kernel_size=3))
+
+            self._record('sam_segmenter.apply_mask_to_image', size, None,
+                         lambda: segmenter.apply_mask_to_image(image, mask))
+
+            if pipeline is not None:
+                for n_colors in self.palettes:
+                    self._record('pipeline.process_image[no_generation]', size, n_colors,
+                                 lambda: self._run_pipeline(pipeline, image, size, n_colors),
+                                 repeat=max(1, self.repeat // 2))
+
+        return self.results
+
+    def _build_pipeline(self):
+        from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline = CarpetDesignPipeline(config_path=self.config_path)
+        pipeline.config['processing']['edge_detection']['method'] = 'Canny'
+        return pipeline
+
+    def _run_pipeline(self, pipeline, image, size, n_colors):
+        # با شانه و تار ۱۰، ابعاد نقشه گره برابر با عرض و طول (سانتی‌متر) خواهد بود
+        pipeline.carpet_specs = {'width_cm': size[0], 'height_cm': size[1], 'shaneh': 10, 'tar': 10}
+        pipeline.config['processing']['color_quantization']['n_colors'] = n_colors
+        run_config = {
+            'remove_background': False, 'detect_edges': True, 'generate_design': False,
+            'quantize_colors': True, 'apply_symmetry': True, 'vectorize': False,
+            'save_intermediate': False, 'use_cache': False
+        }
+        output_dir = tempfile.mkdtemp(prefix='carpet_bench_')
+        try:
+            pipeline.process_image(image, output_dir=output_dir, run_config=run_config, log_callback=lambda message: None)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def environment_info():
+    """اطلاعات محیط اجرا برای مقایسه معتبر نتایج بین کامیت‌ها."""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pillow': Image.__version__,
+    }
+    try:
+        import cv2
+        info['opencv'] = cv2.__version__
+    except ImportError:
+        pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=paths.ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        info['git_commit'] = commit
+    except (OSError, subprocess.CalledProcessError):
+        info['git_commit'] = None
+    return info
+
+def compare_results(current, baseline, threshold, min_ms=1.0):
+    """
+    مقایسه نتایج فعلی با یک فایل مبنا؛ مواردی که میانه زمانشان بیش از threshold (نسبی) کندتر شده، برگردانده می‌شوند.
+    سنجش‌های کوتاه‌تر از min_ms میلی‌ثانیه به دلیل نوسان زیاد پسرفت محسوب نمی‌شوند.
+    """
+    def key(record):
+        return record['name'], tuple(record['size']), record['n_colors']
+
+    baseline_by_key = {key(record): record for record in baseline.get('results', [])}
+    regressions = []
+    print("\n📊 مقایسه با نتایج مبنا:")
+    for record in current:
+        base = baseline_by_key.get(key(record))
+        if not base or not base.get('median_s'):
+            continue
+        ratio = record['median_s'] / base['median_s']
+        too_short = max(record['median_s'], base['median_s']) * 1000 < min_ms
+        if too_short:
+            ratio = min(ratio, 1 + threshold)
+        marker = "🔴" if ratio > 1 + threshold else ("🟢" if ratio < 1 - threshold else "⚪")
+        palette_text = f" | {record['n_colors']} رنگ" if record['n_colors'] else ""
+        print(f"   {marker} {record['name']:<34} {record['size'][0]}x{record['size'][1]}{palette_text}: "
+              f"{base['median_s'] * 1000:9.1f} → {record['median_s'] * 1000:9.1f} ms ({ratio:.2f}x)")
+        if ratio > 1 + threshold:
+            regressions.append({'name': record['name'], 'size': record['size'], 'n_colors': record['n_colors'],
+                                'baseline_median_s': base['median_s'], 'median_s': record['median_s'],
+                                'ratio': round(ratio, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='⏱️ سنجش کارایی پردازشگرها و پایپلاین طرح فرش با ورودی‌های مصنوعی (CPU، آفلاین)',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--sizes', type=str, default=DEFAULT_SIZES, help='ابعاد نقشه گره به صورت WxH جداشده با کاما.')
+    parser.add_argument('--palettes', type=str, default=DEFAULT_PALETTES, help='اندازه‌های پالت جداشده با کاما.')
+    parser.add_argument('--repeat', type=int, default=3, help='تعداد تکرار هر سنجش (پس از یک اجرای گرم‌کردن).')
+    parser.add_argument('--quick', action='store_true', help='ماتریس کوچک و یک تکرار برای بررسی سریع.')
+    parser.add_argument('--no-e2e', action='store_false', dest='include_e2e', help='عدم سنجش process_image کامل.')
+    parser.add_argument('--output', '-o', type=str, help='مسیر فایل JSON نتایج (پیش‌فرض: output/benchmarks/bench_<زمان>.json).')
+    parser.add_argument('--compare', type=str, help='فایل JSON نتایج مبنا برای تشخیص پسرفت کارایی.')
+    parser.add_argument('--threshold', type=float, default=0.15, help='آستانه نسبی پسرفت (پیش‌فرض ۰.۱۵ یعنی ۱۵٪ کندتر).')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='سنجش‌های کوتاه‌تر از این مقدار (میلی‌ثانیه) در تشخیص پسرفت نادیده گرفته می‌شوند.')
+    parser.add_argument('--sd-base', type=str, help='مدل پایه برای سنجش ثانیه بر گام تولید طرح روی CPU (همراه با --sd-controlnet).')
+    parser.add_argument('--sd-controlnet', type=str, help='مدل ControlNet برای سنجش تولید طرح روی CPU.')
+    parser.add_argument('--sd-size', type=str, default='512x512', help='ابعاد تصویر سنجش تولید طرح (WxH).')
+    parser.add_argument('--sd-steps', type=int, default=10, help='تعداد گام‌های نمونه‌برداری در سنجش تولید طرح.')
+    parser.add_argument('--sd-threads', type=int, default=0, help='تعداد نخ‌های torch در سنجش تولید طرح (صفر = پیش‌فرض).')
+    parser.add_argument('--sd-compile', action='store_true', help='سنجش پروفایل torch.compile (اولین اجرا بسیار کند است).')
+    parser.add_argument('--generation-only', action='store_true', help='فقط سنجش تولید طرح (بدون ماتریس پردازشگرها).')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes = QUICK_SIZES if args.sizes == DEFAULT_SIZES else args.sizes
+        args.palettes = QUICK_PALETTES if args.palettes == DEFAULT_PALETTES else args.palettes
+        args.repeat = 1
+
+    sizes = parse_sizes(args.sizes)
+    palettes = [int(value) for value in args.palettes.split(',')]
+
+    print("=" * 60)
+    print("⏱️ سنجش کارایی سیستم طرح فرش")
+    print("=" * 60)
+    suite = BenchmarkSuite(sizes, palettes, repeat=args.repeat, include_e2e=args.include_e2e)
+    started = time.perf_counter()
+    results = suite.results if args.generation_only else suite.run()
+    if args.sd_base and args.sd_controlnet:
+        results = suite.run_generation(args.sd_base, args.sd_controlnet, size=parse_sizes(args.sd_size)[0],
+                                       steps=args.sd_steps, threads=args.sd_threads, compile_unet=args.sd_compile)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'matrix': {'sizes': [list(size) for size in sizes], 'palettes': palettes, 'repeat': args.repeat},
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'results': results
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold, min_ms=args.min_ms)
+        report['comparison'] = {'baseline': args.compare, 'threshold': args.threshold, 'regressions': regressions}
+
+    output_path = args.output or os.path.join(
+        paths.OUTPUT_DIR, 'benchmarks', datetime.now().strftime("bench_%Y%m%d_%H%M%S.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"\n📄 نتایج سنجش در فایل زیر ذخیره شد:\n{output_path}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} مورد پسرفت کارایی بیش از {args.threshold:.0%} یافت شد.")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
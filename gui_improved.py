@@ -6,7 +6,6 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext, colorchooser, sim
 from PIL import Image, ImageTk
 import threading
 import numpy as np
-import shutil
 import json
 import yaml
 
@@ -18,6 +17,7 @@ except ImportError:
 
 from src.pipeline.carpet_pipeline import CarpetDesignPipeline, ProcessingCancelledError
 from src.processors.color_quantizer import ColorQuantizer
+from src.processors.vectorizer import vtracer_available
 from src.utils.palette_manager import PaletteManager
 from src.utils.device_profile_manager import DeviceProfileManager
 
@@ -69,6 +69,7 @@ class CarpetDesignGUI:
         
         self.processing_thread = None
         self.cancel_event = threading.Event()
+        self.resume_output_path = None
         
         self.config = self.load_app_config()
         self.model_profiles = self.config.get('model_profiles', [])
@@ -172,7 +173,7 @@ class CarpetDesignGUI:
         ttk.Checkbutton(process_frame, text="کاهش رنگ", variable=self.quantize_var).grid(row=2, column=0, sticky=tk.W, pady=2, padx=5)
         cb_vector = ttk.Checkbutton(process_frame, text="وکتوری‌سازی", variable=self.vectorize_var)
         cb_vector.grid(row=2, column=1, sticky=tk.W, pady=2, padx=5)
-        Tooltip(cb_vector, "برای این گزینه باید ابزار vtracer نصب و در PATH سیستم باشد.")
+        Tooltip(cb_vector, "برای این گزینه باید ماژول پایتونی vtracer یا ابزار خط فرمان آن (در PATH سیستم) نصب باشد.")
         
         full_design_cb = ttk.Checkbutton(process_frame, text="ورودی یک طرح کامل است (رد کردن چیدمان)", variable=self.is_full_design_var)
         full_design_cb.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=5, padx=5)
@@ -203,6 +204,10 @@ class CarpetDesignGUI:
         
         self.cancel_button = ttk.Button(main_control_frame, text="🛑 لغو پردازش", command=self.cancel_processing, width=20, state=tk.DISABLED)
         self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+        self.resume_button = ttk.Button(main_control_frame, text="♻️ ادامه اجرای ناتمام", command=lambda: self.start_processing(resume=True), width=20, state=tk.DISABLED)
+        self.resume_button.pack(side=tk.LEFT, padx=5)
+        Tooltip(self.resume_button, "ادامه آخرین اجرای لغوشده یا ناموفق از همان پوشه خروجی.\nمراحلی که با تنظیمات یکسان کامل شده‌اند دوباره اجرا نمی‌شوند.")
         
         sub_control_frame = ttk.Frame(button_frame)
         sub_control_frame.pack(side=tk.RIGHT)
@@ -375,6 +380,9 @@ class CarpetDesignGUI:
         self.extract_button.pack(side=tk.LEFT, padx=5)
         
         ttk.Button(buttons_frame, text="📄 استخراج از فایل نمونه", command=self.extract_palette_from_sample_file).pack(side=tk.LEFT, padx=5)
+        self.recolor_button = ttk.Button(buttons_frame, text="🔁 اعمال روی نتیجه قبلی", command=self.recolor_last_result, state=tk.DISABLED)
+        self.recolor_button.pack(side=tk.LEFT, padx=5)
+        Tooltip(self.recolor_button, "جایگزینی رنگ‌های آخرین نتیجه با پالت دستی فعلی (هم‌اندازه پالت آن) بدون پردازش دوباره.")
 
         preset_frame = ttk.LabelFrame(parent, text="📚 پالت‌های آماده", padding="10")
         preset_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -581,12 +589,13 @@ class CarpetDesignGUI:
             self.update_status("در حال استخراج پالت از فایل نمونه...")
 
             quantizer = ColorQuantizer(n_colors=n_colors)
-            palette = quantizer.extract_palette(sample_image)
+            palette, coverage = quantizer.extract_palette(sample_image, return_coverage=True)
             
             self.custom_palette = [tuple(color) for color in palette]
             self.palette_method_var.set("custom")
             self.update_colors_display()
             self.log(f"✅ {len(self.custom_palette)} رنگ با موفقیت از فایل نمونه استخراج شد.")
+            self.log_palette_coverage(palette, coverage)
             self.update_status("پالت رنگی از فایل نمونه استخراج شد.")
 
         except Exception as e:
@@ -695,17 +704,40 @@ class CarpetDesignGUI:
             self.log(f"🔄 در حال استخراج {n_colors} رنگ از تصویر ورودی...")
             self.update_status("در حال استخراج پالت رنگی...")
             quantizer = ColorQuantizer(n_colors=n_colors)
-            palette = quantizer.extract_palette(self.input_image)
+            palette, coverage = quantizer.extract_palette(self.input_image, return_coverage=True)
             
             self.custom_palette = [tuple(color) for color in palette]
             self.palette_method_var.set("custom")
             self.update_colors_display()
             self.log(f"✅ {len(self.custom_palette)} رنگ با موفقیت استخراج و در پالت دستی قرار گرفت.")
+            self.log_palette_coverage(palette, coverage)
             self.update_status("پالت رنگی با موفقیت استخراج شد.")
         except Exception as e:
             messagebox.showerror("خطا", f"خطا در هنگام استخراج پالت رنگی:\n{e}")
             self.log(f"❌ خطا در استخراج پالت: {e}")
 
+    def log_palette_coverage(self, palette, coverage):
+        for i, (color, percent) in enumerate(zip(palette, coverage)):
+            self.log(f"   {i+1}. #{int(color[0]):02x}{int(color[1]):02x}{int(color[2]):02x} - {percent:.1f}% از تصویر")
+
+    def recolor_last_result(self):
+        if not self.results or 'final_png' not in self.results:
+            messagebox.showwarning("هشدار", "ابتدا یک پردازش کامل با کاهش رنگ انجام دهید.")
+            return
+        if not self.custom_palette:
+            messagebox.showwarning("هشدار", "پالت دستی خالی است.")
+            return
+
+        try:
+            palette = [tuple(map(int, color)) for color in self.custom_palette]
+            recolor_results = self.pipeline.recolor(self.results['output_path'], palette, log_callback=self.log)
+            self.results.update(recolor_results)
+            self.show_result(recolor_results['final_png'])
+            self.update_status("رنگ‌های طرح جایگزین شد.")
+        except (FileNotFoundError, ValueError) as e:
+            messagebox.showerror("خطا", f"امکان جایگزینی رنگ‌ها وجود ندارد:\n{e}")
+            self.log(f"❌ خطا در جایگزینی رنگ‌ها: {e}")
+
     def log(self, message):
         self.log_text.config(state=tk.NORMAL)
         self.log_text.insert(tk.END, message + "\n")
@@ -791,7 +823,7 @@ class CarpetDesignGUI:
         else:
             messagebox.showinfo("اطلاعات", "پوشه خروجی هنوز ایجاد نشده است. پس از اولین پردازش، این پوشه ساخته خواهد شد.")
     
-    def start_processing(self):
+    def start_processing(self, resume=False):
         if not self.input_image:
             messagebox.showerror("خطا", "لطفاً ابتدا یک تصویر ورودی انتخاب کنید.")
             return
@@ -801,19 +833,22 @@ class CarpetDesignGUI:
                 return
             self.palette_method_var.set("auto")
         
-        if self.vectorize_var.get() and not shutil.which('vtracer'):
+        if self.vectorize_var.get() and not vtracer_available():
             messagebox.showerror("خطا: وابستگی خارجی",
                                  "قابلیت وکتورسازی انتخاب شده است، اما ابزار 'vtracer' یافت نشد.\n"
-                                 "لطفاً آن را نصب کرده و در PATH سیستم قرار دهید، یا تیک وکتورسازی را بردارید.")
+                                 "لطفاً آن را با `pip install vtracer` نصب کنید یا در PATH سیستم قرار دهید، یا تیک وکتورسازی را بردارید.")
             return
 
+        resume_dir = self.resume_output_path if resume else None
+
         self.cancel_event.clear()
         self.start_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.NORMAL)
         self.progress_bar.config(value=0)
         self.update_status("پردازش در حال آماده‌سازی...")
         
-        self.processing_thread = threading.Thread(target=self.process_thread, daemon=True)
+        self.processing_thread = threading.Thread(target=self.process_thread, args=(resume_dir,), daemon=True)
         self.processing_thread.start()
 
     def cancel_processing(self):
@@ -823,7 +858,7 @@ class CarpetDesignGUI:
             self.cancel_event.set()
             self.cancel_button.config(state=tk.DISABLED)
 
-    def process_thread(self):
+    def process_thread(self, resume_dir=None):
         try:
             self.log("\n" + "="*80)
             self.log("🚀 پردازش آغاز شد...")
@@ -843,8 +878,10 @@ class CarpetDesignGUI:
                 run_config=self.get_run_config(),
                 cancel_event=self.cancel_event,
                 log_callback=self.log,
-                progress_callback=self.update_progress_bar
+                progress_callback=self.update_progress_bar,
+                resume_dir=resume_dir
             )
+            self.resume_output_path = None
             
             if 'final_png' in self.results:
                 self.root.after(0, lambda: self.show_result(self.results['final_png']))
@@ -867,6 +904,7 @@ class CarpetDesignGUI:
             ))
 
         except ProcessingCancelledError:
+            self.resume_output_path = self.pipeline.last_output_path
             self.log("\n" + "="*80)
             self.log("🛑 پردازش توسط کاربر لغو شد.")
             self.log("="*80)
@@ -874,6 +912,8 @@ class CarpetDesignGUI:
         
         except Exception as e:
             import traceback
+            if self.pipeline is not None:
+                self.resume_output_path = self.pipeline.last_output_path
             error_msg = f"یک خطای پیش‌بینی نشده رخ داد:\n{e}"
             self.log(f"\n❌ خطای بحرانی: {e}")
             self.log(traceback.format_exc())
@@ -909,7 +949,8 @@ class CarpetDesignGUI:
 
     def show_result(self, image_path):
         try:
-            image = Image.open(image_path)
+            # نتیجه نهایی پالت‌دار است؛ برای پیش‌نمایش نرم به RGB تبدیل می‌شود
+            image = Image.open(image_path).convert('RGB')
             thumbnail_method = Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.LANCZOS
             image.thumbnail((self.preview_label.winfo_width(), self.preview_label.winfo_height()), thumbnail_method)
             photo = ImageTk.PhotoImage(image)
@@ -929,6 +970,8 @@ class CarpetDesignGUI:
         self.progress_bar['value'] = 0
         self.start_button.config(state=tk.NORMAL)
         self.cancel_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.NORMAL if self.resume_output_path else tk.DISABLED)
+        self.recolor_button.config(state=tk.NORMAL if self.results and 'final_png' in self.results else tk.DISABLED)
         self.processing_thread = None
         self.update_status("آماده به کار...")
 
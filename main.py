@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import json
 import argparse
 from PIL import Image
 import yaml
@@ -13,6 +14,9 @@ except ImportError:
     from src.utils import paths
 
 from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+from src.pipeline.batch_runner import BatchRunner, collect_input_images, DEFAULT_IMAGE_PATTERNS
+from src.processors.dithering import DITHER_METHODS
+from src.processors.vectorizer import VECTORIZE_MODES
 
 def main():
     """
@@ -24,9 +28,19 @@ def main():
     )
     
     # آرگومان‌های اصلی
-    parser.add_argument('--input', '-i', type=str, required=True, help='مسیر تصویر ورودی.')
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('--input', '-i', type=str, help='مسیر تصویر ورودی.')
+    input_group.add_argument('--input-dir', type=str, help='پوشه تصاویر ورودی برای پردازش دسته‌ای (مدل‌ها بین تصاویر گرم می‌مانند).')
     parser.add_argument('--output', '-o', type=str, default=paths.OUTPUT_DIR, help='مسیر پوشه خروجی.')
     parser.add_argument('--config', '-c', type=str, default=paths.DEFAULT_CONFIG_PATH, help='مسیر فایل تنظیمات YAML.')
+    parser.add_argument('--resume', type=str, help='ادامه یک اجرای ناتمام از پوشه خروجی آن (مراحل کامل‌شده دوباره اجرا نمی‌شوند).')
+
+    # تنظیمات پردازش دسته‌ای
+    batch_group = parser.add_argument_group('📦 پردازش دسته‌ای')
+    batch_group.add_argument('--glob', type=str, nargs='+', default=list(DEFAULT_IMAGE_PATTERNS), help='الگو(های) glob برای انتخاب تصاویر در --input-dir.')
+    batch_group.add_argument('--recursive', action='store_true', help='جستجوی تصاویر در زیرپوشه‌ها.')
+    batch_group.add_argument('--manifest', type=str, help='مسیر فایل manifest خروجی (پیش‌فرض: داخل پوشه دسته).')
+    batch_group.add_argument('--cpu-workers', type=int, default=0, help='تعداد پروسه‌های موازی برای مراحل CPU (کاهش رنگ، تقارن، ذخیره). صفر = اجرای ترتیبی.')
     
     # تنظیمات مشخصات فرش
     carpet_group = parser.add_argument_group('📏 مشخصات فرش')
@@ -43,15 +57,23 @@ def main():
     process_group.add_argument('--no-symmetry', action='store_false', dest='apply_symmetry', help='غیرفعال کردن اعمال تقارن.')
     process_group.add_argument('--no-quantize', action='store_false', dest='quantize_colors', help='غیرفعال کردن کاهش رنگ.')
     process_group.add_argument('--vectorize', action='store_true', default=False, help='فعال کردن وکتوری‌سازی (نیاز به vtracer دارد).')
+    process_group.add_argument('--vector-mode', type=str, choices=VECTORIZE_MODES, help='روش وکتورسازی: کل تصویر (color) یا ردیابی موازی هر رنگ (per_color).')
     
     # پارامترهای پیشرفته
     advanced_group = parser.add_argument_group('🔧 پارامترهای پیشرفته')
     advanced_group.add_argument('--n-colors', type=int, help='تعداد رنگ‌ها در حالت کوانتیزاسیون خودکار.')
+    advanced_group.add_argument('--dither', type=str, choices=DITHER_METHODS, help='روش دیترینگ در کاهش رنگ.')
+    advanced_group.add_argument('--speckle-min-knots', type=int, help='فعال کردن پاک‌سازی گره‌های منفرد: ادغام جزیره‌های رنگی کوچک‌تر از این تعداد گره.')
+    advanced_group.add_argument('--weaving-chart', type=str, choices=['binary', 'text', 'both'], help='ذخیره نقشه رج‌به‌رج (RLE) نتیجه نهایی در این قالب.')
+    advanced_group.add_argument('--chart-pdf', action='store_true', help='ذخیره جدول گره چاپی (PDF چندصفحه‌ای با نماد رنگ‌ها).')
     advanced_group.add_argument('--edge-method', type=str, choices=['HED', 'Canny', 'PiDiNet'], help='متد تشخیص لبه.')
-    advanced_group.add_argument('--controlnet-model', type=str, help='نام یا مسیر مدل ControlNet برای استفاده.')
+    advanced_group.add_argument('--base-model', type=str, help='نام یا مسیر مدل پایه Stable Diffusion.')
+    advanced_group.add_argument('--controlnet-model', type=str, nargs='+', help='نام یا مسیر مدل ControlNet برای استفاده؛ چند مدل با هم به صورت MultiControlNet اجرا می‌شوند.')
     advanced_group.add_argument('--controlnet-scale', type=float, help='میزان تاثیرپذیری از تصویر کنترل (لبه‌ها).')
     advanced_group.add_argument('--steps', type=int, help='تعداد مراحل نمونه‌برداری در Stable Diffusion.')
     advanced_group.add_argument('--seed', type=int, help='عدد seed برای تکرارپذیری نتایج.')
+    advanced_group.add_argument('--no-cache', action='store_false', dest='use_cache', help='غیرفعال کردن کش دیسکی خروجی مراحل.')
+    advanced_group.add_argument('--metrics-jsonl', type=str, help='افزودن معیارهای زمان و حافظه هر مرحله به صورت JSON-lines به این فایل.')
 
     args = parser.parse_args()
     
@@ -63,8 +85,19 @@ def main():
         # ۲. اعمال تنظیمات از آرگومان‌های خط فرمان به کانفیگ پایپلاین
         if args.n_colors:
             pipeline.config['processing']['color_quantization']['n_colors'] = args.n_colors
+        if args.dither:
+            pipeline.config['processing']['color_quantization']['dither'] = args.dither
+        if args.weaving_chart:
+            pipeline.config['output']['weaving_chart'] = {'enable': True, 'format': args.weaving_chart}
+        if args.vector_mode:
+            pipeline.config['processing'].setdefault('vectorization', {})['mode'] = args.vector_mode
+        if args.chart_pdf:
+            pipeline.config['output'].setdefault('chart_pdf', {})['enable'] = True
+        if args.speckle_min_knots:
+            speckle_config = pipeline.config['processing'].setdefault('speckle_cleanup', {})
+            speckle_config.update(enable=True, min_knots=args.speckle_min_knots)
         if args.edge_method:
-            pipeline.config['models']['edge_detection']['method'] = args.edge_method
+            pipeline.config['processing']['edge_detection']['method'] = args.edge_method
         if args.controlnet_scale:
             pipeline.config['generation']['controlnet_scale'] = args.controlnet_scale
         if args.steps:
@@ -80,22 +113,48 @@ def main():
             'tar': args.tar or 12
         }
         
-        # ۴. بارگذاری تصویر ورودی
+        # تبدیل آرگومان‌ها به دیکشنری برای run_config
+        run_config_dict = vars(args)
+        if args.base_model:
+            run_config_dict['base_model_path'] = args.base_model
+        if args.controlnet_model:
+            run_config_dict['controlnet_path'] = args.controlnet_model[0] if len(args.controlnet_model) == 1 else args.controlnet_model
+
+        metrics_callback = None
+        if args.metrics_jsonl:
+            def metrics_callback(event):
+                with open(args.metrics_jsonl, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+        # ۴. حالت دسته‌ای: یک پایپلاین برای تمام تصاویر
+        if args.input_dir:
+            if not os.path.isdir(args.input_dir):
+                raise FileNotFoundError(f"پوشه ورودی یافت نشد: {args.input_dir}")
+            image_paths = collect_input_images(args.input_dir, patterns=args.glob, recursive=args.recursive)
+            if not image_paths:
+                raise FileNotFoundError(f"هیچ تصویری با الگوهای {args.glob} در '{args.input_dir}' یافت نشد.")
+            print(f"\n🚀 شروع پردازش دسته‌ای {len(image_paths)} تصویر...")
+            runner = BatchRunner(pipeline, args.output, run_config_dict, manifest_path=args.manifest,
+                                 cpu_workers=args.cpu_workers, config_path=args.config,
+                                 metrics_callback=metrics_callback)
+            manifest = runner.run(image_paths)
+            sys.exit(0 if manifest['failed'] == 0 else 1)
+
+        # ۵. بارگذاری تصویر ورودی
         print(f"🖼️ در حال بارگذاری تصویر از: {args.input}")
         if not os.path.exists(args.input):
             raise FileNotFoundError(f"فایل ورودی یافت نشد: {args.input}")
         input_image = Image.open(args.input).convert('RGB')
         
-        # ۵. اجرای پردازش
+        # ۶. اجرای پردازش
         print("\n🚀 شروع پردازش تصویر...")
         
-        # تبدیل آرگومان‌ها به دیکشنری برای run_config
-        run_config_dict = vars(args)
-        
         results = pipeline.process_image(
             input_image=input_image,
             output_dir=args.output,
-            run_config=run_config_dict 
+            run_config=run_config_dict,
+            resume_dir=args.resume,
+            metrics_callback=metrics_callback
         )
         
         print("\n✨ پردازش با موفقیت کامل شد!")
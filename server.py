@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import argparse
+
+# اضافه کردن مسیر پروژه به sys.path از طریق ماژول متمرکز
+try:
+    from src.utils import paths
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from src.utils import paths
+
+from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+from src.pipeline.job_service import JobService, create_server
+from src.models.dummy_generator import DummyGenerator
+
+def main():
+    """
+    اجرای سرویس محلی صف کار: یک پایپلاین گرم برای چند کاربر (رابط گرافیکی یا اسکریپت).
+    """
+    parser = argparse.ArgumentParser(
+        description='🧶 سرویس صف کار طرح فرش (HTTP محلی)',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='آدرس شنود سرویس (پیش‌فرض فقط ماشین محلی).')
+    parser.add_argument('--port', type=int, default=8765, help='پورت سرویس.')
+    parser.add_argument('--output', '-o', type=str, default=paths.OUTPUT_DIR, help='مسیر پوشه خروجی کارها.')
+    parser.add_argument('--config', '-c', type=str, default=paths.DEFAULT_CONFIG_PATH, help='مسیر فایل تنظیمات YAML.')
+    parser.add_argument('--dummy-generator', action='store_true',
+                        help='استفاده از ژنراتور ساختگی فقط-CPU به جای Stable Diffusion (برای آزمون سرویس بدون مدل).')
+    args = parser.parse_args()
+
+    print("⏳ در حال ساخت پایپلاین پردازش...")
+    pipeline = CarpetDesignPipeline(config_path=args.config,
+                                    generator_class=DummyGenerator if args.dummy_generator else None)
+    service = JobService(pipeline, args.output)
+    server = create_server(service, host=args.host, port=args.port)
+
+    print(f"🌐 سرویس صف کار روی http://{args.host}:{args.port} آماده است (Ctrl+C برای توقف).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 توقف سرویس...")
+    finally:
+        server.server_close()
+        service.stop()
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import time
 import torch
 import numpy as np
 from PIL import Image
@@ -6,30 +7,102 @@ from diffusers import (
     ControlNetModel,
     UniPCMultistepScheduler
 )
+try:
+    from diffusers import MultiControlNetModel
+except ImportError:  # نسخه‌های قدیمی diffusers
+    from diffusers.pipelines.controlnet import MultiControlNetModel
 from diffusers.utils import load_image
 
+from ..utils.metrics import available_memory_bytes
+
+# تنظیمات پیش‌فرض پروفایل اجرای CPU (کلید models.cpu_inference در فایل تنظیمات)
+CPU_INFERENCE_DEFAULTS = {
+    'dtype': 'auto',
+    'threads': 0,
+    'channels_last': True,
+    'compile': False,
+    'attention_slicing': False,
+    'vae_slicing': True,
+    'quantize_int8': False,
+}
+
+_DTYPES = {'float32': torch.float32, 'bfloat16': torch.bfloat16, 'float16': torch.float16}
+
+def cpu_bf16_native():
+    """آیا CPU دستورهای bfloat16 سخت‌افزاری (AVX512-BF16 یا AMX) دارد؟ بدون آن‌ها bfloat16 از float32 کندتر است."""
+    try:
+        return torch.cpu._is_avx512_bf16_supported() or torch.cpu._is_amx_tile_supported()
+    except AttributeError:  # نسخه‌های قدیمی torch
+        return False
+
+def resolve_dtype(device, dtype="auto", quantize_int8=False):
+    """
+    نوع داده مدل‌ها برای دستگاه: روی GPU پیش‌فرض float16 است؛ روی CPU که float16 در آن کند یا بدون پشتیبانی است،
+    auto در صورت پشتیبانی سخت‌افزاری bfloat16 و در غیر این صورت float32 انتخاب می‌کند.
+    کوانتیزاسیون پویای int8 فقط روی مدل‌های float32 ممکن است.
+    """
+    if isinstance(dtype, torch.dtype):
+        return dtype
+    on_cpu = torch.device(device).type == 'cpu'
+    if dtype in (None, 'auto'):
+        if not on_cpu:
+            return torch.float16
+        return torch.bfloat16 if cpu_bf16_native() and not quantize_int8 else torch.float32
+    if dtype not in _DTYPES:
+        raise ValueError(f"نوع داده نامعتبر: {dtype} (مقادیر مجاز: auto، {'، '.join(_DTYPES)})")
+    if on_cpu and dtype == 'float16':
+        print("⚠️ float16 روی CPU پشتیبانی کاملی ندارد؛ از float32 استفاده می‌شود.")
+        return torch.float32
+    return _DTYPES[dtype]
+
 class ControlNetGenerator:
-    """کلاس تولید طرح فرش با ControlNet"""
+    """
+    کلاس تولید طرح فرش با ControlNet
+
+    مدل پایه (UNet، VAE، text encoder) فقط یک بار بارگذاری می‌شود و ControlNet در هر فراخوانی generate
+    قابل تعویض است؛ با فهرستی از ControlNetها، همه با هم به صورت MultiControlNet اجرا می‌شوند.
+    ControlNetهای داده‌شده به صورت مسیر با controlnet_loader بارگذاری می‌شوند (پیش‌فرض: بارگذاری مستقیم
+    با کش داخلی) تا پایپلاین بتواند آن‌ها را در رجیستری مدل‌ها نگه دارد. با prompt_cache
+    (PromptEmbeddingCache) embedding پرامپت‌های تکراری دوباره با text encoder محاسبه نمی‌شوند.
+
+    روی CPU پروفایل cpu_options اعمال می‌شود (کلیدهای CPU_INFERENCE_DEFAULTS): تعداد نخ‌ها، حافظه channels-last،
+    torch.compile اختیاری، attention/VAE slicing و کوانتیزاسیون پویای int8 لایه‌های Linear در UNet و text encoder.
+    """
+    # حافظه تقریبی فعال‌سازی‌های UNet و ControlNet برای یک نمونه ۵۱۲×۵۱۲ با guidance در float16 (مگابایت)
+    SAMPLE_MEMORY_MB_512 = 768
+    # بیشینه نمونه‌های هر ریزدسته (روی CPU دسته‌های بزرگ‌تر سرعت بیشتری نمی‌دهند)
+    MAX_MICRO_BATCH = {'cuda': 8, 'cpu': 4}
     
-    def __init__(self, base_model, controlnet_model, device="cuda", dtype=torch.float16):
+    def __init__(self, base_model, controlnet_model, device="cuda", dtype=None, controlnet_loader=None,
+                 cpu_options=None, prompt_cache=None):
+        self.base_model = base_model
+        self.prompt_cache = prompt_cache
+        self._text_encoder_int8 = False
         self.device = device
-        self.dtype = dtype
+        self.on_cpu = torch.device(device).type == 'cpu'
+        self.cpu_options = {**CPU_INFERENCE_DEFAULTS, **(cpu_options or {})}
+        self.dtype = resolve_dtype(device, self.cpu_options['dtype'] if dtype is None else dtype,
+                                   quantize_int8=self.on_cpu and self.cpu_options['quantize_int8'])
+        if self.on_cpu and self.cpu_options['threads']:
+            torch.set_num_threads(int(self.cpu_options['threads']))
+        self._loaded_controlnets = {}
+        self.controlnet_loader = controlnet_loader or self._load_cached_controlnet
+        self._cpu_offload = False
         
         print(f"🔄 در حال بارگذاری ControlNet...")
         print(f"   Base Model: {base_model}")
         print(f"   ControlNet: {controlnet_model}")
+        print(f"   Device: {device} ({str(self.dtype).replace('torch.', '')}، {torch.get_num_threads()} نخ CPU)"
+              if self.on_cpu else f"   Device: {device} ({str(self.dtype).replace('torch.', '')})")
         
         # بارگذاری ControlNet
-        self.controlnet = ControlNetModel.from_pretrained(
-            controlnet_model,
-            torch_dtype=dtype
-        )
+        self.controlnet, self._controlnet_key = self._resolve_controlnet(controlnet_model)
         
         # بارگذاری پایپلاین
         self.pipe = StableDiffusionControlNetPipeline.from_pretrained(
             base_model,
             controlnet=self.controlnet,
-            torch_dtype=dtype,
+            torch_dtype=self.dtype,
             safety_checker=None
         )
         
@@ -38,9 +111,18 @@ class ControlNetGenerator:
             self.pipe.scheduler.config
         )
         
-        # بهینه‌سازی‌های اختیاری با مدیریت خطا
+        if self.on_cpu:
+            self._optimize_for_cpu()
+        else:
+            self._optimize_for_gpu()
+        
+        print("✅ ControlNet بارگذاری شد")
+
+    def _optimize_for_gpu(self):
+        """بهینه‌سازی‌های اختیاری GPU با مدیریت خطا؛ با offload فعال، جابه‌جایی مدل‌ها بر عهده hookهای آن است."""
         try:
             self.pipe.enable_model_cpu_offload()
+            self._cpu_offload = True
             print("   - بهینه‌سازی Model CPU Offload فعال شد.")
         except Exception as e:
             print(f"   - ⚠️ امکان فعال‌سازی Model CPU Offload وجود ندارد: {e}")
@@ -53,9 +135,107 @@ class ControlNetGenerator:
         except Exception as e:
             print(f"   - ⚠️ امکان فعال‌سازی xFormers وجود ندارد: {e}")
 
-        self.pipe = self.pipe.to(device)
-        
-        print("✅ ControlNet بارگذاری شد")
+        if not self._cpu_offload:
+            self.pipe = self.pipe.to(self.device)
+
+    def _optimize_for_cpu(self):
+        """اعمال پروفایل اجرای CPU (offload و xformers روی CPU معنایی ندارند)."""
+        options = self.cpu_options
+        if options['quantize_int8']:
+            self._quantize_int8()
+        if options['attention_slicing']:
+            self.pipe.enable_attention_slicing()
+            print("   - Attention Slicing فعال شد.")
+        if options['vae_slicing'] and hasattr(self.pipe.vae, 'enable_slicing'):
+            self.pipe.vae.enable_slicing()
+            print("   - VAE Slicing فعال شد.")
+        if options['channels_last']:
+            for module in (self.pipe.unet, self.pipe.vae, self.controlnet):
+                module.to(memory_format=torch.channels_last)
+            print("   - حافظه channels-last فعال شد.")
+        if options['compile']:
+            try:
+                self.pipe.unet = torch.compile(self.pipe.unet)
+                print("   - UNet با torch.compile کامپایل شد (اولین اجرا کندتر است).")
+            except Exception as e:
+                print(f"   - ⚠️ امکان فعال‌سازی torch.compile وجود ندارد: {e}")
+
+    def _quantize_int8(self):
+        """کوانتیزاسیون پویای int8 لایه‌های Linear در UNet و text encoder (وزن‌ها int8، فعال‌سازی‌ها float32)."""
+        if self.dtype != torch.float32:
+            print(f"   - ⚠️ کوانتیزاسیون int8 فقط روی مدل float32 ممکن است (نوع فعلی: {self.dtype}).")
+            return
+        if not torch.backends.quantized.supported_engines or torch.backends.quantized.engine == 'none':
+            print("   - ⚠️ موتور کوانتیزاسیون torch روی این سیستم در دسترس نیست.")
+            return
+        try:
+            from torch.ao.quantization import quantize_dynamic
+            for name in ('unet', 'text_encoder'):
+                quantize_dynamic(getattr(self.pipe, name), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            self._text_encoder_int8 = True
+            print("   - کوانتیزاسیون پویای int8 روی UNet و text encoder اعمال شد.")
+        except Exception as e:
+            print(f"   - ⚠️ امکان کوانتیزاسیون int8 وجود ندارد: {e}")
+
+    @staticmethod
+    def load_controlnet(controlnet_model, dtype=torch.float16):
+        return ControlNetModel.from_pretrained(controlnet_model, torch_dtype=dtype)
+
+    def _load_cached_controlnet(self, path):
+        if path not in self._loaded_controlnets:
+            self._loaded_controlnets[path] = self.load_controlnet(path, self.dtype)
+        return self._loaded_controlnets[path]
+
+    def _resolve_controlnet(self, controlnet_model):
+        """
+        تبدیل مسیر، مدل یا فهرستی از آن‌ها به مدل قابل استفاده در پایپلاین.
+
+        Returns:
+            tuple: (ControlNetModel یا MultiControlNetModel، کلید شناسایی ترکیب ControlNetها)
+        """
+        specs = list(controlnet_model) if isinstance(controlnet_model, (list, tuple)) else [controlnet_model]
+        if not specs:
+            raise ValueError("حداقل یک ControlNet لازم است.")
+        models = [self.controlnet_loader(spec) if isinstance(spec, str) else spec for spec in specs]
+        key = tuple(spec if isinstance(spec, str) else id(spec) for spec in specs)
+        return (models[0] if len(models) == 1 else MultiControlNetModel(models)), key
+
+    def set_controlnet(self, controlnet_model):
+        """
+        تعویض ControlNet روی همان مدل پایه بارگذاری‌شده (یک مسیر/مدل یا فهرستی برای MultiControlNet).
+        فقط وزن‌های ControlNet جابه‌جا می‌شوند؛ در صورت یکسان بودن ترکیب، کاری انجام نمی‌شود.
+        """
+        specs = list(controlnet_model) if isinstance(controlnet_model, (list, tuple)) else [controlnet_model]
+        if tuple(spec if isinstance(spec, str) else id(spec) for spec in specs) == self._controlnet_key:
+            return
+        start = time.perf_counter()
+        self.controlnet, self._controlnet_key = self._resolve_controlnet(controlnet_model)
+        self.pipe.register_modules(controlnet=self.controlnet)
+        if self._cpu_offload:
+            # زنجیره offload شامل ControlNet جدید می‌شود
+            self.pipe.enable_model_cpu_offload()
+        else:
+            self.controlnet.to(self.device)
+            if self.on_cpu and self.cpu_options['channels_last']:
+                self.controlnet.to(memory_format=torch.channels_last)
+        print(f"🔁 ControlNet تعویض شد ({', '.join(map(str, self._controlnet_key))}) "
+              f"در {time.perf_counter() - start:.2f} ثانیه")
+
+    def base_memory_mb(self):
+        """حجم اجزای مدل پایه (بدون ControlNet) به مگابایت."""
+        from .model_registry import module_size_mb
+        return module_size_mb({name: module for name, module in self.pipe.components.items() if name != 'controlnet'})
+
+    def unload(self):
+        """رها کردن ارجاع‌ها به مدل‌ها تا حافظه آن‌ها (پس از جمع‌آوری زباله) آزاد شود."""
+        if self.pipe is not None:
+            try:
+                self.pipe.remove_all_hooks()
+            except Exception:
+                pass
+        self.pipe = None
+        self.controlnet = None
+        self._loaded_controlnets.clear()
     
     def generate(
         self,
@@ -68,7 +248,8 @@ class ControlNetGenerator:
         seed=None,
         num_images=1,
         width=None,
-        height=None
+        height=None,
+        controlnet=None
     ):
         """
         تولید طرح فرش
@@ -84,12 +265,16 @@ class ControlNetGenerator:
             num_images: تعداد تصاویر تولیدی
             width: عرض خروجی
             height: ارتفاع خروجی
+            controlnet: مسیر/مدل ControlNet یا فهرستی از آن‌ها برای تعویض پیش از تولید
+                (برای چند ControlNet، control_image و controlnet_conditioning_scale می‌توانند فهرست باشند)
             
         Returns:
             list: لیست تصاویر تولید شده
         """
-        if isinstance(control_image, np.ndarray):
-            control_image = Image.fromarray(control_image)
+        if controlnet is not None:
+            self.set_controlnet(controlnet)
+        control_images = self._prepare_control_images(control_image)
+        control_image = control_images[0] if len(control_images) == 1 else control_images
         
         # تنظیم seed
         if seed is not None and seed != -1:
@@ -97,15 +282,7 @@ class ControlNetGenerator:
         else:
             generator = None
         
-        # تنظیم ابعاد
-        if width is None:
-            width = control_image.width
-        if height is None:
-            height = control_image.height
-        
-        # گرد کردن به مضرب 8
-        width = (width // 8) * 8
-        height = (height // 8) * 8
+        width, height = self._output_size(control_images[0], width, height)
         
         print(f"🎨 تولید طرح فرش...")
         print(f"   ابعاد: {width}x{height}")
@@ -113,10 +290,15 @@ class ControlNetGenerator:
         print(f"   Guidance Scale: {guidance_scale}")
         print(f"   ControlNet Scale: {controlnet_conditioning_scale}")
         
+        prompts = list(prompt) if isinstance(prompt, (list, tuple)) else [prompt]
+        negative_prompts = list(negative_prompt) if isinstance(negative_prompt, (list, tuple)) \
+            else [negative_prompt or ""] * len(prompts)
+        prompt_embeds, negative_embeds = self.encode_prompts(prompts, negative_prompts if guidance_scale > 1 else None)
+        
         # تولید
         output = self.pipe(
-            prompt=prompt,
-            negative_prompt=negative_prompt,
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_embeds,
             image=control_image,
             num_inference_steps=num_inference_steps,
             guidance_scale=guidance_scale,
@@ -131,39 +313,171 @@ class ControlNetGenerator:
         
         return output.images
     
+    @property
+    def text_encoder_variant(self):
+        """نوع text encoder برای کلید کش embedding (نوع داده و کوانتیزاسیون int8)."""
+        variant = str(self.dtype).replace('torch.', '')
+        return f"{variant}-int8" if self._text_encoder_int8 else variant
+
+    def encode_prompts(self, prompts, negative_prompts=None):
+        """
+        embedding پرامپت‌ها و پرامپت‌های منفی در یک گذر text encoder (با prompt_cache، فقط متن‌های جدید).
+
+        Returns:
+            tuple: (prompt_embeds، negative_prompt_embeds یا None) روی دستگاه اجرا و با نوع داده مدل.
+        """
+        device = self.pipe._execution_device
+        prompts = list(prompts)
+        texts = prompts + list(negative_prompts or [])
+
+        def encode(batch):
+            with torch.no_grad():
+                return self.pipe.encode_prompt(batch, device, 1, False)[0]
+
+        if self.prompt_cache is not None:
+            embeds = self.prompt_cache.encode(self.base_model, texts, encode, variant=self.text_encoder_variant)
+        else:
+            unique = list(dict.fromkeys(texts))
+            encoded = encode(unique)
+            embeds = encoded[[unique.index(text) for text in texts]]
+        embeds = embeds.to(device=device, dtype=self.dtype)
+        n_prompts = len(prompts)
+        return embeds[:n_prompts], (embeds[n_prompts:] if negative_prompts is not None else None)
+
+    def _prepare_control_images(self, control_image):
+        """تصویر(های) کنترل به صورت PIL، یکی برای هر ControlNet."""
+        n_controlnets = len(self.controlnet.nets) if isinstance(self.controlnet, MultiControlNetModel) else 1
+        control_images = list(control_image) if isinstance(control_image, (list, tuple)) else [control_image] * n_controlnets
+        control_images = [Image.fromarray(image) if isinstance(image, np.ndarray) else image for image in control_images]
+        if len(control_images) != n_controlnets:
+            raise ValueError(f"تعداد تصاویر کنترل ({len(control_images)}) با تعداد ControlNetها ({n_controlnets}) برابر نیست.")
+        return control_images
+
+    @staticmethod
+    def _output_size(control_image, width, height):
+        """ابعاد خروجی (پیش‌فرض: ابعاد تصویر کنترل) گرد شده به مضرب 8."""
+        width = control_image.width if width is None else width
+        height = control_image.height if height is None else height
+        return (width // 8) * 8, (height // 8) * 8
+
+    def auto_micro_batch_size(self, width, height, guidance_scale=7.5, memory_fraction=0.5):
+        """
+        تعداد نمونه‌های هر گذر UNet بر اساس حافظه آزاد دستگاه (VRAM یا RAM) و تخمین حافظه هر نمونه
+        (متناسب با تعداد پیکسل‌ها، اندازه نوع داده و دو برابر شدن دسته با classifier-free guidance).
+        """
+        device_type = torch.device(self.device).type
+        if device_type == 'cuda' and torch.cuda.is_available():
+            free_bytes = torch.cuda.mem_get_info(torch.device(self.device))[0]
+        else:
+            free_bytes = available_memory_bytes()
+        if not free_bytes:
+            return 1
+        element_size = torch.finfo(self.dtype).bits / 8
+        sample_mb = (self.SAMPLE_MEMORY_MB_512 * (width * height) / (512 * 512) * (element_size / 2)
+                     * (1 if guidance_scale > 1 else 0.5))
+        fits = int(free_bytes / (1024 * 1024) * memory_fraction // max(sample_mb, 1))
+        return max(1, min(fits, self.MAX_MICRO_BATCH.get(device_type, 4)))
+
     def generate_batch(
         self,
         control_image,
         prompts_list,
         negative_prompt="",
-        **kwargs
+        num_inference_steps=30,
+        guidance_scale=7.5,
+        controlnet_conditioning_scale=0.8,
+        seed=None,
+        seeds=None,
+        num_images=1,
+        width=None,
+        height=None,
+        controlnet=None,
+        micro_batch_size=None
     ):
         """
         تولید دسته‌ای با پرامپت‌های مختلف
         
+        همه پرامپت‌ها یک‌جا با text encoder کدگذاری می‌شوند، تصویر کنترل یک بار پیش‌پردازش می‌شود و نمونه‌ها
+        در ریزدسته‌هایی به اندازه حافظه آزاد از حلقه denoising می‌گذرند. هر پرامپت نویز اولیه را از seed خود
+        می‌گیرد، بنابراین نتیجه هر پرامپت به اندازه ریزدسته بستگی ندارد و با generate(seed=...) قابل تکرار است.
+        
         Args:
-            control_image: تصویر کنترل
+            control_image: تصویر کنترل (یا فهرستی برای MultiControlNet)
             prompts_list: لیست پرامپت‌ها
-            negative_prompt: پرامپت منفی
-            **kwargs: پارامترهای اضافی
+            negative_prompt: پرامپت منفی (مشترک)
+            seed: seed پایه؛ پرامپت i ام seed+i می‌گیرد (None یا -1 = تصادفی)
+            seeds: فهرست seed هر پرامپت (اولویت بر seed)
+            num_images: تعداد تصاویر هر پرامپت
+            micro_batch_size: بیشینه تصاویر هر گذر UNet (None = خودکار بر اساس حافظه آزاد)
+            سایر پارامترها: مانند generate
             
         Returns:
-            list: لیست تمام تصاویر تولید شده
+            list: لیست تمام تصاویر تولید شده (به ترتیب پرامپت‌ها)
         """
+        if controlnet is not None:
+            self.set_controlnet(controlnet)
+        prompts_list = list(prompts_list)
+        n_prompts = len(prompts_list)
+        if not n_prompts:
+            return []
+        if seeds is None:
+            base_seed = seed if seed is not None and seed != -1 else int(torch.randint(0, 2 ** 31 - n_prompts, (1,)))
+            seeds = [base_seed + i for i in range(n_prompts)]
+        elif len(seeds) != n_prompts:
+            raise ValueError(f"تعداد seedها ({len(seeds)}) با تعداد پرامپت‌ها ({n_prompts}) برابر نیست.")
+
+        control_images = self._prepare_control_images(control_image)
+        width, height = self._output_size(control_images[0], width, height)
+        # پیش‌پردازش یک‌باره تصویر کنترل؛ پایپلاین تنسور آماده را فقط در اندازه دسته تکرار می‌کند
+        control_tensors = [self.pipe.control_image_processor.preprocess(image, height=height, width=width)
+                           .to(dtype=torch.float32) for image in control_images]
+        control = control_tensors[0] if len(control_tensors) == 1 else control_tensors
+
+        start = time.perf_counter()
+        do_guidance = guidance_scale > 1
+        prompt_embeds, negative_embeds = self.encode_prompts(
+            prompts_list, [negative_prompt or ""] * n_prompts if do_guidance else None
+        )
+
+        micro_batch = micro_batch_size or self.auto_micro_batch_size(width, height, guidance_scale)
+        prompts_per_batch = max(1, micro_batch // num_images)
+        print(f"🎨 تولید دسته‌ای {n_prompts} پرامپت × {num_images} تصویر ({width}x{height}، {num_inference_steps} گام)")
+        print(f"   ریزدسته: {prompts_per_batch * num_images} تصویر در هر گذر | seedها: {', '.join(map(str, seeds))}")
+
         all_images = []
-        
-        for i, prompt in enumerate(prompts_list):
-            print(f"\n📝 پرامپت {i+1}/{len(prompts_list)}: {prompt[:50]}...")
-            
-            images = self.generate(
-                control_image=control_image,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                **kwargs
-            )
-            
-            all_images.extend(images)
-        
+        index = 0
+        while index < n_prompts:
+            chunk = slice(index, min(index + prompts_per_batch, n_prompts))
+            # یک Generator برای هر پرامپت (مشترک بین تصاویر آن پرامپت)؛ در تلاش مجدد از نو ساخته می‌شود
+            generators = []
+            for prompt_seed in seeds[chunk]:
+                generators += [torch.Generator(device=self.device).manual_seed(prompt_seed)] * num_images
+            try:
+                output = self.pipe(
+                    prompt_embeds=prompt_embeds[chunk],
+                    negative_prompt_embeds=negative_embeds[chunk] if do_guidance else None,
+                    image=control,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    controlnet_conditioning_scale=controlnet_conditioning_scale,
+                    generator=generators,
+                    num_images_per_prompt=num_images,
+                    width=width,
+                    height=height
+                )
+            except torch.cuda.OutOfMemoryError:
+                if prompts_per_batch == 1:
+                    raise
+                prompts_per_batch = max(1, prompts_per_batch // 2)
+                torch.cuda.empty_cache()
+                print(f"   ⚠️ کمبود حافظه GPU؛ ریزدسته به {prompts_per_batch * num_images} تصویر کاهش یافت.")
+                continue
+            all_images.extend(output.images)
+            index = chunk.stop
+            print(f"   📝 پرامپت‌های {chunk.start + 1} تا {chunk.stop} از {n_prompts} تولید شد.")
+
+        elapsed = time.perf_counter() - start
+        print(f"✅ {len(all_images)} تصویر در {elapsed:.1f} ثانیه تولید شد ({elapsed / len(all_images):.2f} ثانیه برای هر تصویر)")
         return all_images
     
     def generate_with_variations(
@@ -180,7 +494,7 @@ class ControlNetGenerator:
             control_image: تصویر کنترل
             base_prompt: پرامپت پایه
             variations: لیست تغییرات
-            **kwargs: پارامترهای اضافی
+            **kwargs: پارامترهای اضافی generate_batch (مثلاً seeds یا micro_batch_size)
             
         Returns:
             list: لیست تصاویر با تنوع
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import zlib
+import numpy as np
+from PIL import Image
+
+class DummyGenerator:
+    """
+    ژنراتور ساختگی فقط-CPU با همان رابط ControlNetGenerator، بدون بارگذاری وزن یا وابستگی به diffusers.
+
+    خروجی تصویر کنترل است که شدت روشنایی آن روی یک گرادیان دو رنگ (تعیین‌شده با پرامپت و seed) نگاشته
+    شده است؛ بنابراین قطعی و سریع است و برای آزمون سرویس صف کار، پایپلاین و رابط‌ها روی ماشین‌های
+    بدون GPU و بدون مدل‌های دانلودشده به کار می‌رود.
+    """
+    def __init__(self, base_model, controlnet_model, device="cpu", dtype=None, controlnet_loader=None,
+                 cpu_options=None, prompt_cache=None):
+        self.base_model = base_model
+        self.device = 'cpu'
+        self.controlnet_loader = controlnet_loader or self.load_controlnet
+        self.controlnet = None
+        self._controlnet_key = None
+        self.set_controlnet(controlnet_model)
+        print(f"✅ ژنراتور ساختگی (بدون مدل) برای '{base_model}' آماده شد.")
+
+    @staticmethod
+    def load_controlnet(controlnet_model, dtype=None):
+        # ControlNet ساختگی وزنی ندارد و در رجیستری حجمی اشغال نمی‌کند
+        return None
+
+    def set_controlnet(self, controlnet_model):
+        specs = list(controlnet_model) if isinstance(controlnet_model, (list, tuple)) else [controlnet_model]
+        key = tuple(specs)
+        if key == self._controlnet_key:
+            return
+        self.controlnet = [self.controlnet_loader(spec) for spec in specs]
+        self._controlnet_key = key
+
+    def base_memory_mb(self):
+        return 0
+
+    def unload(self):
+        self.controlnet = None
+
+    @staticmethod
+    def _output_size(control_image, width, height):
+        """ابعاد خروجی (پیش‌فرض: ابعاد تصویر کنترل) گرد شده به مضرب 8، مانند ControlNetGenerator."""
+        width = control_image.width if width is None else width
+        height = control_image.height if height is None else height
+        return (width // 8) * 8, (height // 8) * 8
+
+    def generate(self, control_image, prompt, negative_prompt="", seed=None, num_images=1, width=None,
+                 height=None, controlnet=None, **kwargs):
+        """تولید num_images تصویر قطعی از تصویر کنترل؛ سایر پارامترهای تولید نادیده گرفته می‌شوند."""
+        if controlnet is not None:
+            self.set_controlnet(controlnet)
+        if isinstance(control_image, (list, tuple)):
+            control_image = control_image[0]
+        if isinstance(control_image, np.ndarray):
+            control_image = Image.fromarray(control_image)
+        size = self._output_size(control_image, width, height)
+        levels = np.asarray(control_image.convert('L').resize(size, Image.BILINEAR), dtype=np.float32)[..., None] / 255.0
+
+        images = []
+        for i in range(num_images):
+            image_seed = zlib.crc32(prompt.encode('utf-8')) ^ ((seed or 0) + i)
+            low, high = np.random.default_rng(image_seed).integers(0, 256, size=(2, 3)).astype(np.float32)
+            images.append(Image.fromarray((low + (high - low) * levels).astype(np.uint8), 'RGB'))
+        return images
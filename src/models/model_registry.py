@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import gc
+import threading
+from collections import OrderedDict
+import torch
+
+def module_size_mb(obj):
+    """
+    حجم پارامترها و بافرهای مدل‌های torch درون obj (مگابایت).
+    obj می‌تواند یک nn.Module، دیکشنری اجزای پایپلاین یا شیئی با ویژگی components باشد؛
+    تنسورهای مشترک فقط یک بار شمرده می‌شوند.
+    """
+    seen = set()
+    total = 0
+
+    def visit(value):
+        nonlocal total
+        if isinstance(value, torch.nn.Module):
+            for tensor in list(value.parameters()) + list(value.buffers()):
+                if id(tensor) not in seen:
+                    seen.add(id(tensor))
+                    total += tensor.numel() * tensor.element_size()
+        elif isinstance(value, dict):
+            for item in value.values():
+                visit(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                visit(item)
+        elif hasattr(value, 'components'):
+            visit(value.components)
+
+    visit(obj)
+    return total / (1024 * 1024)
+
+def release_memory():
+    """آزادسازی حافظه اشیای حذف‌شده (جمع‌آوری زباله و خالی کردن کش CUDA)."""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelRegistry:
+    """
+    رجیستری مدل‌های بارگذاری‌شده با بودجه حافظه و حذف LRU.
+
+    هر ورودی با یک کلید، تابع بارگذاری و حجم تخمینی (پارامترهای torch) ثبت می‌شود. با افزودن ورودی جدید،
+    اگر مجموع حجم‌ها از max_memory_mb بیشتر شود، کم‌استفاده‌ترین ورودی‌ها حذف می‌شوند. ورودی‌ها می‌توانند به
+    ورودی‌های دیگر وابسته باشند (مثلاً یک ژنراتور به اجزای مدل پایه و ControlNet): استفاده از ورودی، وابستگی‌های
+    آن را هم تازه می‌کند و حذف یک ورودی، ورودی‌های وابسته به آن را هم حذف می‌کند تا حافظه واقعاً آزاد شود.
+    ورودی‌ای که ورودی دیگری به آن وابسته است در حذف LRU انتخاب نمی‌شود (حافظه آن تا وقتی وابسته‌اش
+    زنده است آزاد نمی‌شود)؛ ابتدا وابسته‌ها حذف می‌شوند.
+
+    Args:
+        max_memory_mb (float): بودجه حافظه (مگابایت)؛ صفر یا None = بدون محدودیت.
+        log_callback: تابع گزارش.
+    """
+    def __init__(self, max_memory_mb=0, log_callback=print):
+        self.max_memory_mb = max_memory_mb or 0
+        self.log_callback = log_callback
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return list(self._entries)
+
+    @property
+    def total_mb(self):
+        return sum(entry['size_mb'] for entry in self._entries.values())
+
+    def _touch(self, key, visited=None):
+        visited = visited if visited is not None else set()
+        if key in visited or key not in self._entries:
+            return
+        visited.add(key)
+        self._entries.move_to_end(key)
+        for dependency in self._entries[key]['depends_on']:
+            self._touch(dependency, visited)
+
+    def get(self, key, loader=None, size_mb=None, depends_on=(), protect=()):
+        """
+        دریافت ورودی key؛ در صورت نبود، با loader بارگذاری و ثبت می‌شود.
+
+        Args:
+            loader: تابع بدون آرگومان برای ساخت مدل (در صورت نبود و None بودن، KeyError).
+            size_mb: حجم ورودی، یا تابعی از مدل بارگذاری‌شده؛ در صورت None با module_size_mb تخمین زده می‌شود.
+            depends_on: کلید ورودی‌هایی که این ورودی به آن‌ها وابسته است.
+            protect: کلیدهایی که نباید در حذف LRU همین فراخوانی حذف شوند.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.stats['hits'] += 1
+                self._touch(key)
+                return self._entries[key]['value']
+            if loader is None:
+                raise KeyError(key)
+            self.stats['misses'] += 1
+            value = loader()
+            if size_mb is None:
+                size_mb = module_size_mb(value)
+            elif callable(size_mb):
+                size_mb = size_mb(value)
+            self._entries[key] = {
+                'value': value,
+                'size_mb': size_mb,
+                'depends_on': tuple(depends_on),
+            }
+            self._touch(key)
+            self._evict(protect={key, *depends_on, *protect})
+            return value
+
+    def set_dependencies(self, key, depends_on):
+        """
+        جایگزینی وابستگی‌های ورودی key (مثلاً ControlNetهای متصل به یک ژنراتور پس از تعویض)
+        و تازه کردن آن‌ها در ترتیب LRU؛ وابستگی‌های قبلی که آزاد شده‌اند در صورت عبور از بودجه حذف می‌شوند.
+        """
+        with self._lock:
+            if key not in self._entries:
+                raise KeyError(key)
+            self._entries[key]['depends_on'] = tuple(depends_on)
+            self._touch(key)
+            self._evict(protect={key, *depends_on})
+
+    def _dependents(self, key):
+        return [other for other, entry in self._entries.items() if key in entry['depends_on']]
+
+    def _remove(self, key):
+        """حذف key و ورودی‌های وابسته به آن؛ فهرست کلیدهای حذف‌شده برگردانده می‌شود."""
+        if key not in self._entries:
+            return []
+        removed = []
+        for dependent in self._dependents(key):
+            removed += self._remove(dependent)
+        entry = self._entries.pop(key)
+        unload = getattr(entry['value'], 'unload', None)
+        if callable(unload):
+            unload()
+        return removed + [key]
+
+    def _evict(self, protect=()):
+        if not self.max_memory_mb:
+            return
+        while self.total_mb > self.max_memory_mb:
+            candidates = [key for key, entry in self._entries.items()
+                          if key not in protect and entry['size_mb'] > 0 and not self._dependents(key)]
+            if not candidates:
+                break
+            # اولین کلید OrderedDict کم‌استفاده‌ترین ورودی است
+            removed = self._remove(candidates[0])
+            self.stats['evictions'] += len(removed)
+            self.log_callback(f"♻️ مدل کم‌استفاده از حافظه خارج شد: {', '.join(map(str, removed))} "
+                              f"(حافظه مدل‌ها: {self.total_mb:.0f} از {self.max_memory_mb:.0f} مگابایت)")
+            release_memory()
+
+    def unload(self, key=None):
+        """
+        خارج کردن صریح key (و ورودی‌های وابسته) از حافظه؛ بدون key همه مدل‌ها خارج می‌شوند.
+
+        Returns:
+            list: کلیدهای حذف‌شده.
+        """
+        with self._lock:
+            removed = []
+            for target in ([key] if key is not None else list(self._entries)):
+                removed += self._remove(target)
+            if removed:
+                release_memory()
+            return removed
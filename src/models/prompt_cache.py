@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+import torch
+
+class PromptEmbeddingCache:
+    """
+    کش LRU خروجی text encoder (embedding پرامپت‌ها) با کلید (مدل پایه، نوع text encoder، متن پرامپت).
+    نوع text encoder (مثلاً float32، bfloat16 یا float32-int8) بخشی از کلید است، زیرا embedding
+    text encoder کوانتیزه‌شده با نسخه اصلی یکسان نیست.
+
+    پرامپت‌های مثبت و منفی تنظیمات طولانی و در اجراهای متوالی تقریباً یکسان هستند (فقط پسوند ابعاد فرش
+    تغییر می‌کند)، بنابراین کدگذاری مجدد آن‌ها با CLIP در هر تولید تکراری است. embeddingها روی CPU نگه
+    داشته می‌شوند و با cache_dir روی دیسک هم ذخیره می‌شوند تا بین اجراهای برنامه باقی بمانند؛ حجم فایل‌های
+    دیسک به max_disk_mb محدود است و فایل‌هایی که دیرتر از همه استفاده شده‌اند (mtime) حذف می‌شوند.
+
+    Args:
+        max_entries (int): بیشینه تعداد embeddingهای نگه‌داشته‌شده در حافظه.
+        cache_dir (str): پوشه ذخیره embeddingها روی دیسک؛ None = فقط حافظه.
+        max_disk_mb (float): بیشینه حجم فایل‌های cache_dir (مگابایت).
+        log_callback: تابع گزارش.
+    """
+    def __init__(self, max_entries=64, cache_dir=None, max_disk_mb=256, log_callback=print):
+        self.max_entries = max(1, max_entries)
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self.log_callback = log_callback
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _file_name(key):
+        return hashlib.sha256('\0'.join(key).encode('utf-8')).hexdigest() + '.pt'
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = os.path.join(self.cache_dir, self._file_name(key))
+        if not os.path.exists(path):
+            return None
+        try:
+            entry = torch.load(path, map_location='cpu', weights_only=True)
+            if tuple(entry['key']) != key:
+                return None
+            os.utime(path, None)
+            return entry['embeds']
+        except Exception as e:
+            self.log_callback(f"⚠️ فایل کش embedding پرامپت خراب است و حذف می‌شود: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _save_to_disk(self, key, embeds):
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, self._file_name(key))
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            torch.save({'key': list(key), 'embeds': embeds}, temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.log_callback(f"⚠️ امکان ذخیره embedding پرامپت روی دیسک وجود نداشت: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _evict_disk(self):
+        """حذف قدیمی‌ترین فایل‌ها (بر اساس زمان آخرین استفاده) تا حجم پوشه از max_disk_bytes کمتر شود."""
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pt'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+    def _store(self, key, embeds):
+        self._entries[key] = embeds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def encode(self, base_model, texts, encode_fn, variant=''):
+        """
+        embedding فهرست texts؛ متن‌های موجود در کش (حافظه یا دیسک) دوباره کدگذاری نمی‌شوند و بقیه
+        در یک فراخوانی encode_fn (فهرست متن‌ها ← تنسور n×طول×بعد) با هم کدگذاری می‌شوند.
+        variant نوع text encoder (نوع داده و کوانتیزاسیون) است و embeddingهای نوع‌های مختلف از هم جدا می‌مانند.
+
+        Returns:
+            torch.Tensor: embeddingها به ترتیب texts (روی CPU).
+        """
+        with self._lock:
+            found = {}
+            for text in texts:
+                key = (base_model, variant, text)
+                if text in found:
+                    continue
+                if key in self._entries:
+                    self.stats['hits'] += 1
+                    self._entries.move_to_end(key)
+                    found[text] = self._entries[key]
+                    continue
+                embeds = self._load_from_disk(key)
+                if embeds is not None:
+                    self.stats['disk_hits'] += 1
+                    self._store(key, embeds)
+                    found[text] = embeds
+            missing = [text for text in dict.fromkeys(texts) if text not in found]
+            if missing:
+                self.stats['misses'] += len(missing)
+                encoded = encode_fn(missing).detach().cpu()
+                for text, embeds in zip(missing, encoded):
+                    embeds = embeds.clone()
+                    self._store((base_model, variant, text), embeds)
+                    self._save_to_disk((base_model, variant, text), embeds)
+                    found[text] = embeds
+                if self.cache_dir:
+                    self._evict_disk()
+            return torch.stack([found[text] for text in texts])
+
+    def clear(self):
+        """خالی کردن کش حافظه (فایل‌های دیسک باقی می‌مانند)."""
+        with self._lock:
+            self._entries.clear()
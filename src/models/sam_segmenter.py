@@ -5,6 +5,8 @@ from PIL import Image
 import cv2
 import os
 
+from ..utils.tiling import apply_mask_in_strips
+
 class SAMSegmenter:
     """کلاس جداسازی عناصر تصویر با SAM با قابلیت بارگذاری تنبل (Lazy Loading)."""
     
@@ -118,26 +120,16 @@ class SAMSegmenter:
             print("   - هیچ عنصری برای استخراج یافت نشد.")
             return None
     
-    def apply_mask_to_image(self, image, mask, background_color=(255, 255, 255)):
+    def apply_mask_to_image(self, image, mask, background_color=(255, 255, 255), strip_rows=None):
         """
         اعمال یک ماسک باینری به تصویر برای حذف پس‌زمینه.
+        پیکسل‌های بیرون ماسک درجا (و در صورت تعیین strip_rows نوار به نوار) با رنگ پس‌زمینه
+        جایگزین می‌شوند؛ ماسک سه‌کاناله و تصویر پس‌زمینه کامل ساخته نمی‌شود.
         """
-        if isinstance(image, Image.Image):
-            image_np = np.array(image.convert("RGB"))
-        else:
-            image_np = image
-            
-        # اطمینان از 3 کاناله بودن تصویر خروجی
-        if len(image_np.shape) < 3:
-             image_np = cv2.cvtColor(image_np, cv2.COLOR_GRAY2RGB)
+        if not isinstance(image, Image.Image):
+            # اطمینان از 3 کاناله بودن تصویر خروجی
+            if len(image.shape) < 3:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+            image = Image.fromarray(image)
 
-        # ایجاد یک پس‌زمینه با رنگ مشخص
-        background = np.full(image_np.shape, background_color, dtype=np.uint8)
-        
-        # اطمینان از اینکه ماسک به صورت 3 بعدی برای broadcast صحیح است
-        mask_3d = np.stack([mask]*3, axis=-1)
-        
-        # ترکیب پیش‌زمینه و پس‌زمینه بر اساس ماسک
-        result = np.where(mask_3d > 0, image_np, background)
-        
-        return Image.fromarray(result)
\ No newline at end of file
+        return apply_mask_in_strips(image, mask, background_color, strip_rows=strip_rows)
\ No newline at end of file
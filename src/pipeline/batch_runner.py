@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from PIL import Image
+
+from .carpet_pipeline import CarpetDesignPipeline, ProcessingCancelledError
+from ..utils.paths import DEFAULT_CONFIG_PATH
+
+DEFAULT_IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp', '*.webp', '*.tif', '*.tiff')
+
+def collect_input_images(input_dir, patterns=DEFAULT_IMAGE_PATTERNS, recursive=False):
+    """
+    فهرست مرتب و بدون تکرار تصاویر ورودی یک پوشه بر اساس الگوهای glob.
+    """
+    found = set()
+    for pattern in patterns:
+        if recursive:
+            found.update(glob.glob(os.path.join(input_dir, '**', pattern), recursive=True))
+        else:
+            found.update(glob.glob(os.path.join(input_dir, pattern)))
+        # پشتیبانی از پسوندهای با حروف بزرگ (مثلاً JPG)
+        upper_pattern = pattern.upper()
+        if upper_pattern != pattern:
+            root = os.path.join(input_dir, '**', upper_pattern) if recursive else os.path.join(input_dir, upper_pattern)
+            found.update(glob.glob(root, recursive=recursive))
+    return sorted(path for path in found if os.path.isfile(path))
+
+
+# نمونه پایپلاین هر پروسه کارگر CPU (یک بار در initializer ساخته می‌شود)
+_worker_pipeline = None
+
+def _init_cpu_worker(config_path):
+    global _worker_pipeline
+    _worker_pipeline = CarpetDesignPipeline(config_path=config_path)
+
+def _run_cpu_phase(image_path, run_config, output_path, pipeline_state):
+    """
+    اجرای مراحل CPU (کاهش رنگ، تقارن، ذخیره PNG، مشخصات و وکتورسازی) در یک پروسه کارگر.
+    مراحل GPU قبلاً در همان پوشه خروجی ذخیره شده‌اند و از طریق ازسرگیری بازیابی می‌شوند.
+    رویدادهای معیار مراحل جمع‌آوری و همراه خروجی‌ها (یا خطا، در ویژگی metrics_events) برگردانده
+    می‌شوند تا پروسه اصلی آن‌ها را به metrics_callback بدهد.
+    """
+    pipeline = _worker_pipeline
+    pipeline.config = pipeline_state['config']
+    pipeline.custom_palette = pipeline_state['custom_palette']
+    pipeline.carpet_specs = pipeline_state['carpet_specs']
+
+    start = time.perf_counter()
+    with Image.open(image_path) as img:
+        input_image = img.convert('RGB')
+    prefix = os.path.basename(output_path)
+    metrics_events = []
+    try:
+        results = pipeline.process_image(
+            input_image=input_image,
+            run_config=run_config,
+            resume_dir=output_path,
+            log_callback=lambda message: print(f"[{prefix}] {message}"),
+            metrics_callback=metrics_events.append
+        )
+    except Exception as e:
+        # ویژگی‌های استثنا همراه آن به پروسه اصلی منتقل (pickle) می‌شوند
+        e.metrics_events = metrics_events
+        raise
+    outputs = {key: results[key] for key in ('final_png', 'svg_path', 'pdf_path') if results.get(key)}
+    outputs['cpu_seconds'] = round(time.perf_counter() - start, 3)
+    outputs['metrics_events'] = metrics_events
+    return outputs
+
+
+class BatchRunner:
+    """
+    اجرای دسته‌ای پایپلاین روی تعداد زیادی تصویر با یک نمونه واحد از CarpetDesignPipeline،
+    تا مدل‌های بارگذاری‌شده (SAM، HED، ControlNet) بین تصاویر گرم باقی بمانند.
+    خطای هر تصویر ثبت می‌شود و پردازش با تصویر بعدی ادامه می‌یابد.
+
+    با cpu_workers > 0، مراحل GPU هر تصویر در همین پروسه اجرا می‌شوند و مراحل CPU
+    تصاویر قبلی همزمان در یک pool از پروسه‌ها انجام می‌شوند.
+    """
+    def __init__(self, pipeline, output_dir, run_config, log_callback=print, manifest_path=None,
+                 cpu_workers=0, config_path=DEFAULT_CONFIG_PATH, metrics_callback=None):
+        self.pipeline = pipeline
+        self.run_config = run_config
+        self.log_callback = log_callback
+        self.cpu_workers = cpu_workers
+        self.config_path = config_path
+        self.metrics_callback = metrics_callback
+        self.batch_name = datetime.now().strftime("batch_%Y%m%d_%H%M%S")
+        self.output_dir = os.path.join(output_dir, self.batch_name)
+        self.manifest_path = manifest_path or os.path.join(self.output_dir, 'batch_manifest.json')
+        self.manifest = None
+
+    def _run_name(self, image_path, used_names):
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        run_name = base_name
+        counter = 1
+        while run_name in used_names:
+            counter += 1
+            run_name = f"{base_name}_{counter}"
+        used_names.add(run_name)
+        return run_name
+
+    def _write_manifest(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+
+    def _start_manifest(self, image_paths):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.manifest = {
+            'batch_name': self.batch_name,
+            'output_dir': self.output_dir,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'total': len(image_paths),
+            'succeeded': 0,
+            'failed': 0,
+            'cpu_workers': self.cpu_workers,
+            'total_seconds': 0.0,
+            'items': []
+        }
+        self._write_manifest()
+
+    def _record_item(self, item, batch_start):
+        if item['status'] == 'ok':
+            self.manifest['succeeded'] += 1
+        elif item['status'] == 'failed':
+            self.manifest['failed'] += 1
+        self.manifest['items'].append(item)
+        self.manifest['total_seconds'] = round(time.perf_counter() - batch_start, 3)
+        self._write_manifest()
+
+    def _finish_manifest(self, batch_start):
+        self.manifest['finished_at'] = datetime.now().isoformat()
+        self.manifest['total_seconds'] = round(time.perf_counter() - batch_start, 3)
+        self._write_manifest()
+
+        self.log_callback(
+            f"\n📊 پایان پردازش دسته‌ای: {self.manifest['succeeded']} موفق، {self.manifest['failed']} ناموفق "
+            f"از {self.manifest['total']} تصویر در {self.manifest['total_seconds']:.1f} ثانیه."
+        )
+        self.log_callback(f"📄 فایل manifest: {self.manifest_path}")
+        return self.manifest
+
+    def _log_image_header(self, index, total, image_path):
+        self.log_callback("\n" + "#"*80)
+        self.log_callback(f"🖼️ تصویر {index}/{total}: {image_path}")
+        self.log_callback("#"*80)
+
+    def run(self, image_paths, cancel_event=None):
+        """
+        پردازش تمام تصاویر و نوشتن فایل manifest (پس از هر تصویر به‌روزرسانی می‌شود).
+
+        Returns:
+            dict: محتوای manifest شامل زمان، وضعیت و مسیر خروجی‌های هر تصویر.
+        """
+        if self.cpu_workers > 0:
+            return self._run_pipelined(image_paths, cancel_event)
+
+        batch_start = time.perf_counter()
+        self._start_manifest(image_paths)
+
+        used_names = set()
+        for index, image_path in enumerate(image_paths, start=1):
+            self._log_image_header(index, len(image_paths), image_path)
+
+            item = {'input': image_path, 'status': 'failed', 'seconds': 0.0}
+            self.pipeline.last_output_path = None
+            start = time.perf_counter()
+            try:
+                with Image.open(image_path) as img:
+                    input_image = img.convert('RGB')
+                results = self.pipeline.process_image(
+                    input_image=input_image,
+                    output_dir=self.output_dir,
+                    run_config=self.run_config,
+                    cancel_event=cancel_event,
+                    log_callback=self.log_callback,
+                    run_name=self._run_name(image_path, used_names),
+                    metrics_callback=self.metrics_callback
+                )
+                item['status'] = 'ok'
+                for key in ('output_path', 'final_png', 'svg_path', 'pdf_path'):
+                    if results.get(key):
+                        item[key] = results[key]
+            except ProcessingCancelledError:
+                item['status'] = 'cancelled'
+                item['output_path'] = self.pipeline.last_output_path
+                self.log_callback("🛑 پردازش دسته‌ای لغو شد.")
+            except Exception as e:
+                item['error'] = f"{type(e).__name__}: {e}"
+                item['output_path'] = self.pipeline.last_output_path
+                self.log_callback(f"❌ پردازش تصویر '{image_path}' ناموفق بود و از آن عبور می‌شود: {e}")
+            item['seconds'] = round(time.perf_counter() - start, 3)
+
+            self._record_item(item, batch_start)
+            if item['status'] == 'cancelled':
+                break
+
+        return self._finish_manifest(batch_start)
+
+    def _run_pipelined(self, image_paths, cancel_event=None):
+        """
+        اجرای خط لوله‌ای: فاز GPU تصویر i در این پروسه همزمان با فاز CPU تصاویر قبلی در pool پروسه‌ها.
+        تعداد کارهای CPU در صف محدود است تا حافظه و دیسک بی‌رویه مصرف نشود.
+        """
+        batch_start = time.perf_counter()
+        self._start_manifest(image_paths)
+        self.log_callback(f"⚙️ مراحل CPU با {self.cpu_workers} پروسه کارگر به صورت موازی اجرا می‌شوند.")
+
+        pipeline_state = {
+            'config': self.pipeline.config,
+            'custom_palette': self.pipeline.custom_palette,
+            'carpet_specs': self.pipeline.carpet_specs,
+        }
+        max_in_flight = self.cpu_workers * 2
+        in_flight = {}
+
+        def emit_metrics(events):
+            if self.metrics_callback:
+                for event in events:
+                    self.metrics_callback(event)
+
+        def collect(futures):
+            for future in futures:
+                item = in_flight.pop(future)
+                try:
+                    outputs = future.result()
+                    item['status'] = 'ok'
+                    item['cpu_seconds'] = outputs.pop('cpu_seconds')
+                    emit_metrics(outputs.pop('metrics_events', []))
+                    item.update(outputs)
+                except Exception as e:
+                    emit_metrics(getattr(e, 'metrics_events', []))
+                    item['error'] = f"{type(e).__name__}: {e}"
+                    self.log_callback(f"❌ مراحل CPU تصویر '{item['input']}' ناموفق بود: {e}")
+                item['seconds'] = round(item['gpu_seconds'] + item.get('cpu_seconds', 0.0), 3)
+                self._record_item(item, batch_start)
+
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=mp_context,
+                                 initializer=_init_cpu_worker, initargs=(self.config_path,)) as pool:
+            used_names = set()
+            for index, image_path in enumerate(image_paths, start=1):
+                if cancel_event and cancel_event.is_set():
+                    self.log_callback("🛑 پردازش دسته‌ای لغو شد.")
+                    break
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                self._log_image_header(index, len(image_paths), image_path)
+                item = {'input': image_path, 'status': 'failed', 'seconds': 0.0, 'gpu_seconds': 0.0}
+                self.pipeline.last_output_path = None
+                start = time.perf_counter()
+                try:
+                    with Image.open(image_path) as img:
+                        input_image = img.convert('RGB')
+                    results = self.pipeline.process_image(
+                        input_image=input_image,
+                        output_dir=self.output_dir,
+                        run_config=self.run_config,
+                        cancel_event=cancel_event,
+                        log_callback=self.log_callback,
+                        run_name=self._run_name(image_path, used_names),
+                        phase='gpu',
+                        metrics_callback=self.metrics_callback
+                    )
+                    item['output_path'] = results['output_path']
+                    item['gpu_seconds'] = round(time.perf_counter() - start, 3)
+                except ProcessingCancelledError:
+                    item['status'] = 'cancelled'
+                    item['output_path'] = self.pipeline.last_output_path
+                    self._record_item(item, batch_start)
+                    self.log_callback("🛑 پردازش دسته‌ای لغو شد.")
+                    break
+                except Exception as e:
+                    item['error'] = f"{type(e).__name__}: {e}"
+                    item['output_path'] = self.pipeline.last_output_path
+                    item['gpu_seconds'] = item['seconds'] = round(time.perf_counter() - start, 3)
+                    self.log_callback(f"❌ پردازش تصویر '{image_path}' ناموفق بود و از آن عبور می‌شود: {e}")
+                    self._record_item(item, batch_start)
+                    continue
+
+                future = pool.submit(_run_cpu_phase, image_path, self.run_config, item['output_path'], pipeline_state)
+                in_flight[future] = item
+
+            if in_flight:
+                self.log_callback(f"⏳ در انتظار پایان مراحل CPU {len(in_flight)} تصویر باقی‌مانده...")
+                collect(list(wait(in_flight).done))
+
+        return self._finish_manifest(batch_start)
@@ -1,26 +1,55 @@
 # -*- coding: utf-8 -*-
 import os
+import gzip
+import importlib.util
+import shutil
+import tempfile
 import yaml
 import torch
 import numpy as np
+import threading
+import time
+from functools import partial
 from PIL import Image
 from datetime import datetime
 import json
 
 from ..models.sam_segmenter import SAMSegmenter
 from ..models.edge_detector import EdgeDetector
-from ..models.controlnet_generator import ControlNetGenerator
+from ..models.controlnet_generator import ControlNetGenerator, resolve_dtype
+from ..models.model_registry import ModelRegistry
+from ..models.prompt_cache import PromptEmbeddingCache
 from ..processors.color_quantizer import ColorQuantizer
 from ..processors.symmetry_maker import SymmetryMaker
 from ..processors.vectorizer import Vectorizer
-from ..utils.paths import DEFAULT_CONFIG_PATH, SAM_MODEL_CHECKPOINT
+from ..processors.palette_mapper import PaletteMapper
+from ..processors.dithering import normalize_dither
+from ..processors.speckle_cleaner import SpeckleCleaner
+from ..processors.knot_statistics import compute_knot_statistics, estimate_yarn
+from ..utils.paths import DEFAULT_CONFIG_PATH, SAM_MODEL_CHECKPOINT, CACHE_DIR
+from ..utils.stage_cache import StageCache
+from ..utils.tiling import rows_per_strip, resize_in_strips, save_png_in_strips, replace_png_palette
+from ..utils.weaving_chart import export_weaving_chart, replace_chart_palette
+from ..utils.chart_pdf import WeavingChartPDF
+from ..utils.svg_optimizer import SVGOptimizer
+from ..utils.metrics import peak_rss_bytes
+from .stage_graph import Stage, StageGraph, ArtifactStore
 
 class ProcessingCancelledError(Exception):
     """این خطا زمانی که پردازش توسط کاربر لغو می‌شود، فراخوانی می‌گردد."""
     pass
 
 class CarpetDesignPipeline:
-    def __init__(self, config_path=DEFAULT_CONFIG_PATH):
+    # حداکثر تعداد مراحل مستقلی که به صورت همزمان اجرا می‌شوند
+    MAX_PARALLEL_STAGES = 3
+
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, generator_class=None):
+        """
+        Args:
+            config_path (str): مسیر فایل تنظیمات YAML.
+            generator_class: کلاس ژنراتور طرح با رابط ControlNetGenerator (مثلاً DummyGenerator برای اجرای
+                بدون مدل روی CPU)؛ پیش‌فرض ControlNetGenerator.
+        """
         print("=" * 80)
         print("🧶 سیستم هوشمند تبدیل تصویر به طرح صنعتی فرش (پایپلاین نسخه ۲.۷)")
         print("=" * 80)
@@ -39,30 +68,97 @@ class CarpetDesignPipeline:
         
         self._sam = None
         self._edge_detector = None
-        self._controlnet_instances = {}
+        # مدل‌های پایه (ژنراتورها) و ControlNetها با بودجه حافظه و حذف LRU
+        registry_config = self.config.get('models', {}).get('registry', {})
+        self.model_registry = ModelRegistry(max_memory_mb=registry_config.get('max_memory_mb', 0),
+                                            log_callback=lambda message: self.log_callback(message))
+        self.log_callback = print
+        # ControlNetهای درخواست فعلی؛ در بارگذاری ControlNet جدید نباید از حافظه خارج شوند
+        self._requested_controlnet_keys = ()
+        # embedding پرامپت‌ها (مشترک بین مدل‌های پایه؛ مدل پایه بخشی از کلید است)
+        prompt_cache_config = self.config.get('generation', {}).get('prompt_cache', {})
+        self.prompt_cache = None
+        if prompt_cache_config.get('enable', True):
+            cache_root = self.config.get('cache', {}).get('dir') or CACHE_DIR
+            self.prompt_cache = PromptEmbeddingCache(
+                max_entries=prompt_cache_config.get('max_entries', 64),
+                cache_dir=os.path.join(cache_root, 'prompt_embeds') if prompt_cache_config.get('persist') else None,
+                max_disk_mb=prompt_cache_config.get('max_disk_mb', 256),
+                log_callback=lambda message: self.log_callback(message)
+            )
         
         self.color_quantizer = ColorQuantizer()
         self.symmetry_maker = SymmetryMaker()
         self.vectorizer = None
+        self.generator_class = generator_class or ControlNetGenerator
         self.custom_palette = None
         self.carpet_specs = None
+        self.last_output_path = None
+
+        cache_config = self.config.get('cache', {})
+        self.stage_cache = StageCache(
+            cache_dir=cache_config.get('dir') or CACHE_DIR,
+            max_size_mb=cache_config.get('max_size_mb', 2048),
+            enabled=cache_config.get('enable', True)
+        )
 
     def _lazy_load_controlnet(self, base_model_path, controlnet_path):
-        instance_key = (base_model_path, controlnet_path)
-        if instance_key not in self._controlnet_instances:
-            self.log_callback(f"⏳ در حال بارگذاری مدل ControlNet + Stable Diffusion...")
-            self.log_callback(f"   - مدل پایه: {base_model_path}")
-            self.log_callback(f"   - مدل کنترل: {controlnet_path}")
-            self.log_callback("   (این مرحله ممکن است بسیار زمان‌بر باشد و به حافظه VRAM بالایی نیاز دارد)")
-            
-            generator_instance = ControlNetGenerator(
-                base_model=base_model_path,
-                controlnet_model=controlnet_path,
-                device=self.device
+        """
+        ژنراتور مدل پایه با ControlNet(های) درخواستی. هر مدل پایه فقط یک بار بارگذاری می‌شود و ControlNetها
+        (ورودی‌های جداگانه رجیستری) روی آن تعویض می‌شوند؛ controlnet_path می‌تواند فهرستی از مسیرها باشد.
+        ControlNetهای متصل به هر ژنراتور به عنوان وابستگی ورودی مدل پایه در رجیستری ثبت می‌شوند، بنابراین
+        تا وقتی ژنراتور زنده است از حافظه خارج نمی‌شوند و با هر استفاده همراه آن تازه می‌شوند.
+        """
+        base_key = ('base', base_model_path)
+        controlnet_paths = list(controlnet_path) if isinstance(controlnet_path, (list, tuple)) else [controlnet_path]
+        controlnet_keys = tuple(('controlnet', path) for path in controlnet_paths)
+        # پروفایل اجرای CPU (روی GPU فقط dtype پیش‌فرض float16 استفاده می‌شود)
+        cpu_options = self.config.get('models', {}).get('cpu_inference', {})
+        dtype = resolve_dtype(self.device, cpu_options.get('dtype', 'auto'),
+                              quantize_int8=self.device == 'cpu' and cpu_options.get('quantize_int8', False))
+
+        self._requested_controlnet_keys = controlnet_keys
+
+        def load_controlnet(path):
+            # ژنراتور این تابع را در تعویض‌های بعدی هم فراخوانی می‌کند؛ ControlNetهای محافظت‌شده از درخواست فعلی خوانده می‌شوند
+            return self.model_registry.get(
+                ('controlnet', path), lambda: self.generator_class.load_controlnet(path, dtype),
+                protect=(base_key,) + self._requested_controlnet_keys
             )
-            self._controlnet_instances[instance_key] = generator_instance
-            self.log_callback(f"✅ مدل ControlNet با موفقیت بارگذاری شد.")
-        return self._controlnet_instances[instance_key]
+
+        if base_key in self.model_registry:
+            generator_instance = self.model_registry.get(base_key)
+            generator_instance.set_controlnet(controlnet_paths)
+            self.model_registry.set_dependencies(base_key, controlnet_keys)
+            return generator_instance
+
+        self.log_callback(f"⏳ در حال بارگذاری مدل ControlNet + Stable Diffusion...")
+        self.log_callback(f"   - مدل پایه: {base_model_path}")
+        self.log_callback(f"   - مدل کنترل: {', '.join(controlnet_paths)}")
+        self.log_callback("   (این مرحله ممکن است بسیار زمان‌بر باشد و به حافظه VRAM بالایی نیاز دارد)")
+        # حجم ControlNetها در ورودی‌های خودشان شمرده می‌شود
+        generator_instance = self.model_registry.get(
+            base_key,
+            lambda: self.generator_class(
+                base_model=base_model_path,
+                controlnet_model=controlnet_paths,
+                device=self.device,
+                dtype=dtype,
+                controlnet_loader=load_controlnet,
+                cpu_options=cpu_options,
+                prompt_cache=self.prompt_cache
+            ),
+            size_mb=lambda generator: generator.base_memory_mb(), depends_on=controlnet_keys
+        )
+        self.log_callback(f"✅ مدل ControlNet با موفقیت بارگذاری شد (حافظه مدل‌ها: {self.model_registry.total_mb:.0f} مگابایت).")
+        return generator_instance
+
+    def unload_models(self):
+        """خارج کردن صریح همه مدل‌های تولید طرح (مدل‌های پایه و ControlNetها) از حافظه."""
+        removed = self.model_registry.unload()
+        if removed:
+            self.log_callback(f"♻️ {len(removed)} مدل از حافظه خارج شد.")
+        return removed
 
     def _lazy_load_sam(self):
         if self._sam is None:
@@ -77,8 +173,9 @@ class CarpetDesignPipeline:
         return self._sam
 
     def _lazy_load_edge_detector(self):
-        if self._edge_detector is None:
-            method = self.config.get('processing', {}).get('edge_detection', {}).get('method', 'HED')
+        method = self.config.get('processing', {}).get('edge_detection', {}).get('method', 'HED')
+        # در صورت تغییر روش در تنظیمات، آشکارساز جدید ساخته می‌شود
+        if self._edge_detector is None or self._edge_detector.method != method:
             self.log_callback(f"⏳ در حال بارگذاری مدل تشخیص لبه ({method})...")
             self._edge_detector = EdgeDetector(method=method, device=self.device)
             self.log_callback("✅ مدل تشخیص لبه با موفقیت بارگذاری شد.")
@@ -92,186 +189,644 @@ class CarpetDesignPipeline:
         self._check_for_cancel(cancel_event)
         if self.progress_callback:
             self.progress_callback(current_step, total_steps)
-            
-    def process_image(self, input_image, output_dir='output', run_config=None, cancel_event=None, log_callback=print, progress_callback=None):
+
+    def _knot_map_size(self):
+        spec = self.carpet_specs
+        width_px = int((spec['width_cm'] / 10) * spec['shaneh'])
+        height_px = int((spec['height_cm'] / 10) * spec['tar'])
+        return width_px, height_px
+
+    def _strip_rows(self, width_px, height_px):
+        """
+        تعداد سطرهای هر نوار در حالت پردازش نواری، یا None در حالت عادی (کل تصویر در حافظه).
+        با enable: auto، حالت نواری فقط برای نقشه‌های گره بزرگ‌تر از auto_threshold_mp فعال می‌شود.
+        """
+        tiling_config = self.config.get('processing', {}).get('tiling', {})
+        enable = tiling_config.get('enable', 'auto')
+        if enable == 'auto':
+            enable = width_px * height_px >= tiling_config.get('auto_threshold_mp', 16) * 1_000_000
+        if not enable:
+            return None
+        return rows_per_strip(width_px, tiling_config.get('memory_budget_mb', 256))
+
+    def build_stage_graph(self, run_config, output_path):
+        """
+        ساخت گراف مراحل پایپلاین بر اساس تنظیمات اجرا.
+        وابستگی‌ها: ابعاد گره ← حذف پس‌زمینه ← لبه‌ها ← تولید AI ← کاهش رنگ ← پاک‌سازی گره‌های منفرد ← تقارن ←
+        (ذخیره نتیجه نهایی، وکتورسازی و مشخصات فرش به صورت همزمان).
+        """
+        width_px, height_px = self._knot_map_size()
+        strip_rows = self._strip_rows(width_px, height_px)
+        save_intermediate = bool(run_config.get('save_intermediate'))
+
+        sam_fast_mode = run_config.get('sam_fast_mode', False)
+        edge_method = self.config.get('processing', {}).get('edge_detection', {}).get('method', 'HED')
+
+        gen_config = self.config['generation']
+        enhanced_prompt = gen_config['prompts']['positive']
+        if self.carpet_specs:
+            enhanced_prompt += f", carpet design for {self.carpet_specs['width_cm']}x{self.carpet_specs['height_cm']}cm, {self.carpet_specs['shaneh']} raj density"
+        generation_kwargs = {
+            'prompt': enhanced_prompt,
+            'negative_prompt': gen_config['prompts']['negative'],
+            'num_inference_steps': gen_config['steps'],
+            'guidance_scale': gen_config['guidance_scale'],
+            'controlnet_conditioning_scale': gen_config['controlnet_scale'],
+            'seed': gen_config['seed'] if gen_config['seed'] != -1 else None,
+            'width': width_px,
+            'height': height_px
+        }
+        base_model_path = run_config.get('base_model_path')
+        controlnet_path = run_config.get('controlnet_path')
+
+        if self.custom_palette is not None and len(self.custom_palette) > 0:
+            custom_palette = np.array(self.custom_palette, dtype=np.uint8)
+            quantize_config_slice = {'custom_palette': custom_palette.tolist()}
+        else:
+            custom_palette = None
+            quantize_config_slice = {'n_colors': self.config['processing']['color_quantization']['n_colors']}
+        quantize_config = self.config['processing']['color_quantization']
+        quantize_options = {
+            'dither': normalize_dither(quantize_config.get('dither', True)),
+            'distance_metric': quantize_config.get('distance_metric', 'rgb'),
+            'lut_bins': quantize_config.get('lut_bins', 32),
+        }
+        quantize_config_slice.update(quantize_options, strip_rows=strip_rows)
+        speckle_config = self.config['processing'].get('speckle_cleanup', {})
+        speckle_options = {
+            'min_knots': speckle_config.get('min_knots', 4),
+            'connectivity': speckle_config.get('connectivity', 4),
+            'max_passes': speckle_config.get('max_passes', 3),
+        }
+
+        vector_kwargs = {
+            'filter_speckle': run_config.get('vector_speckle', 4),
+            'color_precision': run_config.get('vector_color_precision', 6),
+            'corner_threshold': run_config.get('vector_corner_threshold', 60)
+        }
+        vectorization_config = self.config['processing'].get('vectorization', {})
+        vector_mode = run_config.get('vector_mode', vectorization_config.get('mode', 'color'))
+        vector_workers = vectorization_config.get('workers', 0)
+        svg_optimize = self.config['output'].get('svg_optimize', {})
+        background_color = tuple(self.config['output'].get('medallion_background_color', [245, 240, 230]))
+        chart_config = self.config['output'].get('weaving_chart', {})
+        chart_format = chart_config.get('format', 'binary')
+        chart_pdf_config = self.config['output'].get('chart_pdf', {})
+        knots_per_page = chart_pdf_config.get('knots_per_page', 100)
+
+        stages = [
+            Stage(
+                'knot_resize', partial(self._stage_knot_resize, size=(width_px, height_px), strip_rows=strip_rows),
+                inputs=('original',), outputs=('knot_image',),
+                title="مرحله ۰: محاسبه ابعاد نقشه گره", is_step=False,
+                config_slice={'size': [width_px, height_px], 'strip_rows': strip_rows},
+                intermediate_files={'knot_image': '01_knot_resolution.png'}
+            ),
+            Stage(
+                'remove_background',
+                partial(self._stage_remove_background, fast_mode=sam_fast_mode, strip_rows=strip_rows),
+                inputs=('knot_image',), outputs=('foreground_image', 'mask'),
+                title="حذف پس‌زمینه با SAM", enabled=bool(run_config.get('remove_background')),
+                passthrough={'foreground_image': 'knot_image'},
+                config_slice={
+                    'sam_fast_mode': sam_fast_mode,
+                    'model_type': self.config.get('models', {}).get('sam', {}).get('model_type', 'vit_h')
+                },
+                cacheable=True, kind='gpu',
+                intermediate_files={'foreground_image': '02_background_removed.png'}
+            ),
+            Stage(
+                'detect_edges', self._stage_detect_edges,
+                inputs=('foreground_image',), outputs=('edges',),
+                title="تشخیص لبه‌ها", enabled=bool(run_config.get('detect_edges')),
+                config_slice={'method': edge_method, 'kernel_size': 3},
+                cacheable=True, kind='gpu',
+                intermediate_files={'edges': '03_edges.png'}
+            ),
+            Stage(
+                'generate_design',
+                partial(self._stage_generate_design, base_model_path=base_model_path,
+                        controlnet_path=controlnet_path, generation_kwargs=generation_kwargs),
+                inputs=('foreground_image', 'edges'), outputs=('design_image',),
+                title="تولید طرح فرش با AI", enabled=bool(run_config.get('generate_design')),
+                passthrough={'design_image': 'foreground_image'},
+                config_slice=dict(generation_kwargs, base_model=base_model_path, controlnet=controlnet_path),
+                # بدون seed ثابت، خروجی قابل تکرار نیست و کش نمی‌شود
+                cacheable=generation_kwargs['seed'] is not None, kind='gpu',
+                intermediate_files={'design_image': '04_ai_generated.png'}
+            ),
+            Stage(
+                'quantize_colors',
+                partial(self._stage_quantize_colors, custom_palette=custom_palette, strip_rows=strip_rows,
+                        **quantize_options),
+                inputs=('design_image',), outputs=('quantized_image', 'palette'),
+                title="کاهش رنگ‌ها", enabled=bool(run_config.get('quantize_colors')),
+                passthrough={'quantized_image': 'design_image'},
+                config_slice=quantize_config_slice, cacheable=True,
+                intermediate_files={'quantized_image': '05_quantized.png'}
+            ),
+            Stage(
+                'cleanup_speckles', partial(self._stage_cleanup_speckles, **speckle_options),
+                inputs=('quantized_image',), outputs=('clean_image',),
+                title="پاک‌سازی گره‌های منفرد",
+                enabled=bool(run_config.get('quantize_colors')) and bool(speckle_config.get('enable', False)),
+                passthrough={'clean_image': 'quantized_image'},
+                config_slice=speckle_options, cacheable=True,
+                intermediate_files={'clean_image': '05_speckle_cleaned.png'}
+            ),
+            Stage(
+                'save_color_info',
+                partial(self._stage_save_color_info, output_path=output_path, save_intermediate=save_intermediate),
+                inputs=('palette',), outputs=('color_info_path',),
+                enabled=bool(run_config.get('quantize_colors')), is_step=False
+            ),
+            Stage(
+                'apply_symmetry',
+                partial(self._stage_apply_symmetry, canvas_size=(width_px, height_px),
+                        background_color=background_color, output_path=output_path,
+                        save_intermediate=save_intermediate),
+                inputs=('clean_image',), outputs=('layout_image',),
+                title="ایجاد تقارن و چیدمان",
+                enabled=bool(run_config.get('apply_symmetry')) and not run_config.get('is_full_design'),
+                passthrough={'layout_image': 'clean_image'},
+                config_slice={'canvas_size': [width_px, height_px], 'background_color': list(background_color)},
+                skip_message="ℹ️ مرحله تقارن و چیدمان رد شد (ورودی یک طرح کامل است)." if run_config.get('is_full_design') else None,
+                intermediate_files={'layout_image': '07_medallion_layout.png'}
+            ),
+            Stage(
+                'save_final', partial(self._stage_save_final, output_path=output_path, strip_rows=strip_rows),
+                inputs=('layout_image',), outputs=('final_png',), is_step=False
+            ),
+            Stage(
+                'export_weaving_chart',
+                partial(self._stage_export_weaving_chart, output_path=output_path, chart_format=chart_format,
+                        strip_rows=strip_rows),
+                inputs=('layout_image',), outputs=('chart_paths',),
+                enabled=bool(chart_config.get('enable', False)), is_step=False,
+                config_slice={'format': chart_format}
+            ),
+            Stage(
+                'export_chart_pdf',
+                partial(self._stage_export_chart_pdf, output_path=output_path, knots_per_page=knots_per_page),
+                inputs=('layout_image',), outputs=('chart_pdf_path',),
+                enabled=bool(chart_pdf_config.get('enable', False)), is_step=False,
+                config_slice={'knots_per_page': knots_per_page}
+            ),
+            Stage(
+                'vectorize', partial(self._stage_vectorize, output_path=output_path, vector_kwargs=vector_kwargs,
+                                     vector_mode=vector_mode, vector_workers=vector_workers,
+                                     svg_optimize=svg_optimize),
+                inputs=('layout_image',), outputs=('svg_path', 'pdf_path'),
+                title="وکتوری‌سازی", enabled=bool(run_config.get('vectorize')), optional=True,
+                config_slice={**vector_kwargs, 'mode': vector_mode, 'svg_optimize': svg_optimize}
+            ),
+            Stage(
+                'save_specs', partial(self._stage_save_specs, output_path=output_path, strip_rows=strip_rows),
+                inputs=('layout_image',), outputs=('specs_path',),
+                enabled=bool(self.carpet_specs), is_step=False,
+                config_slice={'carpet_specs': self.carpet_specs, 'yarn_estimate': self.config['output'].get('yarn_estimate', {})}
+            ),
+        ]
+        return StageGraph(stages)
+
+    def process_image(self, input_image, output_dir='output', run_config=None, cancel_event=None, log_callback=print, progress_callback=None, resume_dir=None, run_name=None, phase=None, metrics_callback=None):
+        """
+        اجرای کامل پایپلاین روی یک تصویر.
+        در صورت تعیین resume_dir، اجرا در همان پوشه ادامه می‌یابد و مراحلی که قبلاً
+        با تنظیمات یکسان کامل شده‌اند، به جای اجرای مجدد از آرتیفکت‌های ذخیره‌شده بازیابی می‌شوند.
+        run_name نام پوشه خروجی این اجرا را تعیین می‌کند (پیش‌فرض: زمان فعلی).
+        با phase='gpu' فقط مراحل GPU و مراحل بالادستی آن‌ها اجرا می‌شوند؛ ادامه کار (مراحل CPU)
+        با یک فراخوانی دیگر و resume_dir روی همان پوشه انجام می‌شود.
+        معیارهای زمان و حافظه هر مرحله در results['metrics'] و فایل metrics.json ذخیره می‌شوند
+        و در صورت تعیین metrics_callback، به صورت رویداد (دیکشنری قابل تبدیل به JSON) نیز ارسال می‌شوند.
+        """
         self.log_callback = log_callback
         self.progress_callback = progress_callback
-        
-        total_steps = sum(1 for step in [
-            'remove_background', 'detect_edges', 'generate_design', 
-            'quantize_colors', 'apply_symmetry', 'vectorize'
-        ] if run_config.get(step))
-        current_step = 0
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = os.path.join(output_dir, timestamp)
+        run_config = run_config or {}
+
+        if resume_dir:
+            output_path = resume_dir
+            self.log_callback(f"♻️ ازسرگیری اجرای قبلی در پوشه: {output_path}\n")
+        else:
+            run_name = run_name or datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(output_dir, run_name)
+            self.log_callback(f"📁 پوشه خروجی برای این اجرا: {output_path}\n")
         os.makedirs(output_path, exist_ok=True)
-        self.log_callback(f"📁 پوشه خروجی برای این اجرا: {output_path}\n")
+        self.last_output_path = output_path
         self._check_for_cancel(cancel_event)
         image = input_image.copy()
         self.log_callback(f"📷 تصویر ورودی با ابعاد {image.width}x{image.height} دریافت شد.")
+        run_start = time.perf_counter()
+        self.stage_cache.reset_counters()
         results = {'original': image, 'output_path': output_path}
-        self.log_callback("\n" + "="*40 + "\nمرحله ۰: محاسبه ابعاد نقشه گره\n" + "="*40)
-        spec = self.carpet_specs
-        width_px = int((spec['width_cm'] / 10) * spec['shaneh'])
-        height_px = int((spec['height_cm'] / 10) * spec['tar'])
+
+        graph = self.build_stage_graph(run_config, output_path)
+        store = ArtifactStore(output_path)
+        # در حالت نواری تصاویر RGB تمام‌وضوح (knot_image، foreground_image، design_image و ...) پس از آخرین
+        # مرحله مصرف‌کننده از حافظه رها می‌شوند تا همزمان فقط ورودی و خروجی یک مرحله در حافظه باشد
+        keep = {'final_png', 'svg_path', 'pdf_path'} if self._strip_rows(*self._knot_map_size()) else None
+        save_intermediate = run_config.get('save_intermediate')
+        stage_names = graph.upstream_closure('gpu') if phase == 'gpu' else None
+        total_steps = sum(1 for stage in graph.stages if stage.is_step and stage.enabled
+                          and (stage_names is None or stage.name in stage_names))
+        step_counter = {'current': 0}
+        step_lock = threading.Lock()
+
+        def on_stage_start(stage, source):
+            if source == 'skip':
+                if stage.skip_message:
+                    self.log_callback("\n" + "="*40 + f"\n{stage.skip_message}\n" + "="*40)
+                return
+            if stage.is_step:
+                with step_lock:
+                    step_counter['current'] += 1
+                    current_step = step_counter['current']
+                self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: {stage.title}\n" + "="*40)
+                self._update_progress(current_step, total_steps, cancel_event)
+            else:
+                if stage.title:
+                    self.log_callback("\n" + "="*40 + f"\n{stage.title}\n" + "="*40)
+                self._check_for_cancel(cancel_event)
+            if source == 'resume':
+                self.log_callback(f"♻️ خروجی مرحله '{stage.name}' از اجرای قبلی بازیابی شد.")
+            elif source == 'cache':
+                self.log_callback(f"📦 خروجی مرحله '{stage.name}' از کش بارگذاری شد.")
+
+        def on_stage_done(stage, outputs):
+            if save_intermediate and stage.enabled:
+                store.copy_intermediate_files(stage, output_path)
+
+        def on_stage_metrics(stage, stage_metrics):
+            if metrics_callback:
+                metrics_callback(dict(stage_metrics, event='stage_metrics', output_path=output_path))
+
+        status = 'failed'
+        try:
+            artifacts = graph.execute(
+                {'original': image},
+                store=store,
+                cache=self.stage_cache,
+                max_workers=self.MAX_PARALLEL_STAGES,
+                on_stage_start=on_stage_start,
+                on_stage_done=on_stage_done,
+                use_cache=run_config.get('use_cache', True),
+                stage_names=stage_names,
+                on_stage_metrics=on_stage_metrics,
+                keep=keep
+            )
+            status = 'ok'
+        except ProcessingCancelledError:
+            status = 'cancelled'
+            self.log_callback(f"ℹ️ مراحل تکمیل‌شده ذخیره شدند؛ برای ادامه، اجرا را از پوشه '{output_path}' ازسرگیری کنید.")
+            raise
+        finally:
+            results['metrics'] = self._write_metrics(graph, output_path, run_start, status, phase, metrics_callback)
+
+        if self.stage_cache.enabled and run_config.get('use_cache', True):
+            cache_stats = self.stage_cache.stats()
+            results['cache_stats'] = cache_stats
+            self.log_callback(f"📦 آمار کش مراحل: {cache_stats['hits']} بازیابی موفق (hit)، {cache_stats['misses']} محاسبه جدید (miss).")
+
+        if graph.failures:
+            results['failed_stages'] = list(graph.failures)
+            self.log_callback(f"⚠️ مراحل اختیاری {', '.join(graph.failures)} ناموفق بودند؛ سایر خروجی‌ها ذخیره شدند و "
+                              f"ازسرگیری اجرا از پوشه '{output_path}' فقط همین مراحل را دوباره اجرا می‌کند.")
+
+        if phase == 'gpu':
+            return results
+
+        results['final_png'] = artifacts['final_png']
+        for key in ('svg_path', 'pdf_path'):
+            if artifacts.get(key):
+                results[key] = artifacts[key]
+
+        return results
+
+    def _stage_knot_resize(self, original, size, strip_rows):
+        width_px, height_px = size
         self.log_callback(f"   - ابعاد محاسبه شده برای دستگاه: {width_px} x {height_px} پیکسل (گره)")
-        image = image.resize((width_px, height_px), Image.LANCZOS)
+        if strip_rows:
+            self.log_callback(f"   - حالت پردازش نواری فعال است: نوارهای {strip_rows} سطری.")
+            image = resize_in_strips(original, (width_px, height_px), strip_rows)
+        else:
+            image = original.resize((width_px, height_px), Image.LANCZOS)
         self.log_callback("   - تصویر ورودی به ابعاد نقشه گره تغییر اندازه یافت.")
-        if run_config.get('save_intermediate'):
-            image.save(os.path.join(output_path, '01_knot_resolution.png'))
-
-        processed_image = image
-        if run_config.get('remove_background'):
-            current_step += 1
-            self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: حذف پس‌زمینه با SAM\n" + "="*40)
-            self._update_progress(current_step, total_steps, cancel_event)
-            sam_model = self._lazy_load_sam()
-            main_mask = sam_model.extract_main_object(image, fast_mode=run_config.get('sam_fast_mode', False))
-            if main_mask is not None:
-                processed_image = sam_model.apply_mask_to_image(image, main_mask)
-                if run_config.get('save_intermediate'):
-                    processed_image.save(os.path.join(output_path, '02_background_removed.png'))
-                self.log_callback("✅ پس‌زمینه با موفقیت حذف شد.")
+        return {'knot_image': image}
+
+    def _stage_remove_background(self, knot_image, fast_mode, strip_rows):
+        sam_model = self._lazy_load_sam()
+        main_mask = sam_model.extract_main_object(knot_image, fast_mode=fast_mode)
+        if main_mask is None:
+            self.log_callback("⚠️ هیچ شیء غالبی یافت نشد. از تصویر اصلی استفاده می‌شود.")
+            return {'foreground_image': knot_image, 'mask': None}
+        foreground_image = sam_model.apply_mask_to_image(knot_image, main_mask, strip_rows=strip_rows)
+        self.log_callback("✅ پس‌زمینه با موفقیت حذف شد.")
+        return {'foreground_image': foreground_image, 'mask': main_mask}
+
+    def _stage_detect_edges(self, foreground_image):
+        edge_model = self._lazy_load_edge_detector()
+        edges = edge_model.detect_edges(foreground_image)
+        refined_edges = Image.fromarray(edge_model.refine_edges(edges, kernel_size=3))
+        self.log_callback("✅ لبه‌ها با موفقیت تشخیص داده شدند.")
+        return {'edges': refined_edges}
+
+    def _stage_generate_design(self, foreground_image, edges, base_model_path, controlnet_path, generation_kwargs):
+        if not base_model_path or not controlnet_path:
+            self.log_callback("❌ مدل پایه یا مدل کنترل مشخص نشده است. این مرحله رد می‌شود.")
+            return {'design_image': foreground_image}
+
+        # با چند ControlNet (MultiControlNet) هر کدام تصویر کنترل خود را می‌گیرد
+        controlnet_paths = list(controlnet_path) if isinstance(controlnet_path, (list, tuple)) else [controlnet_path]
+        control_images = []
+        for path in controlnet_paths:
+            if 'tile' in path.lower():
+                self.log_callback("ℹ️ از حالت ControlNet-Tile استفاده می‌شود. تصویر اصلی به عنوان ورودی کنترل خواهد بود.")
+                control_images.append(foreground_image)
+            elif edges:
+                control_images.append(edges)
             else:
-                self.log_callback("⚠️ هیچ شیء غالبی یافت نشد. از تصویر اصلی استفاده می‌شود.")
-
-        refined_edges = None
-        if run_config.get('detect_edges'):
-            current_step += 1
-            self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: تشخیص لبه‌ها\n" + "="*40)
-            self._update_progress(current_step, total_steps, cancel_event)
-            edge_model = self._lazy_load_edge_detector()
-            edges = edge_model.detect_edges(processed_image)
-            refined_edges_np = edge_model.refine_edges(edges, kernel_size=3)
-            refined_edges = Image.fromarray(refined_edges_np)
-            if run_config.get('save_intermediate'):
-                refined_edges.save(os.path.join(output_path, '03_edges.png'))
-            self.log_callback("✅ لبه‌ها با موفقیت تشخیص داده شدند.")
-            
-        working_image = processed_image
-        if run_config.get('generate_design'):
-            current_step += 1
-            self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: تولید طرح فرش با AI\n" + "="*40)
-            self._update_progress(current_step, total_steps, cancel_event)
-            
-            base_model_path = run_config.get('base_model_path')
-            controlnet_path = run_config.get('controlnet_path')
-
-            if not base_model_path or not controlnet_path:
-                self.log_callback("❌ مدل پایه یا مدل کنترل مشخص نشده است. این مرحله رد می‌شود.")
+                self.log_callback("⚠️ تیک 'تشخیص لبه' فعال نیست. ورودی برای این مدل کنترل وجود ندارد. این مرحله رد می‌شود.")
+                return {'design_image': foreground_image}
+
+        controlnet_model = self._lazy_load_controlnet(base_model_path, controlnet_paths)
+        generated_images = controlnet_model.generate(
+            control_image=control_images[0] if len(control_images) == 1 else control_images, **generation_kwargs
+        )
+        self.log_callback("✅ طرح جدید با هوش مصنوعی تولید شد.")
+        if self.prompt_cache is not None:
+            stats = self.prompt_cache.stats
+            self.log_callback(f"🧠 آمار کش embedding پرامپت‌ها: {stats['hits']} بازیابی از حافظه، "
+                              f"{stats['disk_hits']} بازیابی از دیسک، {stats['misses']} کدگذاری جدید.")
+        return {'design_image': generated_images[0]}
+
+    def _stage_quantize_colors(self, design_image, custom_palette, strip_rows, dither, distance_metric, lut_bins):
+        # Floyd-Steinberg با پیاده‌سازی C کتابخانه PIL و سایر روش‌ها با LUT و ماژول dithering
+        pil_dither = dither == 'floyd_steinberg'
+        if not pil_dither:
+            self.color_quantizer.palette_mapper = PaletteMapper(bins=lut_bins, metric=distance_metric)
+            self.log_callback(f"   - نگاشت با LUT ({lut_bins}³، فاصله {distance_metric})، دیترینگ: {dither}.")
+        if custom_palette is not None:
+            self.log_callback(f"🎨 استفاده از پالت رنگی سفارشی با {len(custom_palette)} رنگ.")
+            if pil_dither:
+                quantized_image, palette = self.color_quantizer.apply_palette_with_dithering(
+                    design_image, custom_palette, strip_rows=strip_rows, indexed=True
+                )
             else:
-                control_image_for_ai = None
-                if 'tile' in controlnet_path.lower():
-                    self.log_callback("ℹ️ از حالت ControlNet-Tile استفاده می‌شود. تصویر اصلی به عنوان ورودی کنترل خواهد بود.")
-                    control_image_for_ai = processed_image
-                else:
-                    if refined_edges:
-                        control_image_for_ai = refined_edges
-                    else:
-                        self.log_callback("⚠️ تیک 'تشخیص لبه' فعال نیست. ورودی برای این مدل کنترل وجود ندارد. این مرحله رد می‌شود.")
-
-                if control_image_for_ai:
-                    controlnet_model = self._lazy_load_controlnet(base_model_path, controlnet_path)
-                    gen_config = self.config['generation']
-                    enhanced_prompt = gen_config['prompts']['positive']
-                    if self.carpet_specs:
-                        enhanced_prompt += f", carpet design for {self.carpet_specs['width_cm']}x{self.carpet_specs['height_cm']}cm, {self.carpet_specs['shaneh']} raj density"
-                    
-                    output_width, output_height = width_px, height_px
-
-                    generated_images = controlnet_model.generate(
-                        control_image=control_image_for_ai,
-                        prompt=enhanced_prompt,
-                        negative_prompt=gen_config['prompts']['negative'],
-                        num_inference_steps=gen_config['steps'],
-                        guidance_scale=gen_config['guidance_scale'],
-                        controlnet_conditioning_scale=gen_config['controlnet_scale'],
-                        seed=gen_config['seed'] if gen_config['seed'] != -1 else None,
-                        width=output_width,
-                        height=output_height
-                    )
-                    working_image = generated_images[0]
-                    if run_config.get('save_intermediate'):
-                        working_image.save(os.path.join(output_path, '04_ai_generated.png'))
-                    self.log_callback("✅ طرح جدید با هوش مصنوعی تولید شد.")
-        
-        if run_config.get('quantize_colors'):
-            current_step += 1
-            self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: کاهش رنگ‌ها\n" + "="*40)
-            self._update_progress(current_step, total_steps, cancel_event)
-            if self.custom_palette is not None and len(self.custom_palette) > 0:
-                self.log_callback(f"🎨 استفاده از پالت رنگی سفارشی با {len(self.custom_palette)} رنگ.")
-                quantized_image, palette = self.color_quantizer.apply_palette_with_dithering(working_image, self.custom_palette)
+                quantized_image, palette = self.color_quantizer.apply_palette(
+                    design_image, custom_palette, strip_rows=strip_rows, indexed=True, dither=dither
+                )
+        else:
+            n_colors = self.config['processing']['color_quantization']['n_colors']
+            self.log_callback(f"🎨 کوانتیزه کردن خودکار به {n_colors} رنگ.")
+            self.color_quantizer.n_colors = n_colors
+            if pil_dither:
+                quantized_image, palette = self.color_quantizer.quantize_with_dithering(
+                    design_image, strip_rows=strip_rows, indexed=True
+                )
             else:
-                n_colors = self.config['processing']['color_quantization']['n_colors']
-                self.log_callback(f"🎨 کوانتیزه کردن خودکار به {n_colors} رنگ.")
-                self.color_quantizer.n_colors = n_colors
-                quantized_image, palette = self.color_quantizer.quantize_with_dithering(working_image)
-            
+                quantized_image, palette = self.color_quantizer.quantize(
+                    design_image, strip_rows=strip_rows, indexed=True, dither=dither
+                )
+        # خروجی نقشه گره اندیس‌دار (مد 'P') است و تا ذخیره نهایی پالت‌دار باقی می‌ماند
+        self.log_callback("✅ رنگ‌های تصویر با موفقیت کاهش یافت.")
+        return {'quantized_image': quantized_image, 'palette': palette}
+
+    def _stage_cleanup_speckles(self, quantized_image, min_knots, connectivity, max_passes):
+        cleaner = SpeckleCleaner(min_knots=min_knots, connectivity=connectivity, max_passes=max_passes)
+        clean_image, stats = cleaner.clean(quantized_image)
+        self.log_callback(
+            f"✅ {stats['islands_merged']} جزیره کوچک‌تر از {min_knots} گره ({stats['knots_changed']} گره) "
+            f"در {stats['passes']} گذر با رنگ غالب همسایه ادغام شد."
+        )
+        return {'clean_image': clean_image}
+
+    def _stage_save_color_info(self, palette, output_path, save_intermediate):
+        if save_intermediate:
             palette_viz = self.color_quantizer.create_palette_visualization(palette)
-            
-            if run_config.get('save_intermediate'):
-                quantized_image.save(os.path.join(output_path, '05_quantized.png'))
-                palette_viz.save(os.path.join(output_path, '05_palette.png'))
-            self.save_color_info(palette, output_path)
-            working_image = quantized_image
-            self.log_callback("✅ رنگ‌های تصویر با موفقیت کاهش یافت.")
-        
-        if run_config.get('apply_symmetry') and not run_config.get('is_full_design'):
-            current_step += 1
-            self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: ایجاد تقارن و چیدمان\n" + "="*40)
-            self._update_progress(current_step, total_steps, cancel_event)
-            four_way = self.symmetry_maker.create_four_way_mirror(working_image)
-            if run_config.get('save_intermediate'):
-                four_way.save(os.path.join(output_path, '06_four_way_symmetry.png'))
-            
-            background_color = tuple(self.config['output'].get('medallion_background_color', [245, 240, 230]))
-            
-            medallion_layout = self.symmetry_maker.create_medallion_layout(
-                center_element=four_way,
-                canvas_size=(width_px, height_px),
-                background_color=background_color
-            )
-            if run_config.get('save_intermediate'):
-                medallion_layout.save(os.path.join(output_path, '07_medallion_layout.png'))
-            working_image = medallion_layout
-            self.log_callback("✅ تقارن و چیدمان مدالیون اعمال شد.")
-        elif run_config.get('is_full_design'):
-             self.log_callback("\n" + "="*40 + "\nℹ️ مرحله تقارن و چیدمان رد شد (ورودی یک طرح کامل است).\n" + "="*40)
-
-        if run_config.get('vectorize'):
-            current_step += 1
-            self.log_callback("\n" + "="*40 + f"\nمرحله {current_step}/{total_steps}: وکتوری‌سازی\n" + "="*40)
-            self._update_progress(current_step, total_steps, cancel_event)
-            try:
+            palette_viz.save(os.path.join(output_path, '05_palette.png'))
+        return {'color_info_path': self.save_color_info(palette, output_path)}
+
+    def _stage_apply_symmetry(self, clean_image, canvas_size, background_color, output_path, save_intermediate):
+        four_way = self.symmetry_maker.create_four_way_mirror(clean_image)
+        if save_intermediate:
+            four_way.save(os.path.join(output_path, '06_four_way_symmetry.png'))
+
+        medallion_layout = self.symmetry_maker.create_medallion_layout(
+            center_element=four_way,
+            canvas_size=canvas_size,
+            background_color=background_color
+        )
+        self.log_callback("✅ تقارن و چیدمان مدالیون اعمال شد.")
+        return {'layout_image': medallion_layout}
+
+    def _stage_save_final(self, layout_image, output_path, strip_rows):
+        final_path = os.path.join(output_path, 'final_design.png')
+        # نقشه اندیس‌دار به صورت PNG پالت‌دار (یک بایت برای هر گره) ذخیره می‌شود
+        if strip_rows:
+            save_png_in_strips(layout_image, final_path, strip_rows)
+        else:
+            layout_image.save(final_path)
+        self.log_callback(f"\n✅ نتیجه نهایی با ابعاد دقیق {layout_image.width}x{layout_image.height} ذخیره شد: {final_path}")
+        return {'final_png': final_path}
+
+    def _stage_export_weaving_chart(self, layout_image, output_path, chart_format, strip_rows):
+        if layout_image.mode != 'P':
+            self.log_callback("⚠️ نقشه رج‌به‌رج فقط برای نقشه‌های اندیس‌دار (با کاهش رنگ) ساخته می‌شود.")
+            return {'chart_paths': []}
+        chart_paths = []
+        for binary in {'binary': (True,), 'text': (False,), 'both': (True, False)}[chart_format]:
+            file_name = 'final_design.wrle' if binary else 'final_design_chart.txt'
+            chart_paths.append(export_weaving_chart(layout_image, os.path.join(output_path, file_name),
+                                                    binary=binary, strip_rows=strip_rows or 1024))
+        self.log_callback(f"   - نقشه رج‌به‌رج ذخیره شد: {', '.join(os.path.basename(p) for p in chart_paths)}")
+        return {'chart_paths': chart_paths}
+
+    def _stage_export_chart_pdf(self, layout_image, output_path, knots_per_page):
+        if layout_image.mode != 'P':
+            self.log_callback("⚠️ جدول گره چاپی فقط برای نقشه‌های اندیس‌دار (با کاهش رنگ) ساخته می‌شود.")
+            return {'chart_pdf_path': None}
+        pdf_path = os.path.join(output_path, 'final_design_chart.pdf')
+        WeavingChartPDF(knots_per_page=knots_per_page).render(layout_image, pdf_path)
+        self.log_callback(f"   - جدول گره چاپی ذخیره شد: {os.path.basename(pdf_path)}")
+        return {'chart_pdf_path': pdf_path}
+
+    def _stage_vectorize(self, layout_image, output_path, vector_kwargs, vector_mode, vector_workers, svg_optimize):
+        # مرحله اختیاری است: خطا به گراف مراحل می‌رسد تا مرحله کامل‌شده ثبت نشود و ازسرگیری آن را دوباره
+        # اجرا کند، ولی سایر خروجی‌های اجرا برگردانده می‌شوند
+        try:
+            # وکتورساز بین اجراها (مثلاً در پردازش دسته‌ای) دوباره ساخته نمی‌شود
+            if self.vectorizer is None:
                 self.vectorizer = Vectorizer(method='vtracer')
-                svg_path = os.path.join(output_path, 'final_design.svg')
-                
-                vector_kwargs = {
-                    'filter_speckle': run_config.get('vector_speckle', 4),
-                    'color_precision': run_config.get('vector_color_precision', 6),
-                    'corner_threshold': run_config.get('vector_corner_threshold', 60)
-                }
-
-                svg_result = self.vectorizer.vectorize(working_image, svg_path, **vector_kwargs)
-                if svg_result:
-                    pdf_path = os.path.join(output_path, 'final_design.pdf')
-                    self.vectorizer.svg_to_pdf(svg_path, pdf_path)
-                    self.log_callback("✅ وکتورسازی با موفقیت انجام شد.")
-            except Exception as e:
-                self.log_callback(f"❌ خطا در وکتورسازی: {e}")
-
-        final_image = working_image
+            svg_path = os.path.join(output_path, 'final_design.svg')
+            svg_result = self.vectorizer.vectorize(layout_image, svg_path, mode=vector_mode,
+                                                   workers=vector_workers or None, **vector_kwargs)
+            if svg_result:
+                raw_render_seconds = None
+                if svg_optimize.get('enable', False):
+                    if svg_optimize.get('compare_render', False):
+                        raw_render_seconds = self._time_svg_render(svg_path)
+                    self._optimize_svg(svg_path, svg_optimize)
+                pdf_path = os.path.join(output_path, 'final_design.pdf')
+                render_start = time.perf_counter()
+                self.vectorizer.svg_to_pdf(svg_path, pdf_path)
+                render_seconds = time.perf_counter() - render_start
+                if raw_render_seconds is not None:
+                    self.log_callback(f"   - زمان تبدیل به PDF: {raw_render_seconds:.2f} ثانیه (SVG خام) → "
+                                      f"{render_seconds:.2f} ثانیه (SVG بهینه‌شده)")
+                else:
+                    self.log_callback(f"   - زمان تبدیل به PDF: {render_seconds:.2f} ثانیه")
+                self.log_callback("✅ وکتورسازی با موفقیت انجام شد.")
+                return {'svg_path': svg_path, 'pdf_path': pdf_path}
+            raise RuntimeError("وکتورساز فایل SVG تولید نکرد.")
+        except Exception as e:
+            self.log_callback(f"❌ خطا در وکتورسازی: {e}")
+            raise
+
+    def _optimize_svg(self, svg_path, options):
+        """بهینه‌سازی درجای SVG (دقت مختصات، ادغام و حذف مسیرها) و در صورت درخواست، ذخیره نسخه .svgz."""
+        optimizer = SVGOptimizer(precision=options.get('precision', 1),
+                                 min_path_area=options.get('min_path_area', 0.0),
+                                 merge_paths=options.get('merge_paths', True))
+        stats = optimizer.optimize(svg_path)
+        self.log_callback(
+            f"   - بهینه‌سازی SVG: {stats['bytes_before'] / 1e6:.2f} → {stats['bytes_after'] / 1e6:.2f} مگابایت، "
+            f"{stats['paths_before']} → {stats['paths_after']} مسیر ({stats['paths_dropped']} مسیر کوچک حذف شد) "
+            f"در {stats['seconds']:.2f} ثانیه"
+        )
+        if options.get('gzip', False):
+            svgz_path = os.path.splitext(svg_path)[0] + '.svgz'
+            with open(svg_path, 'rb') as src, gzip.open(svgz_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            self.log_callback(f"   - نسخه فشرده ذخیره شد: {os.path.basename(svgz_path)} "
+                              f"({os.path.getsize(svgz_path) / 1e6:.2f} مگابایت)")
+        return stats
+
+    def _time_svg_render(self, svg_path):
+        """زمان تبدیل SVG به PDF (برای مقایسه پیش و پس از بهینه‌سازی)؛ در صورت نبود cairosvg، None."""
+        if importlib.util.find_spec('cairosvg') is None:
+            return None
+        with tempfile.TemporaryDirectory() as temp_dir:
+            start = time.perf_counter()
+            try:
+                self.vectorizer.svg_to_pdf(svg_path, os.path.join(temp_dir, 'render.pdf'))
+            except Exception:
+                return None
+            return time.perf_counter() - start
+
+    def _stage_save_specs(self, layout_image, output_path, strip_rows):
+        knot_statistics = None
+        if layout_image is not None and layout_image.mode == 'P':
+            knot_statistics = compute_knot_statistics(layout_image, strip_rows=strip_rows or 2048)
+        return {'specs_path': self.save_carpet_specs(output_path, knot_statistics)}
+
+    def _write_metrics(self, graph, output_path, run_start, status, phase, metrics_callback=None):
+        """
+        ذخیره معیارهای زمان، CPU و حافظه مراحل در metrics.json (برای فاز GPU اجرای دسته‌ای: metrics_gpu.json).
+        """
+        metrics = {
+            'status': status,
+            'phase': phase or 'all',
+            'device': self.device,
+            'knot_map_size': list(self._knot_map_size()),
+            'total_wall_seconds': round(time.perf_counter() - run_start, 4),
+            'process_peak_rss_mb': round(peak_rss_bytes() / (1024 * 1024), 2) if peak_rss_bytes() else None,
+            'stages': list(graph.metrics)
+        }
+        file_name = 'metrics_gpu.json' if phase == 'gpu' else 'metrics.json'
+        metrics_path = os.path.join(output_path, file_name)
+        try:
+            with open(metrics_path, 'w', encoding='utf-8') as f:
+                json.dump(metrics, f, indent=4, ensure_ascii=False)
+        except OSError as e:
+            self.log_callback(f"⚠️ ذخیره فایل {file_name} ممکن نشد: {e}")
+        if metrics_callback:
+            summary = {key: value for key, value in metrics.items() if key != 'stages'}
+            metrics_callback(dict(summary, event='run_metrics', output_path=output_path))
+        return metrics
+
+    # تصاویر اندیس‌دار یک اجرا که با تعویض رنگ به‌روز می‌شوند (نتیجه نهایی و فایل‌های میانی پس از کاهش رنگ)
+    RECOLOR_FILES = ('final_design.png', '05_quantized.png', '05_speckle_cleaned.png', '06_four_way_symmetry.png',
+                     '07_medallion_layout.png')
+
+    def recolor(self, output_path, new_palette, log_callback=print):
+        """
+        تعویض رنگ‌های طرح یک اجرای قبلی بدون اجرای دوباره پایپلاین.
+        نقشه گره اندیس‌دار (final_design.png با مد 'P') بدون تغییر می‌ماند و فقط پالت آن جایگزین می‌شود؛
+        SAM، تشخیص لبه، ControlNet و دیترینگ اجرا نمی‌شوند و زمان آن مستقل از ابعاد نقشه است.
+
+        Args:
+            output_path (str): پوشه خروجی اجرای قبلی.
+            new_palette: پالت جدید هم‌اندازه پالت اجرای قبلی (color_info.json)، یا دیکشنری
+                {اندیس رنگ (از صفر): رنگ} برای تغییر برخی رنگ‌ها.
+
+        Returns:
+            dict: مسیر فایل‌های به‌روزشده و پالت جدید.
+        """
+        self.log_callback = log_callback
         final_path = os.path.join(output_path, 'final_design.png')
-        final_image.save(final_path)
-        results['final_png'] = final_path
-        self.log_callback(f"\n✅ نتیجه نهایی با ابعاد دقیق {final_image.width}x{final_image.height} ذخیره شد: {final_path}")
+        info_path = os.path.join(output_path, 'color_info.json')
+        if not os.path.exists(final_path) or not os.path.exists(info_path):
+            raise FileNotFoundError(f"نتیجه نهایی یا color_info.json در پوشه '{output_path}' یافت نشد.")
+        with open(info_path, 'r', encoding='utf-8') as f:
+            old_palette = np.array([color['rgb'] for color in json.load(f)['palette']], dtype=np.uint8).reshape(-1, 3)
 
-        if self.carpet_specs:
-            self.save_carpet_specs(output_path)
-            
-        return results
+        if isinstance(new_palette, dict):
+            palette = old_palette.copy()
+            for index, color in new_palette.items():
+                if not 0 <= int(index) < len(palette):
+                    raise ValueError(f"اندیس رنگ {index} خارج از پالت {len(palette)} رنگی است.")
+                palette[int(index)] = color
+        else:
+            palette = np.array(new_palette, dtype=np.uint8).reshape(-1, 3)
+            if len(palette) != len(old_palette):
+                raise ValueError(f"پالت جدید باید {len(old_palette)} رنگ داشته باشد، نه {len(palette)}.")
+
+        start = time.perf_counter()
+        updated = {}
+        for file_name in self.RECOLOR_FILES:
+            path = os.path.join(output_path, file_name)
+            if not os.path.exists(path):
+                continue
+            with Image.open(path) as image:
+                if image.mode != 'P':
+                    if file_name == 'final_design.png':
+                        raise ValueError("نقشه گره این اجرا اندیس‌دار نیست (اجرای بدون کاهش رنگ یا نسخه قدیمی‌تر).")
+                    continue
+                file_palette = np.array(image.getpalette(), dtype=np.uint8).reshape(-1, 3)
+            # رنگ‌های اضافه انتهای پالت (مانند پس‌زمینه مدالیون) بدون تغییر می‌مانند
+            file_palette[:len(palette)] = palette
+            updated[file_name] = replace_png_palette(path, file_palette)
+            if file_name == 'final_design.png':
+                final_palette = file_palette
+
+        for chart_name in ('final_design.wrle', 'final_design_chart.txt'):
+            chart_path = os.path.join(output_path, chart_name)
+            if os.path.exists(chart_path):
+                updated[chart_name] = replace_chart_palette(chart_path, final_palette)
+        # جدول گره چاپی رنگ خانه‌ها و راهنمای رنگ‌ها را در خود دارد و از نقشه با پالت جدید دوباره ساخته می‌شود
+        chart_pdf_path = os.path.join(output_path, 'final_design_chart.pdf')
+        if os.path.exists(chart_pdf_path):
+            knots_per_page = self.config['output'].get('chart_pdf', {}).get('knots_per_page', 100)
+            with Image.open(final_path) as image:
+                WeavingChartPDF(knots_per_page=knots_per_page).render(image, chart_pdf_path)
+            updated['final_design_chart.pdf'] = chart_pdf_path
+
+        self.color_quantizer.palette = palette
+        self.color_quantizer.create_palette_visualization(palette).save(os.path.join(output_path, '05_palette.png'))
+        color_info_path = self.save_color_info(palette, output_path)
+        specs_path = self._recolor_carpet_specs(output_path, final_palette)
+        if specs_path:
+            updated['carpet_specifications.json'] = specs_path
+        if any(os.path.exists(os.path.join(output_path, name)) for name in ('final_design.svg', 'final_design.pdf')):
+            self.log_callback("⚠️ فایل‌های وکتور (SVG/PDF) با رنگ‌های جدید به‌روز نشدند؛ برای آن‌ها وکتورسازی را دوباره اجرا کنید.")
+        self.log_callback(f"✅ رنگ‌های طرح در {time.perf_counter() - start:.3f} ثانیه جایگزین شد: {final_path}")
+        return {
+            'output_path': output_path,
+            'final_png': final_path,
+            'color_info_path': color_info_path,
+            'palette': palette,
+            'recolored_files': list(updated.values())
+        }
 
     def save_color_info(self, palette, output_path):
         color_info = {
@@ -285,8 +840,13 @@ class CarpetDesignPipeline:
         with open(info_path, 'w', encoding='utf-8') as f:
             json.dump(color_info, f, indent=4, ensure_ascii=False)
         self.log_callback(f"   - اطلاعات رنگی در فایل color_info.json ذخیره شد.")
+        return info_path
 
-    def save_carpet_specs(self, output_path):
+    def save_carpet_specs(self, output_path, knot_statistics=None):
+        """
+        ذخیره مشخصات فنی فرش در JSON و TXT. با knot_statistics (خروجی compute_knot_statistics)،
+        تعداد گره و برآورد وزن نخ هر رنگ و تعداد تعویض رنگ در هر رج نیز ذخیره می‌شود.
+        """
         if not self.carpet_specs:
             return
 
@@ -301,7 +861,20 @@ class CarpetDesignPipeline:
             'weaving': { 'shaneh_per_10cm': self.carpet_specs['shaneh'], 'tar_per_10cm': self.carpet_specs['tar'], 'density_per_dm2': int(density), 'density_per_m2': int(density * 100), 'raj': self.carpet_specs['shaneh'] },
             'production_estimate': { 'area_m2': round(area_m2, 2), 'total_knots': int(total_knots) }
         }
-        
+        if knot_statistics:
+            yarn_config = self.config['output'].get('yarn_estimate', {})
+            specs['production_estimate']['yarn_total_grams'] = estimate_yarn(
+                knot_statistics['colors'], area_m2,
+                yarn_config.get('pile_grams_per_m2', 3000), yarn_config.get('waste_percent', 5)
+            )
+            specs['colors'] = knot_statistics['colors']
+            specs['rows'] = knot_statistics['rows']
+        specs_path_json = self._write_carpet_specs(specs, output_path)
+        self.log_callback(f"   - مشخصات فرش در فایل‌های JSON و TXT ذخیره شد.")
+        return specs_path_json
+
+    def _write_carpet_specs(self, specs, output_path):
+        """نوشتن دیکشنری مشخصات فرش در carpet_specifications.json و متن خوانای آن در carpet_specifications.txt."""
         specs_path_json = os.path.join(output_path, 'carpet_specifications.json')
         with open(specs_path_json, 'w', encoding='utf-8') as f:
             json.dump(specs, f, indent=4, ensure_ascii=False)
@@ -319,5 +892,29 @@ class CarpetDesignPipeline:
             f.write(f"  - تراکم کل: {specs['weaving']['density_per_m2']} گره در متر مربع\n\n")
             f.write(f"برآورد تولید:\n")
             f.write(f"  - تعداد کل گره‌ها: {specs['production_estimate']['total_knots']:,}\n")
+            if 'colors' in specs:
+                rows = specs['rows']
+                f.write(f"  - وزن کل نخ پرز (با دورریز): {specs['production_estimate']['yarn_total_grams'] / 1000:.2f} کیلوگرم\n\n")
+                f.write(f"رنگ‌ها:\n")
+                for color in specs['colors']:
+                    f.write(f"  {color['index']:>3}. {color['hex']}  {color['knots']:>12,} گره  {color['percent']:6.2f}%  {color['yarn_grams']:>10,.1f} گرم\n")
+                f.write(f"\nتعویض رنگ در رج‌ها:\n")
+                f.write(f"  - مجموع: {rows['total_color_changes']:,}\n")
+                f.write(f"  - میانگین هر رج: {rows['mean_changes_per_row']}\n")
+                f.write(f"  - بیشترین: {rows['max_changes_per_row']} (رج {rows['busiest_row']})\n")
+        return specs_path_json
 
-        self.log_callback(f"   - مشخصات فرش در فایل‌های JSON و TXT ذخیره شد.")
\ No newline at end of file
+    def _recolor_carpet_specs(self, output_path, palette):
+        """به‌روزرسانی rgb و hex رنگ‌های مشخصات فرش (اندیس‌ها و تعداد گره‌ها با تعویض پالت تغییر نمی‌کنند)."""
+        specs_path = os.path.join(output_path, 'carpet_specifications.json')
+        if not os.path.exists(specs_path):
+            return None
+        with open(specs_path, 'r', encoding='utf-8') as f:
+            specs = json.load(f)
+        if 'colors' not in specs:
+            return None
+        for color in specs['colors']:
+            rgb = palette[color['index'] - 1]
+            color['rgb'] = list(map(int, rgb))
+            color['hex'] = '#%02x%02x%02x' % tuple(map(int, rgb))
+        return self._write_carpet_specs(specs, output_path)
\ No newline at end of file
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import copy
+import json
+import time
+import uuid
+import heapq
+import base64
+import threading
+import itertools
+import numpy as np
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+from .carpet_pipeline import ProcessingCancelledError
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+def _merge_config(base, overrides):
+    """ادغام بازگشتی تنظیمات جزئی یک کار روی کپی کانفیگ پایه."""
+    merged = copy.deepcopy(base)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class Job:
+    """
+    یک کار پردازشی در صف سرویس به همراه رویدادهای لاگ و پیشرفت آن.
+    فقط MAX_EVENTS رویداد آخر نگه داشته می‌شود؛ شماره رویدادها (seq) پس از حذف رویدادهای قدیمی تغییر نمی‌کند.
+    """
+    MAX_EVENTS = 1000
+
+    def __init__(self, input_image, run_config, priority=0, carpet_specs=None, custom_palette=None,
+                 config_overrides=None, run_name=None, source=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.input_image = input_image
+        self.run_config = run_config or {}
+        self.priority = priority
+        self.carpet_specs = carpet_specs
+        self.custom_palette = custom_palette
+        self.config_overrides = config_overrides or {}
+        self.run_name = run_name
+        self.source = source
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.seconds = None
+        self.progress = {'current': 0, 'total': 0}
+        self.result = None
+        self.error = None
+        self.output_path = None
+        self.cancel_event = threading.Event()
+        self.events = []
+        # شماره اولین رویداد نگه‌داشته‌شده در events
+        self._first_seq = 0
+        self._condition = threading.Condition()
+
+    @property
+    def event_count(self):
+        """تعداد کل رویدادهای ثبت‌شده (شماره رویداد بعدی)."""
+        return self._first_seq + len(self.events)
+
+    def add_event(self, event_type, **data):
+        with self._condition:
+            event = {'seq': self.event_count, 'time': time.time(), 'type': event_type}
+            event.update(data)
+            self.events.append(event)
+            if len(self.events) > self.MAX_EVENTS:
+                dropped = len(self.events) - self.MAX_EVENTS
+                del self.events[:dropped]
+                self._first_seq += dropped
+            self._condition.notify_all()
+
+    def wait_events(self, since, timeout=None):
+        """
+        رویدادهای با شماره بزرگ‌تر یا مساوی since؛ در صورت نبود رویداد جدید تا timeout ثانیه منتظر می‌ماند.
+        رویدادهای حذف‌شده (قدیمی‌تر از MAX_EVENTS رویداد آخر) برگردانده نمی‌شوند.
+        """
+        with self._condition:
+            if self.event_count <= since and self.status not in FINISHED_STATES:
+                self._condition.wait(timeout)
+            return self.events[max(0, since - self._first_seq):]
+
+    def set_status(self, status, **data):
+        with self._condition:
+            self.status = status
+            self.add_event('status', status=status, **data)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'source': self.source,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'seconds': self.seconds,
+            'progress': self.progress,
+            'output_path': self.output_path,
+            'result': self.result,
+            'error': self.error,
+            'events': self.event_count,
+        }
+
+
+class JobService:
+    """
+    سرویس صف کار که یک نمونه گرم از CarpetDesignPipeline را نگه می‌دارد.
+    کارها بر اساس اولویت (عدد بزرگ‌تر = زودتر) و سپس ترتیب ورود، یکی‌یکی اجرا می‌شوند
+    تا مدل‌های بارگذاری‌شده بین کاربران مختلف به اشتراک گذاشته شوند.
+    از کارهای پایان‌یافته فقط max_finished_jobs کار آخر نگه داشته می‌شود.
+    """
+    DEFAULT_CARPET_SPECS = {'width_cm': 200, 'height_cm': 300, 'shaneh': 50, 'tar': 12}
+
+    def __init__(self, pipeline, output_dir, log_callback=print, default_carpet_specs=None, max_finished_jobs=200):
+        self.pipeline = pipeline
+        self.output_dir = output_dir
+        self.log_callback = log_callback
+        self.max_finished_jobs = max_finished_jobs
+        self.default_carpet_specs = default_carpet_specs or dict(self.DEFAULT_CARPET_SPECS)
+        self.base_config = copy.deepcopy(pipeline.config)
+        self.jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._worker_loop, name='carpet-job-worker', daemon=True)
+        self._worker.start()
+
+    def submit(self, input_image, run_config, priority=0, **job_options):
+        job = Job(input_image, run_config, priority=priority, **job_options)
+        with self._condition:
+            self.jobs[job.id] = job
+            heapq.heappush(self._heap, (-priority, next(self._counter), job.id))
+            job.add_event('status', status=JOB_QUEUED, position=len(self._heap))
+            self._condition.notify()
+        self.log_callback(f"📥 کار '{job.id}' با اولویت {priority} در صف قرار گرفت.")
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        # ریسمان کارگر کارهای قدیمی را همزمان حذف می‌کند؛ فهرست زیر قفل کپی می‌شود
+        with self._condition:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def job_count(self):
+        with self._condition:
+            return len(self.jobs)
+
+    def cancel(self, job_id):
+        """
+        لغو یک کار: کار در صف مستقیماً لغو می‌شود و کار در حال اجرا از طریق cancel_event
+        در ابتدای مرحله بعدی متوقف می‌شود.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel_event.set()
+        with self._condition:
+            if job.status == JOB_QUEUED:
+                job.finished_at = datetime.now().isoformat()
+                job.input_image = None
+                job.set_status(JOB_CANCELLED)
+                self._prune_finished()
+        self.log_callback(f"🛑 درخواست لغو کار '{job_id}' ثبت شد.")
+        return job
+
+    def queue_length(self):
+        with self._condition:
+            return sum(1 for _, _, job_id in self._heap
+                       if job_id in self.jobs and self.jobs[job_id].status == JOB_QUEUED)
+
+    def _prune_finished(self):
+        """حذف قدیمی‌ترین کارهای پایان‌یافته فراتر از max_finished_jobs (فراخوانی با قفل _condition)."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if job.status == JOB_RUNNING:
+                job.cancel_event.set()
+        self._worker.join()
+
+    def _next_job(self):
+        with self._condition:
+            while not self._stopped:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self.jobs.get(job_id)
+                    if job is not None and job.status == JOB_QUEUED:
+                        job.started_at = datetime.now().isoformat()
+                        job.set_status(JOB_RUNNING)
+                        return job
+                self._condition.wait()
+            return None
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run_job(job)
+
+    def _run_job(self, job):
+        def log(message):
+            self.log_callback(f"[{job.id}] {message}")
+            job.add_event('log', message=message)
+
+        def progress(current, total):
+            job.progress = {'current': current, 'total': total}
+            job.add_event('progress', current=current, total=total)
+
+        def metrics(event):
+            job.add_event('metrics', **event)
+
+        self.pipeline.config = _merge_config(self.base_config, job.config_overrides)
+        self.pipeline.carpet_specs = {**self.default_carpet_specs, **(job.carpet_specs or {})}
+        self.pipeline.custom_palette = np.array(job.custom_palette) if job.custom_palette else None
+        self.pipeline.last_output_path = None
+
+        start = time.perf_counter()
+        try:
+            results = self.pipeline.process_image(
+                input_image=job.input_image,
+                output_dir=self.output_dir,
+                run_config=job.run_config,
+                cancel_event=job.cancel_event,
+                log_callback=log,
+                progress_callback=progress,
+                metrics_callback=metrics,
+                run_name=job.run_name or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job.id}"
+            )
+            job.result = {key: results[key] for key in ('output_path', 'final_png', 'svg_path', 'pdf_path', 'failed_stages')
+                          if results.get(key)}
+            status = JOB_DONE
+        except ProcessingCancelledError:
+            status = JOB_CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            log(f"❌ خطا در پردازش کار: {e}")
+            status = JOB_FAILED
+        finally:
+            self.pipeline.config = self.base_config
+
+        job.output_path = self.pipeline.last_output_path
+        job.seconds = round(time.perf_counter() - start, 3)
+        job.finished_at = datetime.now().isoformat()
+        # تصویر ورودی پس از پایان کار دیگر لازم نیست
+        job.input_image = None
+        job.set_status(status, seconds=job.seconds)
+        with self._condition:
+            self._prune_finished()
+        self.log_callback(f"🏁 کار '{job.id}' با وضعیت '{status}' در {job.seconds:.1f} ثانیه پایان یافت.")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    API محلی سرویس (JSON):
+        GET  /health                  وضعیت سرویس و طول صف
+        GET  /jobs                    فهرست کارها
+        POST /jobs                    ثبت کار جدید
+        GET  /jobs/<id>               وضعیت یک کار
+        GET  /jobs/<id>/events        جریان رویدادها (NDJSON) تا پایان کار؛ با ?since=N از رویداد N
+        POST /jobs/<id>/cancel        لغو کار
+    """
+    service = None
+    # حداکثر زمان انتظار برای رویداد جدید پیش از ارسال یک خط heartbeat
+    EVENT_POLL_SECONDS = 15
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json({'error': message}, status=status)
+
+    def _path_parts(self):
+        return [part for part in urlparse(self.path).path.split('/') if part]
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ['health']:
+            return self._send_json({'status': 'ok', 'queued': self.service.queue_length(),
+                                    'jobs': self.service.job_count()})
+        if parts == ['jobs']:
+            return self._send_json({'jobs': self.service.list_jobs()})
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_error(404, f"کار '{parts[1]}' یافت نشد.")
+            if len(parts) == 2:
+                return self._send_json(job.to_dict())
+            if parts[2] == 'events':
+                return self._stream_events(job)
+        self._send_error(404, 'مسیر نامعتبر است.')
+
+    def do_POST(self):
+        parts = self._path_parts()
+        if parts == ['jobs']:
+            return self._submit_job()
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job = self.service.cancel(parts[1])
+            if job is None:
+                return self._send_error(404, f"کار '{parts[1]}' یافت نشد.")
+            return self._send_json(job.to_dict())
+        self._send_error(404, 'مسیر نامعتبر است.')
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def _submit_job(self):
+        """
+        بدنه درخواست:
+            input_path یا image_base64: تصویر ورودی (مسیر روی ماشین سرویس یا محتوای base64)
+            run_config: همان دیکشنری get_run_config در رابط گرافیکی
+            priority: اولویت کار (پیش‌فرض ۰)
+            carpet_specs، custom_palette، config_overrides، run_name: اختیاری
+        """
+        try:
+            request = self._read_json()
+            if not isinstance(request, dict):
+                return self._send_error(400, "بدنه درخواست باید یک شیء JSON باشد.")
+            if request.get('image_base64'):
+                image_bytes = base64.b64decode(request['image_base64'])
+                with Image.open(io.BytesIO(image_bytes)) as img:
+                    input_image = img.convert('RGB')
+                source = 'upload'
+            elif request.get('input_path'):
+                if not os.path.exists(request['input_path']):
+                    return self._send_error(400, f"فایل ورودی یافت نشد: {request['input_path']}")
+                with Image.open(request['input_path']) as img:
+                    input_image = img.convert('RGB')
+                source = request['input_path']
+            else:
+                return self._send_error(400, "یکی از فیلدهای 'input_path' یا 'image_base64' الزامی است.")
+            job = self.service.submit(
+                input_image,
+                request.get('run_config') or {},
+                priority=int(request.get('priority', 0)),
+                carpet_specs=request.get('carpet_specs'),
+                custom_palette=request.get('custom_palette'),
+                config_overrides=request.get('config_overrides'),
+                run_name=request.get('run_name'),
+                source=source
+            )
+        except (ValueError, TypeError, OSError) as e:
+            return self._send_error(400, f"درخواست نامعتبر: {e}")
+        self._send_json(job.to_dict(), status=201)
+
+    def _stream_events(self, job):
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            since = int(query.get('since', ['0'])[0])
+        except ValueError:
+            return self._send_error(400, "مقدار 'since' باید عدد صحیح باشد.")
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            while True:
+                events = job.wait_events(since, timeout=self.EVENT_POLL_SECONDS)
+                lines = events or [{'type': 'heartbeat', 'time': time.time()}]
+                for event in lines:
+                    self.wfile.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+                self.wfile.flush()
+                if events:
+                    since = events[-1]['seq'] + 1
+                if job.status in FINISHED_STATES and since >= job.event_count:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+def create_server(service, host='127.0.0.1', port=8765):
+    """ساخت سرور HTTP چندریسمانی برای سرویس کار (هر اتصال در یک ریسمان جداگانه)."""
+    handler = type('BoundJobRequestHandler', (JobRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
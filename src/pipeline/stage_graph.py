@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from ..utils.artifact_io import save_values, load_values
+from ..utils.stage_cache import StageCache
+from ..utils.metrics import StageMeter
+
+class Stage:
+    """
+    تعریف یک مرحله در گراف پایپلاین.
+
+    Args:
+        name (str): نام یکتای مرحله.
+        func (callable): تابع اجرای مرحله با امضای func(**inputs) که دیکشنری خروجی‌ها را برمی‌گرداند.
+        inputs (tuple): نام آرتیفکت‌های ورودی.
+        outputs (tuple): نام آرتیفکت‌های خروجی.
+        title (str): عنوان فارسی مرحله برای لاگ.
+        enabled (bool): در صورت غیرفعال بودن، خروجی‌ها از passthrough پر می‌شوند.
+        passthrough (dict): نگاشت خروجی -> ورودی (یا None) برای حالت غیرفعال.
+        config_slice (dict): تنظیمات اثرگذار بر خروجی مرحله (برای امضا و کلید کش).
+        cacheable (bool): آیا خروجی این مرحله در کش دیسکی ذخیره شود.
+        is_step (bool): آیا این مرحله در شمارش مراحل و نوار پیشرفت حساب شود.
+        kind (str): نوع منبع پردازشی مرحله ('gpu' یا 'cpu').
+        intermediate_files (dict): نگاشت خروجی -> نام فایل میانی (در صورت فعال بودن save_intermediate).
+        skip_message (str): پیامی که در صورت غیرفعال بودن مرحله در لاگ نمایش داده می‌شود.
+        optional (bool): خطای مرحله اختیاری (مثلاً وکتورسازی) اجرا را متوقف نمی‌کند: خروجی‌ها None می‌شوند،
+            خطا در StageGraph.failures ثبت می‌شود و مرحله کامل‌شده ذخیره نمی‌شود تا ازسرگیری آن را دوباره اجرا کند.
+    """
+    def __init__(self, name, func, inputs=(), outputs=(), title=None, enabled=True, passthrough=None,
+                 config_slice=None, cacheable=False, is_step=True, kind='cpu', intermediate_files=None,
+                 skip_message=None, optional=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.title = title
+        self.enabled = enabled
+        self.passthrough = passthrough or {}
+        self.config_slice = config_slice or {}
+        self.cacheable = cacheable
+        self.is_step = is_step
+        self.kind = kind
+        self.intermediate_files = intermediate_files or {}
+        self.skip_message = skip_message
+        self.optional = optional
+
+    def signature(self, input_signatures):
+        """امضای مرحله بر اساس نام، تنظیمات و امضای ورودی‌ها؛ هر تغییر بالادستی امضا را عوض می‌کند."""
+        payload = json.dumps(
+            {
+                'stage': self.name,
+                'enabled': self.enabled,
+                'config': self.config_slice,
+                'inputs': [input_signatures[name] for name in self.inputs],
+            },
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ArtifactStore:
+    """
+    ذخیره‌ساز آرتیفکت‌های هر مرحله در پوشه stages/ خروجی یک اجرا.
+    وضعیت مراحل تکمیل‌شده در فایل state.json نگهداری می‌شود تا اجرا قابل ازسرگیری باشد.
+    """
+    STATE_FILE = 'state.json'
+
+    def __init__(self, output_path):
+        self.directory = os.path.join(output_path, 'stages')
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+
+    def _state_path(self):
+        return os.path.join(self.directory, self.STATE_FILE)
+
+    def _load_state(self):
+        try:
+            if os.path.exists(self._state_path()):
+                with open(self._state_path(), 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"⚠️ فایل وضعیت مراحل خوانده نشد و نادیده گرفته می‌شود: {e}")
+        return {'stages': {}}
+
+    def _write_state(self):
+        temp_path = self._state_path() + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self._state_path())
+
+    def load_stage(self, stage_name, signature):
+        """بازیابی خروجی‌های یک مرحله تکمیل‌شده، در صورتی که امضای آن تغییر نکرده باشد."""
+        entry = self.state['stages'].get(stage_name)
+        if not entry or entry.get('signature') != signature:
+            return None
+        try:
+            return load_values(self.directory, entry['values'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ آرتیفکت‌های مرحله '{stage_name}' قابل بازیابی نیستند: {e}")
+            return None
+
+    def save_stage(self, stage_name, signature, values):
+        meta = save_values(self.directory, values, prefix=f"{stage_name}__")
+        with self._lock:
+            self.state['stages'][stage_name] = {'signature': signature, 'values': meta}
+            self._write_state()
+
+    def artifact_file(self, stage_name, output_name):
+        """مسیر فایل ذخیره‌شده یک خروجی (در صورت وجود فایل) را برمی‌گرداند."""
+        entry = self.state['stages'].get(stage_name, {})
+        item = entry.get('values', {}).get(output_name)
+        if item and 'file' in item:
+            return os.path.join(self.directory, item['file'])
+        return None
+
+    def copy_intermediate_files(self, stage, output_path):
+        """کپی آرتیفکت‌های تصویری یک مرحله به نام‌های فایل میانی شماره‌دار در پوشه خروجی."""
+        for output_name, file_name in stage.intermediate_files.items():
+            source = self.artifact_file(stage.name, output_name)
+            if source and os.path.exists(source):
+                shutil.copyfile(source, os.path.join(output_path, file_name))
+
+
+class StageGraph:
+    """
+    اجرای مراحل پایپلاین به صورت یک گراف جهت‌دار بدون دور (DAG).
+    هر مرحله به محض آماده شدن ورودی‌هایش اجرا می‌شود و مراحل مستقل به صورت همزمان اجرا می‌شوند.
+    """
+    def __init__(self, stages):
+        self.stages = list(stages)
+        # معیارهای زمان و حافظه مراحل اجراشده در آخرین فراخوانی execute (به ترتیب پایان)
+        self.metrics = []
+        # خطای مراحل اختیاری ناموفق در آخرین فراخوانی execute (نام مرحله -> خطا)
+        self.failures = {}
+        self._producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise ValueError(f"آرتیفکت '{output}' توسط بیش از یک مرحله تولید می‌شود.")
+                self._producers[output] = stage.name
+
+    def upstream_closure(self, kind):
+        """
+        نام مراحل از نوع مشخص (مثلاً 'gpu') به همراه تمام مراحل بالادستی آن‌ها.
+        برای جدا کردن فاز GPU از مراحل CPU پایین‌دستی در اجرای دسته‌ای استفاده می‌شود.
+        """
+        by_name = {stage.name: stage for stage in self.stages}
+        selected = set()
+        to_visit = [stage.name for stage in self.stages if stage.kind == kind]
+        while to_visit:
+            name = to_visit.pop()
+            if name in selected:
+                continue
+            selected.add(name)
+            for input_name in by_name[name].inputs:
+                producer = self._producers.get(input_name)
+                if producer:
+                    to_visit.append(producer)
+        return selected
+
+    def execute(self, artifacts, store=None, cache=None, max_workers=4, on_stage_start=None,
+                on_stage_done=None, use_cache=True, stage_names=None, on_stage_metrics=None, keep=None):
+        """
+        اجرای تمام مراحلی که خروجی‌هایشان هنوز در artifacts موجود نیست.
+
+        Args:
+            artifacts (dict): آرتیفکت‌های اولیه (مثلاً تصویر ورودی 'original').
+            store (ArtifactStore): برای ذخیره و ازسرگیری آرتیفکت‌ها (اختیاری).
+            cache (StageCache): کش دیسکی محتوامحور برای مراحل cacheable (اختیاری).
+            max_workers (int): حداکثر تعداد مراحل همزمان.
+            on_stage_start (callable): فراخوانی با (stage, source) پیش از اجرای هر مرحله؛
+                source یکی از 'run'، 'resume'، 'cache' یا 'skip' است. خطای این تابع (مثلاً لغو) اجرا را متوقف می‌کند.
+            on_stage_done (callable): فراخوانی با (stage, outputs) پس از تکمیل هر مرحله.
+            stage_names (set): در صورت تعیین، فقط همین مراحل اجرا می‌شوند.
+            on_stage_metrics (callable): فراخوانی با (stage, metrics) پس از تکمیل هر مرحله؛
+                metrics شامل منبع خروجی، زمان، CPU و حافظه مرحله است.
+            keep (set): در صورت تعیین، آرتیفکت‌های دیگر به محض پایان آخرین مصرف‌کننده‌شان از حافظه رها می‌شوند
+                (برای تصاویر بسیار بزرگ در حالت نواری؛ خروجی مراحل همچنان در store ذخیره شده است).
+
+        Returns:
+            dict: تمام آرتیفکت‌ها پس از اجرا (با keep، فقط آرتیفکت‌های keep و آرتیفکت‌های مصرف‌نشده توسط مراحل اجراشده).
+        """
+        artifacts = dict(artifacts)
+        self.metrics = []
+        self.failures = {}
+        signatures = {name: StageCache.hash_value(value) for name, value in artifacts.items()}
+        pending = [stage for stage in self.stages
+                   if not all(o in artifacts for o in stage.outputs)
+                   and (stage_names is None or stage.name in stage_names)]
+
+        for stage in pending:
+            missing = [i for i in stage.inputs if i not in artifacts and i not in self._producers]
+            if missing:
+                raise ValueError(f"ورودی‌های {missing} برای مرحله '{stage.name}' تولید نمی‌شوند.")
+
+        # تعداد مصرف‌کنندگان باقی‌مانده هر آرتیفکت (برای رها کردن آرتیفکت‌های خارج از keep)
+        consumers = {}
+        for stage in pending:
+            for name in stage.inputs:
+                consumers[name] = consumers.get(name, 0) + 1
+
+        def release(names):
+            for name in names:
+                if keep is not None and name not in keep and not consumers.get(name):
+                    artifacts.pop(name, None)
+
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    ready = [s for s in pending if all(i in artifacts for i in s.inputs)]
+                    for stage in ready:
+                        pending.remove(stage)
+                        inputs = {name: artifacts[name] for name in stage.inputs}
+                        signature = stage.signature(signatures)
+                        future = executor.submit(
+                            self._run_stage, stage, inputs, signature, store, cache, use_cache, on_stage_start
+                        )
+                        running[future] = (stage, signature)
+
+                if not running:
+                    if error is None and pending:
+                        names = [s.name for s in pending]
+                        raise RuntimeError(f"مراحل {names} به دلیل وابستگی‌های حل‌نشده اجرا نشدند.")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, signature = running.pop(future)
+                    try:
+                        outputs, stage_metrics = future.result()
+                    except BaseException as e:
+                        # منتظر پایان مراحل در حال اجرا می‌مانیم تا آرتیفکت‌های آن‌ها ذخیره شوند
+                        if error is None:
+                            error = e
+                        continue
+                    for name in stage.outputs:
+                        artifacts[name] = outputs.get(name)
+                        signatures[name] = f"{signature}:{name}"
+                    self.metrics.append(stage_metrics)
+                    if on_stage_metrics:
+                        on_stage_metrics(stage, stage_metrics)
+                    if on_stage_done:
+                        on_stage_done(stage, outputs)
+                    for name in stage.inputs:
+                        consumers[name] -= 1
+                    release(stage.inputs + stage.outputs)
+
+                if error is not None:
+                    pending.clear()
+
+        if error is not None:
+            raise error
+        return artifacts
+
+    def _run_stage(self, stage, inputs, signature, store, cache, use_cache, on_stage_start):
+        source = {}
+        with StageMeter() as meter:
+            outputs = self._load_or_run_stage(stage, inputs, signature, store, cache, use_cache, on_stage_start, source)
+        stage_metrics = {'stage': stage.name, 'kind': stage.kind, 'source': source.get('value')}
+        if stage.name in self.failures:
+            stage_metrics['error'] = str(self.failures[stage.name])
+        stage_metrics.update(meter.result)
+        return outputs, stage_metrics
+
+    def _load_or_run_stage(self, stage, inputs, signature, store, cache, use_cache, on_stage_start, source):
+        def start(value):
+            source['value'] = value
+            if on_stage_start:
+                on_stage_start(stage, value)
+
+        if not stage.enabled:
+            start('skip')
+            return {out: inputs.get(src) if src else None for out, src in
+                    ((o, stage.passthrough.get(o)) for o in stage.outputs)}
+
+        if store is not None:
+            outputs = store.load_stage(stage.name, signature)
+            if outputs is not None:
+                start('resume')
+                return outputs
+
+        cache_key = None
+        if stage.cacheable and cache is not None and cache.enabled and use_cache:
+            input_hashes = {name: StageCache.hash_value(value) for name, value in inputs.items()}
+            cache_key = cache.make_key(stage.name, input_hashes, stage.config_slice)
+            outputs = cache.get(cache_key)
+            if outputs is not None:
+                start('cache')
+                if store is not None:
+                    store.save_stage(stage.name, signature, outputs)
+                return outputs
+
+        start('run')
+        try:
+            outputs = stage.func(**inputs) or {}
+        except Exception as e:
+            if not stage.optional:
+                raise
+            source['value'] = 'failed'
+            self.failures[stage.name] = e
+            return {name: None for name in stage.outputs}
+
+        if cache_key is not None:
+            cache.put(cache_key, outputs)
+        if store is not None:
+            store.save_stage(stage.name, signature, outputs)
+        return outputs
@@ -2,23 +2,65 @@
 import numpy as np
 from PIL import Image
 from sklearn.cluster import KMeans
-from sklearn.utils import shuffle
+
+from ..utils.tiling import iter_strips
+from .palette_mapper import PaletteMapper
+from .dithering import dither_indices
 
 class ColorQuantizer:
     """کلاس کاهش و کوانتیزه کردن رنگ‌های تصویر با متدهای مختلف."""
     
-    def __init__(self, n_colors=10):
+    def __init__(self, n_colors=10, distance_metric='rgb', lut_bins=32):
         self.n_colors = n_colors
         self.palette = None
+        self.palette_mapper = PaletteMapper(bins=lut_bins, metric=distance_metric)
+
+    def _median_cut_palette(self, image, strip_rows=None):
+        """
+        انتخاب پالت با MEDIANCUT؛ در حالت نواری از نسخه کوچک‌شده تصویر (هم‌اندازه یک نوار).
+        """
+        sample = image
+        if strip_rows and strip_rows < image.height:
+            sample = image.copy()
+            scale = (strip_rows / image.height) ** 0.5
+            sample.thumbnail((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BOX)
+        return self._palette_of(sample.quantize(colors=self.n_colors, method=Image.Quantize.MEDIANCUT))
+
+    def _palette_of(self, quantized_image):
+        """
+        پالت تصویر کوانتیزه‌شده (حداکثر n_colors رنگ). اگر تصویر رنگ‌های متمایز کمتری داشته باشد،
+        getpalette فقط رنگ‌های موجود را برمی‌گرداند و پالت کوتاه‌تر می‌شود.
+        """
+        palette_raw = quantized_image.getpalette() or []
+        n_entries = min(self.n_colors, len(palette_raw) // 3)
+        return np.array(palette_raw[:n_entries * 3], dtype=np.uint8).reshape(-1, 3)
+
+    def _finish(self, indexed_image, indexed):
+        """
+        خروجی نهایی متدهای کاهش رنگ: پالت دقیق self.palette روی تصویر مد 'P' قرار می‌گیرد.
+        با indexed=True همان نقشه گره اندیس‌دار (یک بایت برای هر گره) برگردانده می‌شود،
+        در غیر این صورت برای سازگاری با کد قبلی به RGB تبدیل می‌شود.
+        """
+        indexed_image.putpalette(self.palette.reshape(-1).tolist())
+        if not indexed:
+            indexed_image = indexed_image.convert("RGB")
+        return indexed_image, self.palette
 
-    def quantize_with_dithering(self, image):
+    def quantize_with_dithering(self, image, strip_rows=None, indexed=False):
         """
         کاهش رنگ با استفاده از دیترینگ برای حفظ حداکثری بافت و جزئیات.
         این متد برای طرح‌های فرش بسیار مناسب است.
+        با تعیین strip_rows (حالت نواری)، پالت از نسخه کوچک‌شده تصویر استخراج و سپس
+        نوار به نوار اعمال می‌شود تا حافظه مصرفی محدود بماند.
+        با indexed=True خروجی تصویر پالت‌دار (مد 'P') است.
         """
         if image.mode != "RGB":
             image = image.convert("RGB")
 
+        if strip_rows and strip_rows < image.height:
+            self.palette = self._median_cut_palette(image, strip_rows)
+            return self._finish(self._map_palette_in_strips(image, self.palette, strip_rows), indexed)
+
         # استفاده از متد داخلی و بهینه کتابخانه PIL
         # MEDIANCUT یک الگوریتم خوب برای انتخاب پالت است
         # FLOYDSTEINBERG بهترین الگوریتم دیترینگ برای حفظ جزئیات است
@@ -28,51 +70,122 @@ class ColorQuantizer:
             dither=Image.Dither.FLOYDSTEINBERG
         )
         
-        # تصویر کوانتیزه شده دارای پالت است، آن را به RGB تبدیل می‌کنیم
-        dithered_image = dithered_image.convert("RGB")
-        
-        # استخراج پالت از تصویر خروجی
-        palette_raw = dithered_image.getpalette()
-        palette = [palette_raw[i:i+3] for i in range(0, self.n_colors * 3, 3)]
-        self.palette = np.array(palette, dtype=np.uint8)
+        # استخراج پالت از تصویر خروجی (پیش از تبدیل به RGB که پالت را حذف می‌کند)
+        self.palette = self._palette_of(dithered_image)
         
-        return dithered_image, self.palette
+        return self._finish(dithered_image, indexed)
     
-    def apply_palette_with_dithering(self, image, custom_palette):
+    @staticmethod
+    def _palette_image(palette):
+        """ساخت یک تصویر پالت پایه (مد P) برای اعمال پالت با PIL."""
+        palette_img = Image.new("P", (1, 1))
+        # تبدیل پالت به فرمت مورد نیاز PIL (لیست تخت)
+        palette_flat = [int(value) for color in palette for value in color]
+        palette_img.putpalette(palette_flat)
+        return palette_img
+
+    def _map_palette_in_strips(self, image, palette, strip_rows):
+        """
+        اعمال پالت با دیترینگ روی نوارهای افقی تصویر.
+        خطای دیترینگ از مرز نوارها عبور نمی‌کند؛ با نوارهای چندصدسطری اثر آن در طرح دیده نمی‌شود.
+        """
+        palette_img = self._palette_image(palette)
+        result = Image.new("P", image.size)
+        for y0, y1 in iter_strips(image.height, strip_rows):
+            strip = image.crop((0, y0, image.width, y1))
+            result.paste(strip.quantize(palette=palette_img, dither=Image.Dither.FLOYDSTEINBERG), (0, y0))
+        return result
+
+    def apply_palette_with_dithering(self, image, custom_palette, strip_rows=None, indexed=False):
         """
         اعمال یک پالت سفارشی به تصویر با استفاده از دیترینگ.
+        با تعیین strip_rows، پالت نوار به نوار اعمال می‌شود.
         """
         if image.mode != "RGB":
             image = image.convert("RGB")
-            
-        # ساخت یک تصویر پالت پایه برای اعمال به تصویر اصلی
-        palette_img = Image.new("P", (1, 1))
-        # تبدیل پالت به فرمت مورد نیاز PIL (لیست تخت)
-        palette_flat = [value for color in custom_palette for value in color]
-        palette_img.putpalette(palette_flat)
-        
+
+        self.palette = np.array(custom_palette, dtype=np.uint8).reshape(-1, 3)
+        if strip_rows and strip_rows < image.height:
+            return self._finish(self._map_palette_in_strips(image, self.palette, strip_rows), indexed)
+
         # اعمال پالت با دیترینگ
-        dithered_image = image.quantize(palette=palette_img, dither=Image.Dither.FLOYDSTEINBERG)
-        dithered_image = dithered_image.convert("RGB")
-        
-        self.palette = np.array(custom_palette, dtype=np.uint8)
-        return dithered_image, self.palette
+        dithered_image = image.quantize(palette=self._palette_image(custom_palette), dither=Image.Dither.FLOYDSTEINBERG)
+
+        return self._finish(dithered_image, indexed)
+
+    def apply_palette(self, image, palette, strip_rows=None, indexed=False, dither='none'):
+        """
+        اعمال پالت بدون دیترینگ: هر پیکسل با LUT سه‌بعدی (PaletteMapper) به نزدیک‌ترین رنگ پالت نگاشت می‌شود.
+        LUT هر پالت کش می‌شود، بنابراین اعمال دوباره همان پالت (مثلاً پالت پروفایل دستگاه) بسیار سریع است.
+        با dither یکی از روش‌های ماژول dithering (bayer، blue_noise، atkinson، floyd_steinberg) اعمال می‌شود.
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        palette = np.array(palette, dtype=np.uint8).reshape(-1, 3)
+        image_np = np.asarray(image)
+        indices = np.empty(image_np.shape[:2], dtype=np.uint8)
+        for y0, y1 in iter_strips(image_np.shape[0], strip_rows or image_np.shape[0]):
+            indices[y0:y1] = dither_indices(image_np[y0:y1], palette, dither, self.palette_mapper, y_offset=y0)
+        self.palette = palette
+        # putpalette تصویر 'L' اندیس‌ها را بدون کپی به مد 'P' تبدیل می‌کند
+        return self._finish(Image.fromarray(indices), indexed)
+
+    def quantize(self, image, strip_rows=None, indexed=False, dither='none'):
+        """کاهش رنگ خودکار: انتخاب پالت با MEDIANCUT و نگاشت پیکسل‌ها با LUT (و دیترینگ انتخابی)."""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return self.apply_palette(image, self._median_cut_palette(image, strip_rows), strip_rows=strip_rows,
+                                  indexed=indexed, dither=dither)
 
-    def extract_palette(self, image, max_samples=20000):
-        """استخراج پالت با K-Means (برای استخراج رنگ از تصویر اولیه مناسب است)."""
+    @staticmethod
+    def color_histogram(image, bin_bits=5):
+        """
+        هیستوگرام رنگی کل پیکسل‌های تصویر روی شبکه RGB با bin_bits بیت در هر کانال.
+
+        Returns:
+            tuple: (میانگین رنگ پیکسل‌های هر خانه غیرخالی به صورت float، تعداد پیکسل‌های هر خانه)
+        """
         if isinstance(image, Image.Image):
-            image = np.array(image.convert("RGB"))
-        
+            image = np.asarray(image.convert("RGB"))
         pixels = image.reshape(-1, 3)
-        
-        if len(pixels) > max_samples:
-            pixels_sample = shuffle(pixels, random_state=42, n_samples=max_samples)
+        shift = 8 - bin_bits
+        codes = ((pixels[:, 0].astype(np.int32) >> shift) << (2 * bin_bits)) \
+            | ((pixels[:, 1].astype(np.int32) >> shift) << bin_bits) \
+            | (pixels[:, 2].astype(np.int32) >> shift)
+        n_bins = 1 << (3 * bin_bits)
+        counts = np.bincount(codes, minlength=n_bins)
+        occupied = np.nonzero(counts)[0]
+        # میانگین واقعی رنگ‌های هر خانه (نه مرکز خانه) تا دقت رنگ‌ها با کوانتیزه کردن هیستوگرام از دست نرود
+        means = np.stack([
+            np.bincount(codes, weights=pixels[:, channel], minlength=n_bins)[occupied] for channel in range(3)
+        ], axis=1) / counts[occupied, None]
+        return means, counts[occupied]
+
+    def extract_palette(self, image, bin_bits=5, return_coverage=False):
+        """
+        استخراج پالت با K-Means وزن‌دار روی هیستوگرام رنگی تمام پیکسل‌ها (برای استخراج رنگ از تصویر اولیه مناسب است).
+        به جای نمونه‌گیری تصادفی پیکسل‌ها، رنگ‌های یکتای هیستوگرام (حداکثر 2^(3×bin_bits)) با وزن تعداد
+        پیکسل‌هایشان خوشه‌بندی می‌شوند؛ نتیجه قطعی است و به تعداد پیکسل‌ها وابسته نیست.
+        رنگ‌ها به ترتیب سهم پوشش مرتب می‌شوند.
+
+        Returns:
+            np.ndarray: پالت (n_colors × 3)، و با return_coverage=True همراه با درصد پوشش هر رنگ.
+        """
+        colors, counts = self.color_histogram(image, bin_bits)
+        if len(colors) <= self.n_colors:
+            # تعداد رنگ‌های تصویر از تعداد درخواستی کمتر است
+            centers, labels = colors, np.arange(len(colors))
         else:
-            pixels_sample = pixels
-        
-        kmeans = KMeans(n_clusters=self.n_colors, random_state=42, n_init=10)
-        kmeans.fit(pixels_sample)
-        palette = kmeans.cluster_centers_.astype(np.uint8)
+            # داده هیستوگرام کم‌نویز است و چند شروع برای پایداری نتیجه کافی است
+            kmeans = KMeans(n_clusters=self.n_colors, random_state=42, n_init=3)
+            kmeans.fit(colors, sample_weight=counts)
+            centers, labels = kmeans.cluster_centers_, kmeans.labels_
+
+        coverage = np.bincount(labels, weights=counts, minlength=len(centers)) / counts.sum() * 100
+        order = np.argsort(-coverage, kind='stable')
+        palette = np.clip(np.round(centers[order]), 0, 255).astype(np.uint8)
+        if return_coverage:
+            return palette, np.round(coverage[order], 2)
         return palette
 
     def create_palette_visualization(self, palette=None, size=(600, 80)):
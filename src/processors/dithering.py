@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from functools import lru_cache
+import numpy as np
+
+# روش‌های دیترینگ قابل انتخاب در processing.color_quantization.dither
+DITHER_METHODS = ('none', 'floyd_steinberg', 'atkinson', 'bayer', 'blue_noise')
+
+# ضرایب پخش خطا: (dy, dx, وزن)
+DIFFUSION_KERNELS = {
+    'floyd_steinberg': ((0, 1, 7 / 16), (1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16)),
+    # Atkinson فقط ۳/۴ خطا را پخش می‌کند؛ نواحی یکدست تمیزتر و کنتراست بیشتر می‌ماند
+    'atkinson': ((0, 1, 1 / 8), (0, 2, 1 / 8), (1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8)),
+}
+
+def normalize_dither(value):
+    """
+    تبدیل مقدار dither تنظیمات به نام روش؛ مقادیر بولی قدیمی پشتیبانی می‌شوند
+    (true = floyd_steinberg، false = none).
+    """
+    if value is True:
+        return 'floyd_steinberg'
+    if value is False or value is None:
+        return 'none'
+    method = str(value).strip().lower().replace('-', '_')
+    if method not in DITHER_METHODS:
+        raise ValueError(f"روش دیترینگ نامعتبر است: {value} (مجاز: {', '.join(DITHER_METHODS)})")
+    return method
+
+@lru_cache(maxsize=None)
+def bayer_matrix(size=8):
+    """ماتریس آستانه Bayer با ابعاد size×size (توانی از ۲) و مقادیر در بازه [0, 1)."""
+    if size < 2 or size & (size - 1):
+        raise ValueError(f"ابعاد ماتریس Bayer باید توانی از ۲ باشد: {size}")
+    matrix = np.array([[0, 2], [3, 1]], dtype=np.float32)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix + 0.5) / (size * size)
+
+@lru_cache(maxsize=None)
+def blue_noise_matrix(size=64, sigma=1.5, seed=0):
+    """
+    ماتریس آستانه نویز آبی با الگوریتم void-and-cluster (Ulichney) روی شبکه چنبره‌ای؛
+    نتیجه قطعی است، یک بار ساخته و کش می‌شود و مقادیر آن در بازه [0, 1) است.
+    """
+    n = size * size
+    offsets = np.minimum(np.arange(size), size - np.arange(size)).astype(np.float32)
+    kernel = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * sigma ** 2))
+
+    def splat(energy, y, x, sign):
+        energy += sign * np.roll(np.roll(kernel, y, axis=0), x, axis=1)
+
+    rng = np.random.default_rng(seed)
+    pattern = np.zeros((size, size), dtype=bool)
+    pattern.flat[rng.choice(n, n // 10, replace=False)] = True
+    energy = np.zeros((size, size), dtype=np.float32)
+    for y, x in np.argwhere(pattern):
+        splat(energy, y, x, 1)
+
+    # یکنواخت کردن الگوی اولیه: جابه‌جایی فشرده‌ترین نقطه به بزرگ‌ترین حفره تا رسیدن به تعادل
+    for _ in range(n):
+        cluster = np.unravel_index(np.argmax(np.where(pattern, energy, -np.inf)), pattern.shape)
+        pattern[cluster] = False
+        splat(energy, *cluster, -1)
+        void = np.unravel_index(np.argmin(np.where(pattern, np.inf, energy)), pattern.shape)
+        pattern[void] = True
+        splat(energy, *void, 1)
+        if void == cluster:
+            break
+
+    ranks = np.zeros((size, size), dtype=np.int32)
+    initial_pattern, initial_energy = pattern.copy(), energy.copy()
+    # مرحله ۱: حذف نقاط الگوی اولیه از فشرده‌ترین خوشه با رتبه نزولی
+    for rank in range(int(pattern.sum()) - 1, -1, -1):
+        cluster = np.unravel_index(np.argmax(np.where(pattern, energy, -np.inf)), pattern.shape)
+        pattern[cluster] = False
+        splat(energy, *cluster, -1)
+        ranks[cluster] = rank
+    # مرحله ۲: پر کردن بزرگ‌ترین حفره‌ها با رتبه صعودی تا پر شدن کامل ماتریس
+    pattern, energy = initial_pattern, initial_energy
+    for rank in range(int(pattern.sum()), n):
+        void = np.unravel_index(np.argmin(np.where(pattern, np.inf, energy)), pattern.shape)
+        pattern[void] = True
+        splat(energy, *void, 1)
+        ranks[void] = rank
+    return ((ranks + 0.5) / n).astype(np.float32)
+
+def palette_spread(palette):
+    """
+    دامنه نویز دیترینگ ترتیبی برای هر کانال: میانگین فاصله هر رنگ پالت تا نزدیک‌ترین رنگ دیگر،
+    تقسیم بر √3 چون همان نویز به هر سه کانال افزوده می‌شود (با پالت‌های فشرده نویز کمتری اضافه می‌شود).
+    """
+    palette = np.asarray(palette, dtype=np.float32).reshape(-1, 3)
+    if len(palette) < 2:
+        return 0.0
+    distances = np.linalg.norm(palette[:, None, :] - palette[None, :, :], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    return float(distances.min(axis=1).mean() / np.sqrt(3))
+
+def ordered_dither(image_np, palette, mapper, method='bayer', y_offset=0):
+    """
+    دیترینگ ترتیبی در یک گذر برداری: ماتریس آستانه روی تصویر تکرار و به پیکسل‌ها افزوده می‌شود
+    و نتیجه با LUT (PaletteMapper) به نزدیک‌ترین رنگ پالت نگاشت می‌شود.
+    y_offset ردیف شروع نوار در تصویر کامل است تا الگو در مرز نوارها پیوسته بماند.
+
+    Returns:
+        np.ndarray: آرایه uint8 اندیس‌های پالت با ابعاد HxW.
+    """
+    matrix = bayer_matrix(8) if method == 'bayer' else blue_noise_matrix()
+    height, width = image_np.shape[:2]
+    size = matrix.shape[0]
+    rows = (np.arange(height) + y_offset) % size
+    cols = np.arange(width) % size
+    threshold = (matrix[rows[:, None], cols[None, :]] - 0.5) * palette_spread(palette)
+    dithered = np.clip(image_np.astype(np.float32) + threshold[..., None], 0, 255).astype(np.uint8)
+    return mapper.map_indices(dithered, palette)
+
+def error_diffusion_dither(image_np, palette, method='atkinson', strip_rows=64):
+    """
+    دیترینگ پخش خطا (Floyd-Steinberg یا Atkinson) به صورت برداری.
+
+    تصویر به نوارهای strip_rows سطری تقسیم می‌شود و همه نوارها با هم پردازش می‌شوند؛ خطا از مرز
+    نوارها عبور نمی‌کند. در هر نوار، پیکسل‌های روی یک جبهه موج (x + 2y ثابت) به یکدیگر وابسته نیستند
+    و در یک گام برداری کوانتیزه می‌شوند، بنابراین تعداد گام‌ها به جای تعداد پیکسل‌ها برابر
+    عرض + ۲ × strip_rows است. پیمایش مارپیچ (serpentine) این استقلال را از بین می‌برد و پشتیبانی نمی‌شود.
+
+    Returns:
+        np.ndarray: آرایه uint8 اندیس‌های پالت با ابعاد HxW.
+    """
+    kernel = DIFFUSION_KERNELS[method]
+    palette_f = np.asarray(palette, dtype=np.float32).reshape(-1, 3)
+    palette_norms = (palette_f ** 2).sum(axis=1)
+    height, width = image_np.shape[:2]
+    strip_rows = max(1, min(strip_rows, height))
+    n_strips = -(-height // strip_rows)
+
+    # بافر کاری: نوارها در بعد اول، با حاشیه برای پخش خطا به بیرون از نوار
+    pad_y, pad_x = max(dy for dy, _, _ in kernel), max(abs(dx) for _, dx, _ in kernel)
+    work = np.zeros((n_strips, strip_rows + pad_y, width + 2 * pad_x, 3), dtype=np.float32)
+    padded = np.zeros((n_strips * strip_rows, width, 3), dtype=np.float32)
+    padded[:height] = image_np
+    work[:, :strip_rows, pad_x:pad_x + width] = padded.reshape(n_strips, strip_rows, width, 3)
+    indices = np.zeros((n_strips, strip_rows, width), dtype=np.uint8)
+
+    rows = np.arange(strip_rows)
+    for wavefront in range(width + 2 * (strip_rows - 1)):
+        cols = wavefront - 2 * rows
+        valid = (cols >= 0) & (cols < width)
+        ys, xs = rows[valid], cols[valid] + pad_x
+        values = np.clip(work[:, ys, xs], 0, 255)
+        # نزدیک‌ترین رنگ پالت با ضرب ماتریسی: |p|² - 2v·p
+        nearest = np.argmin(palette_norms - 2 * values @ palette_f.T, axis=-1)
+        indices[:, ys, xs - pad_x] = nearest
+        error = values - palette_f[nearest]
+        for dy, dx, weight in kernel:
+            work[:, ys + dy, xs + dx] += error * weight
+    return indices.reshape(n_strips * strip_rows, width)[:height]
+
+def dither_indices(image_np, palette, method, mapper, y_offset=0, diffusion_strip_rows=64):
+    """اعمال پالت با روش دیترینگ انتخابی و بازگرداندن آرایه اندیس‌های پالت."""
+    if method == 'none':
+        return mapper.map_indices(image_np, palette)
+    if method in ('bayer', 'blue_noise'):
+        return ordered_dither(image_np, palette, mapper, method, y_offset)
+    if method in DIFFUSION_KERNELS:
+        return error_diffusion_dither(image_np, palette, method, diffusion_strip_rows)
+    raise ValueError(f"روش دیترینگ نامعتبر است: {method}")
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from PIL import Image
+
+class IndexedKnotMap:
+    """
+    نقشه گره اندیس‌دار: آرایه uint8 اندیس رنگ هر گره به همراه پالت (حداکثر ۲۵۶ رنگ).
+    حافظه آن یک‌سوم نسخه RGB است، به صورت PNG پالت‌دار ذخیره می‌شود و تعویض رنگ‌ها
+    فقط پالت را تغییر می‌دهد (O(تعداد رنگ‌ها)) و به پیکسل‌ها دست نمی‌زند.
+
+    در پایپلاین، نقشه‌های اندیس‌دار به صورت تصویر PIL با مد 'P' بین مراحل جابه‌جا می‌شوند
+    (to_image/from_image) تا ذخیره‌ساز مراحل و کش بدون تغییر از آن‌ها پشتیبانی کنند.
+    """
+    def __init__(self, indices, palette):
+        indices = np.asarray(indices)
+        palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        if indices.ndim != 2:
+            raise ValueError("آرایه اندیس‌ها باید دوبعدی (ارتفاع × عرض) باشد.")
+        if not 0 < len(palette) <= 256:
+            raise ValueError("پالت باید بین ۱ تا ۲۵۶ رنگ داشته باشد.")
+        self.indices = indices.astype(np.uint8, copy=False)
+        self.palette = palette
+
+    @property
+    def size(self):
+        return self.indices.shape[1], self.indices.shape[0]
+
+    @classmethod
+    def from_image(cls, image, palette_size=None):
+        """
+        ساخت از یک تصویر PIL با مد 'P'. palette_size تعداد رنگ‌های معتبر پالت را تعیین می‌کند
+        (پیش‌فرض: طول پالت ذخیره‌شده در تصویر).
+        """
+        if image.mode != 'P':
+            raise ValueError(f"تصویر باید پالت‌دار (مد P) باشد، نه '{image.mode}'.")
+        indices = np.asarray(image)
+        if palette_size is None:
+            palette_size = _palette_length(image)
+        palette = np.array(image.getpalette()[:palette_size * 3], dtype=np.uint8).reshape(-1, 3)
+        return cls(indices, palette)
+
+    def to_image(self):
+        """تبدیل به تصویر PIL با مد 'P' (پالت دقیقاً برابر پالت نقشه)."""
+        # putpalette تصویر 'L' را به مد 'P' تبدیل می‌کند
+        image = Image.fromarray(self.indices)
+        image.putpalette(self.palette.reshape(-1).tolist())
+        return image
+
+    def to_rgb(self):
+        """تصویر RGB کامل (برای نمایش یا ابزارهایی که پالت را پشتیبانی نمی‌کنند)."""
+        return Image.fromarray(self.palette[self.indices])
+
+    def recolor(self, new_palette):
+        """
+        تعویض رنگ‌ها بدون تغییر اندیس‌ها.
+
+        Args:
+            new_palette: پالت جدید هم‌اندازه پالت فعلی، یا دیکشنری {اندیس: رنگ} برای تغییر برخی رنگ‌ها.
+        """
+        if isinstance(new_palette, dict):
+            palette = self.palette.copy()
+            for index, color in new_palette.items():
+                if not 0 <= int(index) < len(palette):
+                    raise ValueError(f"اندیس رنگ {index} خارج از پالت {len(palette)} رنگی است.")
+                palette[int(index)] = color
+        else:
+            palette = np.asarray(new_palette, dtype=np.uint8).reshape(-1, 3)
+            if len(palette) != len(self.palette):
+                raise ValueError(f"پالت جدید باید {len(self.palette)} رنگ داشته باشد، نه {len(palette)}.")
+        return IndexedKnotMap(self.indices, palette)
+
+    def color_counts(self):
+        """تعداد گره‌های هر رنگ پالت."""
+        return np.bincount(self.indices.reshape(-1), minlength=len(self.palette))[:len(self.palette)]
+
+def _palette_length(image):
+    """تعداد رنگ‌های پالت تصویر مد 'P'."""
+    return len(image.getpalette() or []) // 3
+
+def append_palette_color(image, color):
+    """
+    افزودن یک رنگ به انتهای پالت تصویر مد 'P' با اندیس جداگانه (حتی اگر همان رنگ در پالت باشد)
+    تا تعویض رنگ‌های طرح روی آن اثر نگذارد. اگر پالت پر باشد، نزدیک‌ترین رنگ موجود استفاده می‌شود.
+
+    Returns:
+        tuple: (تصویر با پالت به‌روزشده، اندیس رنگ)
+    """
+    palette = np.array(image.getpalette(), dtype=np.int32).reshape(-1, 3)
+    color = np.array(color, dtype=np.int32)
+    if len(palette) < 256:
+        image = image.copy()
+        image.putpalette(palette.reshape(-1).tolist() + color.tolist())
+        return image, len(palette)
+    return image, int(np.argmin(((palette - color) ** 2).sum(axis=1)))
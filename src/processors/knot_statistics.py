@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from PIL import Image
+
+from ..utils.tiling import iter_strips
+
+def compute_knot_statistics(knot_map, palette=None, strip_rows=2048):
+    """
+    آمار تولید نقشه گره اندیس‌دار در یک گذر نواری: تعداد گره هر رنگ (bincount) و تعداد تعویض رنگ
+    در هر رج (مقایسه هر گره با گره سمت چپ). حافظه کاری به اندازه یک نوار محدود است.
+
+    Args:
+        knot_map: تصویر PIL با مد 'P' یا آرایه uint8 اندیس‌های پالت (HxW).
+        palette: پالت (برای آرایه اندیس الزامی؛ برای تصویر مد 'P' از خود تصویر خوانده می‌شود).
+
+    Returns:
+        dict: {'colors': [...], 'rows': {...}}
+    """
+    if isinstance(knot_map, Image.Image):
+        if knot_map.mode != 'P':
+            raise ValueError("آمار گره‌ها به نقشه گره اندیس‌دار (تصویر با مد P) نیاز دارد.")
+        if palette is None:
+            palette = np.array(knot_map.getpalette(), dtype=np.uint8).reshape(-1, 3)
+        knot_map = np.asarray(knot_map)
+    palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+    height, width = knot_map.shape
+
+    counts = np.zeros(max(len(palette), 256), dtype=np.int64)
+    row_changes = np.empty(height, dtype=np.int64)
+    for y0, y1 in iter_strips(height, strip_rows):
+        strip = knot_map[y0:y1]
+        counts += np.bincount(strip.reshape(-1), minlength=len(counts))
+        row_changes[y0:y1] = np.count_nonzero(strip[:, 1:] != strip[:, :-1], axis=1)
+
+    total = max(1, height * width)
+    colors = [
+        {
+            'index': i + 1,
+            'rgb': list(map(int, color)),
+            'hex': '#%02x%02x%02x' % tuple(map(int, color)),
+            'knots': int(counts[i]),
+            'percent': round(float(counts[i]) / total * 100, 3),
+        }
+        for i, color in enumerate(palette) if counts[i] > 0
+    ]
+    busiest_row = int(np.argmax(row_changes)) if height else 0
+    rows = {
+        'total_rows': int(height),
+        'knots_per_row': int(width),
+        'total_color_changes': int(row_changes.sum()),
+        'mean_changes_per_row': round(float(row_changes.mean()), 2) if height else 0.0,
+        'max_changes_per_row': int(row_changes[busiest_row]) if height else 0,
+        'busiest_row': busiest_row + 1,
+        # رج‌ها از پایین فرش (آخرین سطر تصویر) بافته می‌شوند، اما ترتیب این فهرست همان ترتیب سطرهای تصویر است
+        'changes_per_row': row_changes.tolist(),
+    }
+    return {'colors': colors, 'rows': rows}
+
+def estimate_yarn(color_stats, area_m2, pile_grams_per_m2, waste_percent=0):
+    """
+    برآورد وزن نخ هر رنگ به گرم: سهم گره‌های رنگ × مساحت × وزن نخ پرز در متر مربع، به اضافه درصد دورریز.
+    فهرست color_stats (خروجی compute_knot_statistics) درجا با کلید yarn_grams تکمیل می‌شود.
+
+    Returns:
+        float: وزن کل نخ (گرم).
+    """
+    total_knots = sum(color['knots'] for color in color_stats) or 1
+    total_grams = area_m2 * pile_grams_per_m2 * (1 + waste_percent / 100)
+    for color in color_stats:
+        color['yarn_grams'] = round(total_grams * color['knots'] / total_knots, 1)
+    return round(total_grams, 1)
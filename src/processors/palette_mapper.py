@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+def srgb_to_linear(rgb):
+    """مقادیر خطی (بدون گاما) رنگ‌های sRGB با مقادیر 0 تا 255."""
+    rgb = np.asarray(rgb, dtype=np.float32) / 255.0
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+def linear_to_lab(linear):
+    """تبدیل رنگ‌های RGB خطی (خروجی srgb_to_linear) به CIELAB (نقطه سفید D65)."""
+    matrix = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ], dtype=np.float32)
+    xyz = linear @ matrix.T
+    xyz /= np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+def srgb_to_lab(rgb):
+    """
+    تبدیل برداری رنگ‌های sRGB (مقادیر 0 تا 255، آرایه با آخرین بعد 3) به CIELAB (نقطه سفید D65).
+    """
+    return linear_to_lab(srgb_to_linear(rgb))
+
+
+class PaletteMapper:
+    """
+    نگاشت سریع و برداری پیکسل‌ها به نزدیک‌ترین رنگ پالت با جدول جستجوی سه‌بعدی (LUT).
+
+    برای هر پالت یک LUT با bins³ خانه ساخته می‌شود که اندیس نزدیک‌ترین رنگ را برای هر خانه
+    نگه می‌دارد. خانه‌هایی که نزدیک‌ترین رنگ در تمام نقاط آن‌ها یکسان نیست (مرز بین دو رنگ)
+    علامت‌گذاری می‌شوند و پیکسل‌های آن‌ها به صورت دقیق محاسبه می‌شوند، بنابراین خروجی
+    با جستجوی کامل برابر است. LUT هر پالت بر اساس هش آن کش می‌شود.
+
+    Args:
+        bins (int): تعداد خانه‌ها در هر کانال (توانی از ۲ بین ۸ و ۲۵۶).
+        metric (str): 'rgb' (فاصله اقلیدسی RGB) یا 'lab' (ΔE76 در فضای CIELAB).
+    """
+    AMBIGUOUS = -1
+    MAX_CACHED_LUTS = 8
+    _lut_cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, bins=32, metric='rgb'):
+        if bins not in (8, 16, 32, 64, 128, 256):
+            raise ValueError(f"تعداد خانه‌های LUT باید توانی از ۲ بین ۸ و ۲۵۶ باشد: {bins}")
+        if metric not in ('rgb', 'lab'):
+            raise ValueError(f"معیار فاصله نامعتبر است: {metric}")
+        self.bins = bins
+        self.metric = metric
+        self.shift = 8 - int(np.log2(bins))
+
+    def _to_space(self, colors):
+        colors = np.asarray(colors, dtype=np.float32)
+        return srgb_to_lab(colors) if self.metric == 'lab' else colors
+
+    @staticmethod
+    def palette_hash(palette):
+        return hashlib.sha1(np.ascontiguousarray(palette, dtype=np.uint8).tobytes()).hexdigest()
+
+    def _cell_geometry(self, bins, cell_ids):
+        """
+        مرکز (در فضای فاصله) و شعاع خانه‌های cell_ids از سطح bins؛ فقط برای همین خانه‌ها محاسبه می‌شود
+        و نگه داشته نمی‌شود. شعاع هر خانه بیشترین فاصله مرکز تا گوشه‌های آن است.
+        """
+        cell = 256 // bins
+        origins = np.stack(np.unravel_index(cell_ids, (bins,) * 3), axis=-1).astype(np.float32) * cell
+        centers = self._to_space(origins + (cell - 1) / 2)
+        if self.metric == 'rgb':
+            return centers, np.full(len(origins), (cell - 1) * np.sqrt(3) / 2, dtype=np.float32)
+        # گاما برای هر کانال جداگانه است: مقدار خطی دو سر خانه یک بار محاسبه و بین ۸ گوشه ترکیب می‌شود
+        # (گوشه بالایی آخرین خانه هر کانال 255 است)
+        low, high = srgb_to_linear(origins), srgb_to_linear(np.minimum(origins + cell, 255))
+        radius = np.zeros(len(origins), dtype=np.float32)
+        for corner in np.array(np.meshgrid((0, 1), (0, 1), (0, 1), indexing='ij')).reshape(3, -1).T.astype(bool):
+            corners = linear_to_lab(np.where(corner, high, low))
+            radius = np.maximum(radius, np.sqrt(((corners - centers) ** 2).sum(axis=-1)))
+        return centers, radius
+
+    def _nearest_for_cells(self, bins, cell_ids, palette_space):
+        """
+        نزدیک‌ترین رنگ پالت برای خانه‌های cell_ids از سطح bins.
+        از مرکز هر خانه نزدیک‌ترین و دومین رنگ محاسبه می‌شود؛ اگر اختلاف فاصله آن‌ها از دو برابر
+        شعاع خانه بیشتر نباشد، ممکن است نقاط مختلف خانه رنگ‌های متفاوتی داشته باشند و خانه مبهم است.
+        """
+        palette_norms = (palette_space ** 2).sum(axis=1)
+        indices = np.empty(len(cell_ids), dtype=np.int16)
+        chunk = max(1, 4_000_000 // len(palette_space))
+        for start in range(0, len(cell_ids), chunk):
+            points, radius = self._cell_geometry(bins, cell_ids[start:start + chunk])
+            # مجذور فاصله با ضرب ماتریسی: |c|² + |p|² - 2c·p
+            squared = (points ** 2).sum(axis=1)[:, None] + palette_norms[None, :] - 2 * points @ palette_space.T
+            nearest = np.argmin(squared, axis=1).astype(np.int16)
+            if len(palette_space) > 1:
+                nearest_two = np.sqrt(np.maximum(np.partition(squared, 1, axis=1)[:, :2], 0))
+                # حاشیه کوچک برای خطای گرد کردن محاسبات float32
+                margin = 2 * radius + 1e-3
+                nearest[nearest_two[:, 1] - nearest_two[:, 0] <= margin] = self.AMBIGUOUS
+            indices[start:start + chunk] = nearest
+        return indices
+
+    def _build_lut(self, palette):
+        """
+        ساخت LUT دوسطحی: سطح درشت bins³ و برای خانه‌های مبهم آن، سطح ریز با تفکیک ۴ برابر.
+        سطح ریز فشرده نگه داشته می‌شود: شناسه مرتب خانه‌های مبهم سطح درشت و برای هر کدام factor³ اندیس.
+        پیکسل‌هایی که در سطح ریز هم مبهم بمانند، هنگام نگاشت به صورت دقیق محاسبه می‌شوند.
+
+        Returns:
+            tuple: (آرایه bins³ سطح درشت، (شناسه خانه‌های مبهم، آرایه n×factor³ سطح ریز، factor) یا None)
+        """
+        palette_space = self._to_space(palette)
+        coarse = self._nearest_for_cells(self.bins, np.arange(self.bins ** 3), palette_space)
+
+        fine = None
+        factor = min(4, 256 // self.bins)
+        ambiguous_ids = np.flatnonzero(coarse == self.AMBIGUOUS)
+        if factor > 1 and len(ambiguous_ids):
+            fine_bins = self.bins * factor
+            offsets = np.array(np.meshgrid(*[np.arange(factor)] * 3, indexing='ij')).reshape(3, -1).T
+            ambiguous_cells = np.stack(np.unravel_index(ambiguous_ids, (self.bins,) * 3), axis=-1)
+            fine_positions = (ambiguous_cells[:, None, :] * factor + offsets[None, :, :]).reshape(-1, 3)
+            fine_ids = np.ravel_multi_index(fine_positions.T, (fine_bins,) * 3)
+            block = self._nearest_for_cells(fine_bins, fine_ids, palette_space).reshape(len(ambiguous_ids), -1)
+            fine = (ambiguous_ids.astype(np.int32), block, factor)
+        return coarse.reshape(self.bins, self.bins, self.bins), fine
+
+    def get_lut(self, palette):
+        """LUT دوسطحی پالت (از کش، یا در صورت نبود ساخته و کش می‌شود)."""
+        palette = np.ascontiguousarray(palette, dtype=np.uint8).reshape(-1, 3)
+        if len(palette) == 0 or len(palette) > 256:
+            raise ValueError("پالت باید بین ۱ تا ۲۵۶ رنگ داشته باشد.")
+        key = (self.palette_hash(palette), self.bins, self.metric)
+        with self._cache_lock:
+            lut = self._lut_cache.get(key)
+            if lut is not None:
+                self._lut_cache.move_to_end(key)
+                return lut
+        lut = self._build_lut(palette)
+        with self._cache_lock:
+            self._lut_cache[key] = lut
+            while len(self._lut_cache) > self.MAX_CACHED_LUTS:
+                self._lut_cache.popitem(last=False)
+        return lut
+
+    def _exact_nearest(self, pixels, palette):
+        """جستجوی دقیق نزدیک‌ترین رنگ فقط برای رنگ‌های یکتای پیکسل‌های مبهم."""
+        packed = (pixels[:, 0].astype(np.uint32) << 16) | (pixels[:, 1].astype(np.uint32) << 8) | pixels[:, 2]
+        unique_packed, inverse = np.unique(packed, return_inverse=True)
+        unique_colors = np.stack([(unique_packed >> 16) & 255, (unique_packed >> 8) & 255, unique_packed & 255], axis=1)
+        unique_space = self._to_space(unique_colors)
+        palette_space = self._to_space(palette)
+        result = np.empty(len(unique_colors), dtype=np.uint8)
+        chunk = max(1, 2_000_000 // len(palette_space))
+        for start in range(0, len(unique_colors), chunk):
+            distances = np.linalg.norm(unique_space[start:start + chunk, None, :] - palette_space[None, :, :], axis=2)
+            result[start:start + chunk] = np.argmin(distances, axis=1)
+        return result[inverse]
+
+    def map_indices(self, image, palette):
+        """
+        نگاشت تصویر (PIL یا آرایه HxWx3) به آرایه uint8 اندیس‌های پالت با ابعاد HxW.
+        """
+        if isinstance(image, Image.Image):
+            image = np.asarray(image.convert("RGB"))
+        palette = np.ascontiguousarray(palette, dtype=np.uint8).reshape(-1, 3)
+        coarse, fine = self.get_lut(palette)
+
+        shifted = image >> self.shift if self.shift else image
+        indices = coarse[shifted[..., 0], shifted[..., 1], shifted[..., 2]]
+        ambiguous = indices == self.AMBIGUOUS
+        if ambiguous.any():
+            pixels = image[ambiguous]
+            refined = np.full(len(pixels), self.AMBIGUOUS, dtype=np.int16)
+            if fine is not None:
+                ambiguous_ids, block, factor = fine
+                coarse_pixels = pixels >> self.shift if self.shift else pixels
+                slots = np.searchsorted(ambiguous_ids, np.ravel_multi_index(coarse_pixels.T.astype(np.intp), coarse.shape))
+                # موقعیت خانه ریز درون خانه درشت
+                local = (pixels >> (self.shift - int(np.log2(factor)))) - coarse_pixels * factor
+                refined = block[slots, (local[:, 0] * factor + local[:, 1]) * factor + local[:, 2]]
+            still_ambiguous = refined == self.AMBIGUOUS
+            if still_ambiguous.any():
+                refined[still_ambiguous] = self._exact_nearest(pixels[still_ambiguous], palette)
+            indices[ambiguous] = refined
+        return indices.astype(np.uint8)
+
+    def map_image(self, image, palette):
+        """نگاشت تصویر به پالت و بازگرداندن تصویر RGB حاصل."""
+        palette = np.ascontiguousarray(palette, dtype=np.uint8).reshape(-1, 3)
+        return Image.fromarray(palette[self.map_indices(image, palette)])
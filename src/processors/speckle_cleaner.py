@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+from PIL import Image
+
+from .indexed_knot_map import IndexedKnotMap
+
+class SpeckleCleaner:
+    """
+    پاک‌سازی گره‌های منفرد (جزیره‌های رنگی کوچک) در نقشه گره اندیس‌دار.
+
+    برای هر اندیس پالت، مؤلفه‌های همبند با cv2.connectedComponentsWithStats برچسب‌گذاری می‌شوند و
+    جزیره‌های کوچک‌تر از min_knots گره، به رنگ غالب همسایه‌های (غیرجزیره) خود تبدیل می‌شوند.
+    رأی‌گیری همسایه‌ها به صورت برداری و پراکنده انجام می‌شود: فقط جفت‌های (جزیره، رنگ همسایه) موجود
+    شمرده می‌شوند، بنابراین حافظه آن با تعداد جفت‌ها و نه با حاصل‌ضرب تعداد جزیره‌ها در تعداد رنگ‌ها رشد
+    می‌کند (نقشه‌های دیترشده میلیون‌ها جزیره دارند). جزیره‌هایی که فقط با جزیره‌های دیگر همسایه‌اند،
+    در گذرهای بعدی (حداکثر max_passes) ادغام می‌شوند.
+
+    Args:
+        min_knots (int): جزیره‌های با مساحت کمتر از این تعداد گره حذف می‌شوند.
+        connectivity (int): همبندی مؤلفه‌ها (4 یا 8).
+        max_passes (int): حداکثر تعداد گذرهای پاک‌سازی.
+    """
+    # همسایه‌های چهارگانه: (برش گره، برش همسایه)
+    _NEIGHBOURS = (
+        ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+        ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+        ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+        ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+    )
+
+    def __init__(self, min_knots=4, connectivity=4, max_passes=3):
+        if connectivity not in (4, 8):
+            raise ValueError(f"همبندی باید 4 یا 8 باشد: {connectivity}")
+        self.min_knots = min_knots
+        self.connectivity = connectivity
+        self.max_passes = max_passes
+
+    def _label_speckles(self, indices):
+        """
+        شناسه یکتای جزیره‌های کوچک همه رنگ‌ها در یک آرایه (صفر = گره متعلق به ناحیه بزرگ).
+
+        Returns:
+            tuple: (آرایه int32 شناسه جزیره هر گره، تعداد جزیره‌ها)
+        """
+        component = np.zeros(indices.shape, dtype=np.int32)
+        offset = 0
+        for color in np.flatnonzero(np.bincount(indices.reshape(-1))):
+            mask = (indices == color).view(np.uint8)
+            count, labels, stats, _ = cv2.connectedComponentsWithStats(
+                mask, connectivity=self.connectivity, ltype=cv2.CV_32S
+            )
+            small = np.zeros(count, dtype=bool)
+            small[1:] = stats[1:, cv2.CC_STAT_AREA] < self.min_knots
+            n_small = int(small.sum())
+            if n_small == 0:
+                continue
+            ids = np.zeros(count, dtype=np.int32)
+            ids[small] = np.arange(offset + 1, offset + n_small + 1, dtype=np.int32)
+            # برچسب پس‌زمینه (سایر رنگ‌ها) صفر است و به شناسه صفر نگاشت می‌شود
+            component += ids[labels]
+            offset += n_small
+        return component, offset
+
+    def _neighbour_votes(self, indices, component, n_colors):
+        """
+        رنگ برنده رأی همسایه‌های غیرجزیره برای هر جزیره (در تساوی، اندیس کوچک‌تر).
+
+        Returns:
+            tuple: (شناسه جزیره‌های دارای رأی، رنگ برنده هر کدام)
+        """
+        speckle = component > 0
+        codes, counts = [], []
+        for own, neighbour in self._NEIGHBOURS:
+            island_ids = component[own]
+            valid = (island_ids > 0) & ~speckle[neighbour]
+            pair_codes = island_ids[valid].astype(np.int64) * n_colors + indices[neighbour][valid]
+            pair_codes, pair_counts = np.unique(pair_codes, return_counts=True)
+            codes.append(pair_codes)
+            counts.append(pair_counts)
+        codes, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+        islands, colors = codes // n_colors, codes % n_colors
+        # مرتب‌سازی بر اساس جزیره، سپس تعداد رأی نزولی و سپس اندیس رنگ؛ اولین سطر هر جزیره برنده است
+        order = np.lexsort((colors, -counts, islands))
+        islands, colors = islands[order], colors[order]
+        first = np.ones(len(islands), dtype=bool)
+        first[1:] = islands[1:] != islands[:-1]
+        return islands[first], colors[first].astype(np.uint8)
+
+    def clean_indices(self, indices, n_colors=None):
+        """
+        پاک‌سازی آرایه اندیس‌های پالت (uint8، HxW).
+
+        Returns:
+            tuple: (آرایه اندیس پاک‌سازی‌شده، آمار {'islands_merged', 'knots_changed', 'passes'})
+        """
+        indices = np.array(indices, dtype=np.uint8, copy=True)
+        n_colors = n_colors or int(indices.max()) + 1
+        stats = {'islands_merged': 0, 'knots_changed': 0, 'passes': 0}
+        for _ in range(self.max_passes):
+            component, n_islands = self._label_speckles(indices)
+            if n_islands == 0:
+                break
+            stats['passes'] += 1
+
+            voted_islands, winners = self._neighbour_votes(indices, component, n_colors)
+            if len(voted_islands) == 0:
+                break
+            has_vote = np.zeros(n_islands + 1, dtype=bool)
+            has_vote[voted_islands] = True
+            new_color = np.zeros(n_islands + 1, dtype=np.uint8)
+            new_color[voted_islands] = winners
+
+            replace = has_vote[component]
+            indices[replace] = new_color[component[replace]]
+            stats['islands_merged'] += len(voted_islands)
+            stats['knots_changed'] += int(replace.sum())
+        return indices, stats
+
+    def clean(self, image):
+        """
+        پاک‌سازی یک نقشه گره اندیس‌دار (تصویر PIL با مد 'P')؛ پالت بدون تغییر می‌ماند.
+
+        Returns:
+            tuple: (تصویر پاک‌سازی‌شده با مد 'P'، آمار پاک‌سازی)
+        """
+        if not isinstance(image, Image.Image) or image.mode != 'P':
+            raise ValueError("پاک‌سازی گره‌های منفرد به نقشه گره اندیس‌دار (تصویر با مد P) نیاز دارد.")
+        knot_map = IndexedKnotMap.from_image(image)
+        cleaned, stats = self.clean_indices(knot_map.indices, len(knot_map.palette))
+        return IndexedKnotMap(cleaned, knot_map.palette).to_image(), stats
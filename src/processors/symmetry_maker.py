@@ -2,12 +2,26 @@
 import numpy as np
 from PIL import Image, ImageOps
 
+from .indexed_knot_map import append_palette_color
+
 class SymmetryMaker:
-    """کلاس ایجاد تقارن و الگوهای تکرارشونده برای طرح فرش."""
+    """
+    کلاس ایجاد تقارن و الگوهای تکرارشونده برای طرح فرش.
+    نقشه‌های گره اندیس‌دار (مد 'P') در تمام عملیات پالت‌دار باقی می‌مانند.
+    """
     
     def __init__(self):
         pass
 
+    @staticmethod
+    def _new_like(image, size):
+        """بوم خالی هم‌مد تصویر ورودی (برای مد 'P' همراه با همان پالت)."""
+        if image.mode != 'P':
+            return Image.new('RGB', size)
+        result = Image.new('P', size)
+        result.putpalette(image.getpalette())
+        return result
+
     def create_mirror_horizontal(self, image):
         """ایجاد آینه‌ای افقی از نیمه چپ تصویر."""
         if isinstance(image, np.ndarray):
@@ -17,7 +31,7 @@ class SymmetryMaker:
         left_half = image.crop((0, 0, width // 2, height))
         right_half_mirrored = ImageOps.mirror(left_half)
         
-        result = Image.new('RGB', (width, height))
+        result = self._new_like(image, (width, height))
         result.paste(left_half, (0, 0))
         result.paste(right_half_mirrored, (width // 2, 0))
         
@@ -43,7 +57,7 @@ class SymmetryMaker:
         bottom_right = ImageOps.mirror(bottom_left)
         
         # چسباندن ۴ ربع در کنار هم برای ساخت تصویر کامل
-        result = Image.new('RGB', (width, height))
+        result = self._new_like(image, (width, height))
         result.paste(top_left, (0, 0))
         result.paste(top_right, (q_width, 0))
         result.paste(bottom_left, (0, q_height))
@@ -65,15 +79,24 @@ class SymmetryMaker:
         """
         width, height = canvas_size
         
-        # ایجاد پس‌زمینه با رنگ مشخص شده
-        result = Image.new('RGB', canvas_size, background_color)
-        
         if isinstance(center_element, np.ndarray):
             center_element = Image.fromarray(center_element)
         
+        # ایجاد پس‌زمینه با رنگ مشخص شده
+        if center_element.mode == 'P':
+            # رنگ پس‌زمینه به پالت نقشه اندیس‌دار اضافه می‌شود و تغییر اندازه با NEAREST انجام می‌شود
+            # تا رنگ جدیدی خارج از پالت ساخته نشود
+            center_element, background_index = append_palette_color(center_element, background_color)
+            result = self._new_like(center_element, canvas_size)
+            result.paste(background_index, (0, 0, width, height))
+            resample = Image.NEAREST
+        else:
+            result = Image.new('RGB', canvas_size, background_color)
+            resample = Image.LANCZOS
+        
         # تغییر اندازه مدالیون به نصف ابعاد کوچکتر کانvas
         medallion_size = min(width, height) // 2
-        medallion = center_element.resize((medallion_size, medallion_size), Image.LANCZOS)
+        medallion = center_element.resize((medallion_size, medallion_size), resample)
         
         # محاسبه موقعیت مرکز برای چسباندن مدالیون
         center_x = (width - medallion_size) // 2
@@ -1,76 +1,308 @@
 # -*- coding: utf-8 -*-
+import io
 import os
+import re
+import multiprocessing
 import subprocess
 import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
 from PIL import Image
 
+from .indexed_knot_map import IndexedKnotMap
+
+# روش‌های وکتورسازی: color (یک اجرای vtracer روی کل تصویر) و per_color (ردیابی جداگانه ماسک هر رنگ)
+VECTORIZE_MODES = ('color', 'per_color')
+
+_PATH_RE = re.compile(r'<path\b[^>]*/>')
+_FILL_RE = re.compile(r'\s+fill="[^"]*"')
+
+@lru_cache(maxsize=None)
+def find_executable(name):
+    """مسیر ابزار خط فرمان در PATH؛ جستجو فقط یک بار در هر پروسه انجام می‌شود."""
+    return shutil.which(name)
+
+@lru_cache(maxsize=None)
+def load_vtracer_binding():
+    """ماژول پایتونی vtracer (pip install vtracer) در صورت نصب بودن، وگرنه None."""
+    try:
+        import vtracer
+    except ImportError:
+        return None
+    return vtracer if hasattr(vtracer, 'convert_raw_image_to_svg') else None
+
+def vtracer_available():
+    """آیا وکتورسازی با vtracer (ماژول پایتونی یا ابزار خط فرمان) ممکن است؟"""
+    return load_vtracer_binding() is not None or find_executable('vtracer') is not None
+
 class Vectorizer:
     """
     کلاس تبدیل تصاویر رستر به وکتور (SVG, PDF).
-    این کلاس به ابزارهای خط فرمان خارجی مانند vtracer یا potrace نیاز دارد.
+
+    برای vtracer دو پشتیبان وجود دارد: ماژول پایتونی vtracer که درون همین پروسه و بدون فایل موقت
+    اجرا می‌شود (پیش‌فرض در صورت نصب بودن)، و ابزار خط فرمان که تصویر از طریق یک لوله نام‌دار (FIFO)
+    به آن داده می‌شود. جستجوی ماژول و ابزار یک بار در هر پروسه انجام و کش می‌شود.
     """
-    
-    def __init__(self, method='vtracer'):
+    # پس از اولین شکست ابزار خط فرمان در خواندن از FIFO، فایل موقت جایگزین آن می‌شود
+    _cli_pipe_input = hasattr(os, 'mkfifo')
+    # pool پروسه‌های ردیابی تفکیکی رنگ‌ها بین فراخوانی‌ها نگه داشته می‌شود (راه‌اندازی پروسه‌های spawn
+    # و بارگذاری دوباره ماژول‌ها در آن‌ها پرهزینه است)
+    _pool = None
+    _pool_workers = 0
+
+    def __init__(self, method='vtracer', backend='auto'):
         """
         سازنده کلاس.
         در همان ابتدا وجود ابزار مورد نیاز را بررسی می‌کند.
         Args:
             method (str): متد وکتورسازی ('vtracer' یا 'potrace').
+            backend (str): 'auto'، 'python' (ماژول پایتونی vtracer) یا 'cli' (ابزار خط فرمان).
         Raises:
             EnvironmentError: اگر ابزار مورد نیاز در PATH سیستم یافت نشود.
         """
         self.method = method
-        self.executable_path = shutil.which(self.method)
-        
-        if not self.executable_path:
+        self._pool_lock = threading.Lock()
+        self.executable_path = find_executable(self.method)
+        self.binding = load_vtracer_binding() if method == 'vtracer' and backend in ('auto', 'python') else None
+
+        if self.binding is not None:
+            self.backend = 'python'
+        elif self.executable_path and backend in ('auto', 'cli'):
+            self.backend = 'cli'
+        else:
             error_message = (
                 f"ابزار '{self.method}' در سیستم شما یافت نشد.\n"
                 "لطفاً آن را نصب کرده و در مسیر (PATH) سیستم قرار دهید.\n"
                 "راهنمای نصب:\n"
-                " - vtracer: https://github.com/visioncortex/vtracer (پیشنهادی برای تصاویر رنگی)\n"
+                " - vtracer: `pip install vtracer` یا https://github.com/visioncortex/vtracer (پیشنهادی برای تصاویر رنگی)\n"
                 " - potrace: http://potrace.sourceforge.net/ (برای تصاویر سیاه و سفید)"
             )
             raise EnvironmentError(error_message)
-        
-        print(f"✅ ابزار وکتورسازی '{self.method}' در مسیر '{self.executable_path}' یافت شد.")
-        
+
+        if self.backend == 'python':
+            print(f"✅ ماژول پایتونی '{self.method}' برای وکتورسازی درون پروسه استفاده می‌شود.")
+        else:
+            print(f"✅ ابزار وکتورسازی '{self.method}' در مسیر '{self.executable_path}' یافت شد.")
+
+    def __getstate__(self):
+        # ماژول پایتونی قابل pickle نیست؛ در پروسه کارگر دوباره بارگذاری می‌شود
+        state = self.__dict__.copy()
+        state['binding'] = None
+        # pool و قفل آن فقط در پروسه اصلی معنا دارند
+        state.pop('_pool', None)
+        state.pop('_pool_workers', None)
+        state.pop('_pool_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+        if self.backend == 'python':
+            self.binding = load_vtracer_binding()
+
+    def _get_pool(self, workers):
+        """pool پروسه‌های ردیابی با workers پروسه؛ pool قبلی در صورت هم‌اندازه بودن دوباره استفاده می‌شود."""
+        with self._pool_lock:
+            if self._pool is None or self._pool_workers != workers:
+                if self._pool is not None:
+                    # ردیابی‌های در حال اجرا روی pool قبلی همچنان کامل می‌شوند
+                    self._pool.shutdown(wait=False)
+                mp_context = multiprocessing.get_context('spawn')
+                self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+                self._pool_workers = workers
+            return self._pool
+
+    def close(self):
+        """بستن pool پروسه‌های ردیابی (در صورت وجود)."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool, self._pool_workers = None, 0
+
+    @staticmethod
+    def _encode_png(image):
+        """کدگذاری تصویر به PNG در حافظه (فشرده‌سازی سریع؛ اندازه فایل اهمیتی ندارد)."""
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', compress_level=1)
+        return buffer.getvalue()
+
+    def _run_cli_with_pipe(self, png_bytes, args):
+        """
+        اجرای ابزار خط فرمان با ورودی از یک لوله نام‌دار (FIFO): داده‌های PNG در یک ریسمان جداگانه
+        مستقیماً از حافظه به پروسه داده می‌شود و هیچ داده‌ای روی دیسک نوشته نمی‌شود.
+        """
+        with tempfile.TemporaryDirectory(prefix='vtracer_') as pipe_dir:
+            # پسوند png لازم است تا vtracer قالب ورودی را تشخیص دهد
+            pipe_path = os.path.join(pipe_dir, 'input.png')
+            os.mkfifo(pipe_path)
+
+            def feed():
+                try:
+                    with open(pipe_path, 'wb') as pipe:
+                        pipe.write(png_bytes)
+                except OSError:
+                    pass  # پروسه پیش از خواندن کامل ورودی بسته شد؛ خطای آن از خود پروسه گزارش می‌شود
+
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+            try:
+                return subprocess.run([self.executable_path, '--input', pipe_path] + args,
+                                      check=True, capture_output=True, text=True, encoding='utf-8')
+            finally:
+                if feeder.is_alive():
+                    # پروسه بدون باز کردن لوله خارج شد: باز کردن سمت خواندن، ریسمان نویسنده را آزاد می‌کند
+                    os.close(os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK))
+                feeder.join()
+
+    def _run_cli_with_temp_file(self, png_bytes, args):
+        """اجرای ابزار خط فرمان با یک فایل PNG موقت (برای سیستم‌های بدون FIFO)."""
+        with tempfile.TemporaryDirectory(prefix='vtracer_') as temp_dir:
+            temp_png = os.path.join(temp_dir, 'input.png')
+            with open(temp_png, 'wb') as f:
+                f.write(png_bytes)
+            return subprocess.run([self.executable_path, '--input', temp_png] + args,
+                                  check=True, capture_output=True, text=True, encoding='utf-8')
+
+    def _run_cli(self, png_bytes, args):
+        if Vectorizer._cli_pipe_input:
+            try:
+                return self._run_cli_with_pipe(png_bytes, args)
+            except subprocess.CalledProcessError:
+                # برخی نسخه‌های vtracer ورودی را seek می‌کنند و از FIFO نمی‌خوانند
+                result = self._run_cli_with_temp_file(png_bytes, args)
+                Vectorizer._cli_pipe_input = False
+                return result
+        return self._run_cli_with_temp_file(png_bytes, args)
+
     def vectorize_vtracer(self, image, output_path, **kwargs):
         """وکتوری‌سازی با vtracer با قابلیت تنظیم پارامترها."""
         if isinstance(image, np.ndarray):
             image = Image.fromarray(image)
+        if image.mode == 'P':
+            # نقشه گره اندیس‌دار برای vtracer به RGB باز می‌شود
+            image = image.convert('RGB')
         
-        temp_png = output_path.replace('.svg', '_temp.png')
-        image.save(temp_png)
-        
-        cmd = [
-            self.executable_path,
-            '--input', temp_png,
-            '--output', output_path,
-            '--colormode', 'color',
-            '--hierarchical', 'stacked',
+        params = {
+            'colormode': 'color',
+            'hierarchical': 'stacked',
             # --- پارامترهای قابل تنظیم ---
-            '--filter_speckle', str(kwargs.get('filter_speckle', 4)),
-            '--color_precision', str(kwargs.get('color_precision', 6)),
-            '--corner_threshold', str(kwargs.get('corner_threshold', 60)),
-        ]
-        
-        print(f"   - اجرای دستور vtracer با پارامترها: {kwargs}")
+            'filter_speckle': int(kwargs.get('filter_speckle', 4)),
+            'color_precision': int(kwargs.get('color_precision', 6)),
+            'corner_threshold': int(kwargs.get('corner_threshold', 60)),
+        }
+        if self.backend == 'python':
+            print(f"   - اجرای vtracer (درون پروسه) با پارامترها: {kwargs}")
+        else:
+            print(f"   - اجرای دستور vtracer با پارامترها: {kwargs}")
+        self._trace(self._encode_png(image), params, output_path)
+        return output_path
 
-        try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True, encoding='utf-8')
+    def _trace(self, png_bytes, params, output_path):
+        """ردیابی تصویر PNG (بایت‌های درون حافظه) با vtracer و ذخیره SVG در output_path."""
+        if self.backend == 'python':
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(self._trace_to_string(png_bytes, params))
+            return
+        args = ['--output', output_path]
+        for name, value in params.items():
+            args += [f'--{name}', str(value)]
+        result = self._run_cli(png_bytes, args)
+        if result.stdout.strip():
             print(f"   - vtracer output: {result.stdout}")
-            return output_path
-        finally:
-            if os.path.exists(temp_png):
-                os.remove(temp_png)
 
-    def vectorize(self, image, output_path, **kwargs):
+    def _trace_to_string(self, png_bytes, params):
+        """ردیابی تصویر PNG و بازگرداندن متن SVG؛ ماژول پایتونی بدون فایل موقت، ابزار خط فرمان با یک SVG موقت."""
+        if self.backend == 'python':
+            return self.binding.convert_raw_image_to_svg(png_bytes, img_format='png', **params)
+        with tempfile.TemporaryDirectory(prefix='vtracer_') as temp_dir:
+            svg_path = os.path.join(temp_dir, 'mask.svg')
+            self._trace(png_bytes, params, svg_path)
+            with open(svg_path, encoding='utf-8') as f:
+                return f.read()
+
+    def _trace_mask(self, png_bytes, params):
+        """
+        ردیابی یک ماسک دودویی (گره‌های رنگ = سیاه) با حالت binary در vtracer؛ در پروسه کارگر اجرا می‌شود.
+
+        Returns:
+            list: عناصر <path> بدون ویژگی fill (رنگ از گروه والد به ارث می‌رسد).
+        """
+        svg = self._trace_to_string(png_bytes, params)
+        return [_FILL_RE.sub('', path) for path in _PATH_RE.findall(svg)]
+
+    def vectorize_per_color(self, image, output_path, workers=None, **kwargs):
+        """
+        وکتورسازی لایه‌ای نقشه گره اندیس‌دار: ماسک هر رنگ (بریده‌شده به کادر محیطی آن) جداگانه با حالت
+        binary در vtracer و به صورت موازی در pool پروسه‌ها ردیابی می‌شود و مسیرها در یک SVG با یک
+        گروه <g> برای هر رنگ نخ ادغام می‌شوند. پرتکرارترین رنگ به جای ردیابی، یک مستطیل زمینه در
+        پایین‌ترین لایه است و سایر رنگ‌ها به ترتیب مساحت نزولی روی آن قرار می‌گیرند، بنابراین درزی
+        بین لایه‌ها باقی نمی‌ماند.
+
+        Args:
+            image: تصویر PIL با مد 'P' (نقشه گره اندیس‌دار).
+            workers (int): تعداد پروسه‌های ردیابی (پیش‌فرض: تعداد هسته‌ها).
+        """
+        if not isinstance(image, Image.Image) or image.mode != 'P':
+            raise ValueError("وکتورسازی تفکیکی رنگ‌ها به نقشه گره اندیس‌دار (تصویر با مد P) نیاز دارد.")
+        knot_map = IndexedKnotMap.from_image(image)
+        indices, palette = knot_map.indices, knot_map.palette
+        height, width = indices.shape
+        counts = np.bincount(indices.reshape(-1), minlength=len(palette))
+        order = [int(c) for c in np.argsort(-counts, kind='stable') if counts[c] > 0]
+        params = {
+            'colormode': 'binary',
+            'filter_speckle': int(kwargs.get('filter_speckle', 4)),
+            'corner_threshold': int(kwargs.get('corner_threshold', 60)),
+        }
+
+        jobs = []
+        for color in order[1:]:
+            mask = indices == color
+            rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+            y0, x0 = int(rows[0]), int(cols[0])
+            crop = mask[y0:rows[-1] + 1, x0:cols[-1] + 1]
+            # در حالت binary نواحی سیاه ردیابی می‌شوند
+            jobs.append((color, x0, y0, self._encode_png(Image.fromarray(~crop))))
+
+        pool_workers = max(1, workers or os.cpu_count() or 1)
+        # اندازه pool به تعداد رنگ‌های هر تصویر وابسته نیست تا بین فراخوانی‌ها دوباره ساخته نشود
+        workers = max(1, min(pool_workers, len(jobs)))
+        print(f"   - ردیابی {len(jobs)} رنگ با {workers} پروسه (vtracer binary، پارامترها: {kwargs})")
+        if workers > 1:
+            pool = self._get_pool(pool_workers)
+            traced = list(pool.map(self._trace_mask, [job[3] for job in jobs], [params] * len(jobs)))
+        else:
+            traced = [self._trace_mask(job[3], params) for job in jobs]
+
+        def hex_color(color):
+            return '#%02x%02x%02x' % tuple(int(v) for v in palette[color])
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write(f'<svg version="1.1" xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">\n')
+            f.write(f'<g id="color-{order[0] + 1}" fill="{hex_color(order[0])}">\n'
+                    f'<rect x="0" y="0" width="{width}" height="{height}"/>\n</g>\n')
+            for (color, x0, y0, _), paths in zip(jobs, traced):
+                f.write(f'<g id="color-{color + 1}" fill="{hex_color(color)}" transform="translate({x0},{y0})">\n')
+                f.write('\n'.join(paths))
+                f.write('\n</g>\n')
+            f.write('</svg>\n')
+        return output_path
+
+    def vectorize(self, image, output_path, mode='color', workers=None, **kwargs):
         """
         اجرای وکتورسازی با متد انتخاب شده در سازنده کلاس.
+        Args:
+            mode (str): 'color' یا 'per_color' (ردیابی موازی هر رنگ نقشه اندیس‌دار؛ برای تصاویر بدون
+                پالت به 'color' برمی‌گردد).
         """
         print(f"🔄 در حال وکتورسازی تصویر با استفاده از {self.method}...")
         try:
+            if self.method == 'vtracer' and mode == 'per_color' and getattr(image, 'mode', None) == 'P':
+                return self.vectorize_per_color(image, output_path, workers=workers, **kwargs)
             if self.method == 'vtracer':
                 return self.vectorize_vtracer(image, output_path, **kwargs)
             else:
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+from PIL import Image
+
+def save_values(directory, values, prefix=''):
+    """
+    ذخیره دیکشنری مقادیر یک مرحله در یک پوشه.
+    تصاویر PIL به صورت PNG، آرایه‌های numpy به صورت npy و سایر مقادیر (قابل تبدیل به JSON)
+    مستقیماً در متادیتای برگشتی نگهداری می‌شوند.
+
+    Returns:
+        dict: متادیتای لازم برای بازیابی مقادیر با load_values.
+    """
+    meta = {}
+    for name, value in values.items():
+        if isinstance(value, Image.Image):
+            file_name = f"{prefix}{name}.png"
+            value.save(os.path.join(directory, file_name))
+            meta[name] = {'type': 'image', 'file': file_name}
+        elif isinstance(value, np.ndarray):
+            file_name = f"{prefix}{name}.npy"
+            np.save(os.path.join(directory, file_name), value)
+            meta[name] = {'type': 'array', 'file': file_name}
+        else:
+            meta[name] = {'type': 'json', 'value': value}
+    return meta
+
+def load_values(directory, meta):
+    """بازیابی مقادیری که با save_values ذخیره شده‌اند."""
+    values = {}
+    for name, item in meta.items():
+        if item['type'] == 'image':
+            with Image.open(os.path.join(directory, item['file'])) as img:
+                img.load()
+                values[name] = img.copy()
+        elif item['type'] == 'array':
+            values[name] = np.load(os.path.join(directory, item['file']))
+        else:
+            values[name] = item['value']
+    return values
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from .weaving_chart import WeavingChartReader
+
+# نمادهای رنگ‌ها در جدول گره (نویسه‌های مبهم مانند O/0 و I/1/l حذف شده‌اند)
+SYMBOLS = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789abdefghkmnpqrtuwy+*#%@&=?<>"
+# ابعاد صفحه A4 بر حسب پوینت
+PAGE_SIZE_PT = (595, 842)
+PAGE_MARGIN_PT = 24
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow قدیمی بدون FreeType
+        return ImageFont.load_default()
+
+def symbol_for(index):
+    """نماد رنگ index؛ پس از اتمام نویسه‌های تکی، نمادهای دونویسه‌ای ساخته می‌شوند."""
+    if index < len(SYMBOLS):
+        return SYMBOLS[index]
+    index -= len(SYMBOLS)
+    return SYMBOLS[index // len(SYMBOLS)] + SYMBOLS[index % len(SYMBOLS)]
+
+
+class _PDFWriter:
+    """
+    نویسنده حداقلی PDF جریانی: هر صفحه یک تصویر رستری پالت‌دار (Indexed + FlateDecode) است و
+    بلافاصله پس از دریافت در فایل نوشته می‌شود؛ فقط موقعیت اشیا در حافظه می‌ماند.
+    ترتیب صفحات در سند (Kids) مستقل از ترتیب نوشتن آن‌ها در فایل است.
+    """
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._offsets = {}
+        # شیء ۱: Catalog و شیء ۲: Pages (در پایان نوشته می‌شود)
+        self._next_id = 3
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode('ascii'))
+        self._file.write(body)
+        if stream is not None:
+            self._file.write(b'\nstream\n')
+            self._file.write(stream)
+            self._file.write(b'\nendstream')
+        self._file.write(b'\nendobj\n')
+
+    def add_page(self, width, height, compressed_indices, palette):
+        """افزودن یک صفحه با تصویر پالت‌دار width×height (اندیس‌های فشرده‌شده با zlib). شناسه صفحه برگردانده می‌شود."""
+        page_id, image_id, content_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+        palette_hex = np.asarray(palette, dtype=np.uint8).tobytes().hex().upper()
+        self._write_object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace [/Indexed /DeviceRGB {len(palette) - 1} <{palette_hex}>] "
+            f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(compressed_indices)} >>"
+        ).encode('ascii'), compressed_indices)
+
+        # جای‌گیری تصویر در صفحه A4 (افقی یا عمودی بر اساس نسبت تصویر) با حفظ نسبت ابعاد
+        page_w, page_h = PAGE_SIZE_PT if height >= width else PAGE_SIZE_PT[::-1]
+        scale = min((page_w - 2 * PAGE_MARGIN_PT) / width, (page_h - 2 * PAGE_MARGIN_PT) / height)
+        draw_w, draw_h = width * scale, height * scale
+        x, y = (page_w - draw_w) / 2, (page_h - draw_h) / 2
+        content = f"q {draw_w:.3f} 0 0 {draw_h:.3f} {x:.3f} {y:.3f} cm /Im0 Do Q".encode('ascii')
+        self._write_object(content_id, f"<< /Length {len(content)} >>".encode('ascii'), content)
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w} {page_h}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode('ascii'))
+        return page_id
+
+    def close(self, page_ids):
+        kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('ascii'))
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._file.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode('ascii'))
+        for obj_id in range(1, size):
+            self._file.write(f"{self._offsets[obj_id]:010d} 00000 n \n".encode('ascii'))
+        self._file.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+
+class WeavingChartPDF:
+    """
+    رندر جدول گره چاپی (شبکه با نماد هر رنگ) در یک PDF چندصفحه‌ای.
+
+    نقشه گره اندیس‌دار به کاشی‌های knots_per_page × knots_per_page تقسیم می‌شود. هر صفحه با خط‌کش
+    شماره رج و گره (هر ۱۰ گره) به صورت برداری از کاشی‌های از پیش ساخته‌شده نماد رنگ‌ها ساخته،
+    در ریسمان‌های موازی رندر و فشرده، و به ترتیب در فایل نوشته می‌شود. منبع می‌تواند تصویر مد 'P'
+    یا یک WeavingChartReader باشد؛ در حالت دوم فقط یک نوار knots_per_page رجی در حافظه است.
+    صفحه اول راهنمای رنگ‌ها (نماد، رنگ، تعداد گره) است.
+
+    Args:
+        knots_per_page (int): تعداد گره‌های هر ضلع کاشی صفحه.
+        cell_px (int): اندازه هر گره در تصویر صفحه (پیکسل).
+        workers (int): تعداد ریسمان‌های رندر (پیش‌فرض: تعداد هسته‌ها، حداکثر ۸).
+    """
+    def __init__(self, knots_per_page=100, cell_px=20, workers=None):
+        self.knots_per_page = knots_per_page
+        self.cell_px = cell_px
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.ruler_px = cell_px * 3
+        self.header_px = cell_px * 2
+
+    def _prepare(self, palette):
+        """پالت صفحات (رنگ‌های نقشه + سیاه، سفید و خاکستری شبکه) و کاشی نماد هر رنگ."""
+        palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        n_colors = len(palette)
+        if n_colors > 253:
+            raise ValueError("جدول گره حداکثر ۲۵۳ رنگ را پشتیبانی می‌کند.")
+        self.black, self.white, self.gray = n_colors, n_colors + 1, n_colors + 2
+        self.page_palette = np.vstack([palette, [[0, 0, 0], [255, 255, 255], [160, 160, 160]]]).astype(np.uint8)
+        self.font = _font(max(8, int(self.cell_px * 0.7)))
+        self.ruler_font = _font(max(8, int(self.cell_px * 0.6)))
+
+        cell = self.cell_px
+        luminance = palette.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        self.symbol_tiles = np.empty((n_colors, cell, cell), dtype=np.uint8)
+        for index in range(n_colors):
+            glyph = Image.new('L', (cell, cell), 0)
+            ImageDraw.Draw(glyph).text((cell / 2, cell / 2), symbol_for(index), fill=255, font=self.font, anchor='mm')
+            text_color = self.black if luminance[index] > 140 else self.white
+            self.symbol_tiles[index] = np.where(np.asarray(glyph) > 127, text_color, index)
+
+    def _render_page(self, tile, y0, x0, page_no, n_pages):
+        """رندر یک کاشی نقشه (آرایه اندیس h×w) به صورت اندیس‌های فشرده تصویر صفحه."""
+        rows, cols = tile.shape
+        cell = self.cell_px
+        grid = self.symbol_tiles[tile].transpose(0, 2, 1, 3).reshape(rows * cell, cols * cell)
+        grid[::cell, :] = self.gray
+        grid[:, ::cell] = self.gray
+        # خطوط پررنگ هر ۱۰ گره (بر اساس شماره مطلق رج و گره)
+        for r in np.flatnonzero((y0 + np.arange(rows)) % 10 == 0):
+            grid[r * cell:r * cell + 2, :] = self.black
+        for c in np.flatnonzero((x0 + np.arange(cols)) % 10 == 0):
+            grid[:, c * cell:c * cell + 2] = self.black
+
+        left, top = self.ruler_px, self.header_px + self.ruler_px
+        width, height = left + cols * cell + cell, top + rows * cell + cell
+        page = np.full((height, width), self.white, dtype=np.uint8)
+        page[top:top + rows * cell, left:left + cols * cell] = grid
+        page[top + rows * cell:top + rows * cell + 2, left:left + cols * cell + 2] = self.black
+        page[top:top + rows * cell + 2, left + cols * cell:left + cols * cell + 2] = self.black
+
+        image = Image.fromarray(page)
+        draw = ImageDraw.Draw(image)
+        draw.text((left, self.header_px / 2), f"Rows {y0 + 1}-{y0 + rows}   Knots {x0 + 1}-{x0 + cols}   "
+                  f"Page {page_no}/{n_pages}", fill=int(self.black), font=self.font, anchor='lm')
+        for c in range(cols):
+            if (x0 + c + 1) % 10 == 0:
+                draw.text((left + c * cell + cell / 2, top - cell / 2), str(x0 + c + 1),
+                          fill=int(self.black), font=self.ruler_font, anchor='ms')
+        for r in range(rows):
+            if (y0 + r + 1) % 10 == 0:
+                draw.text((left - cell / 4, top + r * cell + cell / 2), str(y0 + r + 1),
+                          fill=int(self.black), font=self.ruler_font, anchor='rm')
+        return width, height, zlib.compress(image.tobytes(), 6)
+
+    def _render_legend(self, counts):
+        """صفحه راهنمای رنگ‌ها: نماد، کد رنگ و تعداد گره هر رنگ در ستون‌های متوالی."""
+        n_colors = len(self.symbol_tiles)
+        cell = self.cell_px
+        line_px = cell * 2
+        width = cell * 100
+        height = int(width * PAGE_SIZE_PT[1] / PAGE_SIZE_PT[0])
+        per_column = max(1, (height - 4 * line_px) // line_px)
+        column_px = cell * 32
+        width = max(width, column_px * -(-n_colors // per_column) + 2 * cell)
+        page = np.full((height, width), self.white, dtype=np.uint8)
+        image = Image.fromarray(page)
+        draw = ImageDraw.Draw(image)
+        draw.text((cell, line_px), f"Color legend - {n_colors} colors, {int(counts.sum()):,} knots",
+                  fill=int(self.black), font=self.font, anchor='lm')
+        for index in range(n_colors):
+            column, row = divmod(index, per_column)
+            x, y = cell + column * column_px, 3 * line_px + row * line_px
+            swatch = Image.fromarray(np.kron(self.symbol_tiles[index], np.ones((2, 2), dtype=np.uint8)))
+            image.paste(swatch, (x, y - cell))
+            color = self.page_palette[index]
+            draw.text((x + 3 * cell, y), f"{symbol_for(index):<3} #{int(color[0]):02x}{int(color[1]):02x}{int(color[2]):02x}"
+                      f"  {int(counts[index]):,}", fill=int(self.black), font=self.font, anchor='lm')
+        return width, height, zlib.compress(image.tobytes(), 6)
+
+    def _iter_bands(self, source):
+        """نوارهای knots_per_page رجی منبع (تصویر مد 'P'، آرایه اندیس یا WeavingChartReader)."""
+        if isinstance(source, WeavingChartReader):
+            band = []
+            for row in source.iter_rows():
+                band.append(row)
+                if len(band) == self.knots_per_page:
+                    yield np.stack(band)
+                    band = []
+            if band:
+                yield np.stack(band)
+            return
+        indices = np.asarray(source)
+        for y0 in range(0, indices.shape[0], self.knots_per_page):
+            yield indices[y0:y0 + self.knots_per_page]
+
+    def render(self, source, output_path, palette=None):
+        """
+        رندر جدول گره منبع در output_path.
+
+        Args:
+            source: تصویر PIL با مد 'P'، آرایه uint8 اندیس‌ها (با palette) یا WeavingChartReader.
+
+        Returns:
+            str: مسیر فایل PDF.
+        """
+        if isinstance(source, Image.Image):
+            if source.mode != 'P':
+                raise ValueError("جدول گره به نقشه گره اندیس‌دار (تصویر با مد P) نیاز دارد.")
+            palette = np.array(source.getpalette(), dtype=np.uint8).reshape(-1, 3)
+            height, width = source.height, source.width
+        elif isinstance(source, WeavingChartReader):
+            palette, height, width = source.palette, source.height, source.width
+        else:
+            height, width = np.asarray(source).shape
+        if palette is None:
+            raise ValueError("برای آرایه اندیس‌ها پالت لازم است.")
+        self._prepare(palette)
+
+        kpp = self.knots_per_page
+        pages_x = -(-width // kpp)
+        n_pages = -(-height // kpp) * pages_x + 1
+        counts = np.zeros(256, dtype=np.int64)
+        writer = _PDFWriter(output_path)
+        page_ids = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                # حداکثر دو برابر تعداد ریسمان‌ها صفحه در صف تا حافظه محدود بماند
+                pending = deque()
+                page_no = 1
+                for band_index, band in enumerate(self._iter_bands(source)):
+                    counts += np.bincount(band.reshape(-1), minlength=256)
+                    for x0 in range(0, width, kpp):
+                        page_no += 1
+                        tile = np.ascontiguousarray(band[:, x0:x0 + kpp])
+                        pending.append(executor.submit(self._render_page, tile, band_index * kpp, x0, page_no, n_pages))
+                        while len(pending) > 2 * self.workers:
+                            page_ids.append(writer.add_page(*pending.popleft().result(), self.page_palette))
+                while pending:
+                    page_ids.append(writer.add_page(*pending.popleft().result(), self.page_palette))
+            legend_id = writer.add_page(*self._render_legend(counts[:len(palette)]), self.page_palette)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close([legend_id] + page_ids)
+        return output_path
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+
+try:
+    import resource
+except ImportError:  # ویندوز
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss_bytes():
+    """حافظه مقیم فعلی پروسه (RSS) به بایت؛ در صورت عدم دسترسی None."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+def available_memory_bytes():
+    """حافظه RAM آزاد سیستم به بایت؛ در صورت عدم دسترسی None."""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def peak_rss_bytes():
+    """بیشینه RSS پروسه از ابتدای اجرا (ru_maxrss)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # در لینوکس کیلوبایت و در macOS بایت
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+def _cuda():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return torch.cuda
+    except ImportError:
+        pass
+    return None
+
+def _to_mb(value):
+    return round(value / (1024 * 1024), 2) if value is not None else None
+
+
+class StageMeter:
+    """
+    اندازه‌گیری زمان، CPU و حافظه یک مرحله با context manager.
+
+    - wall_seconds: زمان واقعی اجرا
+    - thread_cpu_seconds: زمان CPU ریسمان اجراکننده مرحله
+    - process_cpu_seconds: زمان CPU کل پروسه (شامل ریسمان‌های torch/BLAS؛ با مراحل همزمان هم‌پوشانی دارد)
+    - peak_rss_mb: بیشینه RSS پروسه در طول مرحله (نمونه‌برداری دوره‌ای)
+    - peak_cuda_mb: بیشینه حافظه CUDA تخصیص‌یافته در طول مرحله (در صورت وجود GPU)
+    """
+    def __init__(self, sample_interval=0.05):
+        self.sample_interval = sample_interval
+        self.result = {}
+        self._stop = threading.Event()
+        self._sampler = None
+        self._peak_rss = None
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            rss = current_rss_bytes()
+            if rss is not None and (self._peak_rss is None or rss > self._peak_rss):
+                self._peak_rss = rss
+
+    def __enter__(self):
+        self._cuda = _cuda()
+        if self._cuda is not None:
+            self._cuda.reset_peak_memory_stats()
+        self._rss_start = current_rss_bytes()
+        self._peak_rss = self._rss_start
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._wall_start = time.perf_counter()
+        self._thread_cpu_start = time.thread_time()
+        self._process_cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        thread_cpu = time.thread_time() - self._thread_cpu_start
+        process_cpu = time.process_time() - self._process_cpu_start
+        self._stop.set()
+        self._sampler.join()
+
+        rss_end = current_rss_bytes()
+        if rss_end is not None and (self._peak_rss is None or rss_end > self._peak_rss):
+            self._peak_rss = rss_end
+        self.result = {
+            'wall_seconds': round(wall, 4),
+            'thread_cpu_seconds': round(thread_cpu, 4),
+            'process_cpu_seconds': round(process_cpu, 4),
+            'peak_rss_mb': _to_mb(self._peak_rss),
+            'rss_delta_mb': _to_mb(rss_end - self._rss_start) if rss_end is not None and self._rss_start is not None else None,
+            'peak_cuda_mb': _to_mb(self._cuda.max_memory_allocated()) if self._cuda is not None else None,
+        }
+        return False
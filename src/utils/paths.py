@@ -21,6 +21,7 @@ CONFIG_DIR = os.path.join(ROOT_DIR, 'config')
 MODELS_DIR = os.path.join(ROOT_DIR, 'models')
 OUTPUT_DIR = os.path.join(ROOT_DIR, 'output')
 SRC_DIR = os.path.join(ROOT_DIR, 'src')
+CACHE_DIR = os.path.join(ROOT_DIR, 'cache')
 
 # تعریف مسیر فایل‌های کلیدی
 DEFAULT_CONFIG_PATH = os.path.join(CONFIG_DIR, 'model_config.yaml')
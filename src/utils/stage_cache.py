@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import hashlib
+import uuid
+import numpy as np
+from PIL import Image
+
+from . import paths
+from .artifact_io import save_values, load_values
+
+class StageCache:
+    """
+    کش دیسکی و مبتنی بر محتوا (content-addressed) برای خروجی مراحل پایپلاین.
+    کلید هر ورودی از هش تصویر ورودی مرحله و برش تنظیمات مرتبط با همان مرحله ساخته می‌شود،
+    بنابراین تغییر تنظیمات مراحل پایین‌دستی (مثلاً پالت) باعث محاسبه مجدد مراحل بالادستی نمی‌شود.
+    حجم کل کش محدود است و قدیمی‌ترین ورودی‌ها (LRU) حذف می‌شوند.
+    چند پروسه (مثلاً کارگرهای CPU اجرای دسته‌ای) می‌توانند همزمان از یک پوشه کش استفاده کنند: ورودی‌ها
+    اتمیک جایگزین می‌شوند و ناپدید شدن ورودی‌ها توسط پروسه دیگر، خطای مرحله محسوب نمی‌شود.
+    """
+    META_FILE = 'meta.json'
+
+    def __init__(self, cache_dir=paths.CACHE_DIR, max_size_mb=2048, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_image(image):
+        """هش SHA-256 از محتوای پیکسلی، مُد و ابعاد تصویر (یا آرایه numpy)."""
+        hasher = hashlib.sha256()
+        if isinstance(image, Image.Image):
+            hasher.update(f"{image.mode}:{image.size}".encode('utf-8'))
+            if image.mode == 'P':
+                hasher.update(bytes(image.getpalette() or []))
+            hasher.update(image.tobytes())
+        else:
+            array = np.ascontiguousarray(image)
+            hasher.update(f"{array.dtype}:{array.shape}".encode('utf-8'))
+            hasher.update(array.tobytes())
+        return hasher.hexdigest()
+
+    @staticmethod
+    def hash_value(value):
+        """هش یک مقدار دلخواه: تصاویر و آرایه‌ها با hash_image و سایر مقادیر از روی نمایش JSON."""
+        if isinstance(value, (Image.Image, np.ndarray)):
+            return StageCache.hash_image(value)
+        payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_key(stage_name, input_hash, config_slice):
+        """ساخت کلید یکتا از نام مرحله، هش ورودی و تنظیمات مرتبط با مرحله."""
+        payload = json.dumps(
+            {'stage': stage_name, 'input': input_hash, 'config': config_slice},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        بازیابی دیکشنری مقادیر ذخیره‌شده برای یک کلید.
+        در صورت عدم وجود (یا خرابی ورودی) None برمی‌گرداند.
+        """
+        if not self.enabled:
+            return None
+
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, self.META_FILE)
+        if not os.path.exists(meta_path):
+            self.misses += 1
+            return None
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            values = load_values(entry_dir, meta['values'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ ورودی کش '{key[:12]}' خراب است و حذف می‌شود: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self.misses += 1
+            return None
+
+        # به‌روزرسانی زمان دسترسی برای سیاست LRU (ورودی ممکن است همزمان توسط پروسه دیگری حذف شده باشد)
+        try:
+            os.utime(meta_path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return values
+
+    def put(self, key, values):
+        """
+        ذخیره دیکشنری مقادیر یک مرحله (با فرمت‌های save_values).
+        """
+        if not self.enabled:
+            return
+
+        entry_dir = self._entry_dir(key)
+        temp_dir = f"{entry_dir}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(temp_dir, exist_ok=True)
+            meta = {'values': save_values(temp_dir, values)}
+            with open(os.path.join(temp_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(temp_dir, entry_dir)
+        except OSError as e:
+            print(f"⚠️ امکان ذخیره در کش وجود نداشت: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+
+        # خروجی مرحله ذخیره شده است؛ خطای حذف ورودی‌های قدیمی نباید مرحله را ناموفق کند
+        try:
+            self.evict()
+        except OSError as e:
+            print(f"⚠️ حذف ورودی‌های قدیمی کش انجام نشد: {e}")
+
+    def _entry_size(self, entry_dir):
+        total = 0
+        for file_name in os.listdir(entry_dir):
+            total += os.path.getsize(os.path.join(entry_dir, file_name))
+        return total
+
+    def evict(self):
+        """حذف قدیمی‌ترین ورودی‌ها تا زمانی که حجم کل کش از سقف مجاز کمتر شود."""
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            # پوشه‌های .tmp ورودی‌های در حال نوشتن (در همین یا پروسه‌ای دیگر) هستند
+            if name.endswith('.tmp'):
+                continue
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry_dir, self.META_FILE)
+            if not os.path.isdir(entry_dir) or not os.path.exists(meta_path):
+                continue
+            try:
+                size = self._entry_size(entry_dir)
+                mtime = os.path.getmtime(meta_path)
+            except OSError:
+                # ورودی در حین پیمایش توسط پروسه دیگری حذف یا جایگزین شد
+                continue
+            entries.append((mtime, size, entry_dir))
+            total_size += size
+
+        entries.sort()
+        for _, size, entry_dir in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        """حذف کامل محتوای کش."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import re
+import time
+
+_PATH_TAG_RE = re.compile(r'<path\b([^>]*?)/>', re.S)
+_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*"([^"]*)"')
+_TRANSLATE_RE = re.compile(r'^\s*translate\(\s*([-+\d.eE]+)(?:[\s,]+([-+\d.eE]+))?\s*\)\s*$')
+_PATH_TOKEN_RE = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+# فرمان‌های مطلقی که همه اعداد آن‌ها جفت مختصات (x, y) هستند و انتقال در آن‌ها قابل اعمال است
+_PAIR_COMMANDS = set('MLCQST')
+
+
+def _format_number(value, precision):
+    text = f"{value:.{precision}f}"
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return '0' if text in ('-0', '') else text
+
+def _parse_translate(transform):
+    """(dx, dy) یک transform از نوع translate؛ برای سایر تبدیل‌ها None."""
+    if not transform:
+        return 0.0, 0.0
+    match = _TRANSLATE_RE.match(transform)
+    if not match:
+        return None
+    return float(match.group(1)), float(match.group(2) or 0)
+
+def _is_straight(start, control, end, tolerance):
+    """آیا نقطه کنترل روی پاره‌خط start→end قرار دارد (منحنی در عمل خط راست است)؟"""
+    ex, ey = end[0] - start[0], end[1] - start[1]
+    cx, cy = control[0] - start[0], control[1] - start[1]
+    length_sq = ex * ex + ey * ey
+    if length_sq == 0:
+        return cx * cx + cy * cy <= tolerance * tolerance
+    projection = (cx * ex + cy * ey) / length_sq
+    return 0 <= projection <= 1 and abs(cx * ey - cy * ex) <= tolerance * length_sq ** 0.5
+
+def _rewrite_path_data(d, dx, dy, precision):
+    """
+    اعمال انتقال (dx, dy) روی مختصات مطلق مسیر، تبدیل منحنی‌های مکعبی صاف به خط (L) و گرد کردن اعداد.
+    vtracer لبه‌های راست را هم با فرمان C می‌نویسد که در طرح‌های گره‌ای بخش بزرگی از مسیرهاست.
+
+    Returns:
+        tuple: (رشته d جدید، مساحت کادر محیطی مسیر) یا None اگر مسیر فرمان نسبی یا کمان داشته باشد.
+    """
+    commands = []
+    pending = []
+    for token in _PATH_TOKEN_RE.findall(d):
+        if token.isalpha():
+            if (token not in _PAIR_COMMANDS and token not in 'Zz') or pending:
+                return None
+            commands.append((token.upper(), []))
+            continue
+        if not commands:
+            return None
+        pending.append(float(token))
+        if len(pending) == 2:
+            commands[-1][1].append((pending[0] + dx, pending[1] + dy))
+            pending = []
+    if pending:
+        return None
+
+    tolerance = 0.5 * 10 ** -precision
+    parts = []
+    last_command = None
+    current = subpath_start = None
+    xs, ys = [], []
+
+    def emit(command, points):
+        nonlocal last_command
+        # تکرار ضمنی فرمان قبلی مجاز است (به جز پس از M که جفت‌های بعدی L تفسیر می‌شوند)
+        if command != last_command or command == 'M':
+            parts.append(command)
+        elif points:
+            parts.append(' ')
+        parts.append(' '.join(f"{_format_number(x, precision)} {_format_number(y, precision)}" for x, y in points))
+        last_command = command
+        for x, y in points:
+            xs.append(x)
+            ys.append(y)
+
+    for command, points in commands:
+        if command == 'Z':
+            emit('Z', [])
+            current = subpath_start
+            continue
+        if command == 'C' and current is not None and points and len(points) % 3 == 0:
+            for i in range(0, len(points), 3):
+                control1, control2, end = points[i:i + 3]
+                if _is_straight(current, control1, end, tolerance) and _is_straight(current, control2, end, tolerance):
+                    emit('L', [end])
+                else:
+                    emit('C', [control1, control2, end])
+                current = end
+            continue
+        if not points:
+            return None
+        emit(command, points)
+        if command == 'M':
+            subpath_start = points[0]
+            # جفت‌های بعدی M در حکم L هستند
+            last_command = 'L' if len(points) > 1 else 'M'
+        current = points[-1]
+    area = (max(xs) - min(xs)) * (max(ys) - min(ys)) if xs else 0.0
+    return ''.join(parts), area
+
+def _iter_tags(stream, chunk_size=1 << 20):
+    """قطعه‌های متوالی فایل SVG که هر کدام به '>' ختم می‌شوند (خواندن جریانی بدون ساخت درخت XML)."""
+    buffer = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        end = buffer.rfind('>')
+        if end < 0:
+            continue
+        yield from re.split(r'(?<=>)', buffer[:end + 1])
+        buffer = buffer[end + 1:]
+    if buffer:
+        yield buffer
+
+
+class SVGOptimizer:
+    """
+    بهینه‌ساز جریانی SVG خروجی vtracer برای کاهش حجم و زمان رندر (مثلاً در تبدیل به PDF).
+
+    فایل بدون ساخت درخت XML، برچسب به برچسب خوانده می‌شود و فقط عناصر <path> تغییر می‌کنند:
+      - transform از نوع translate روی مختصات مطلق مسیر اعمال و اعداد به precision رقم اعشار گرد می‌شوند؛
+      - مسیرهایی که مساحت کادر محیطی آن‌ها کمتر از min_path_area است حذف می‌شوند؛
+      - مسیرهای متوالی با ویژگی‌های یکسان (fill و غیره) در یک مسیر ادغام می‌شوند. فقط مسیرهای پشت سر هم
+        ادغام می‌شوند تا ترتیب لایه‌ها (روی هم قرار گرفتن رنگ‌ها) تغییر نکند.
+    مسیرهای دارای فرمان نسبی، کمان یا تبدیل‌های دیگر بدون تغییر نوشته می‌شوند.
+
+    Args:
+        precision (int): تعداد ارقام اعشار مختصات.
+        min_path_area (float): حداقل مساحت کادر محیطی مسیر (پیکسل مربع)؛ صفر = بدون حذف. در نقشه گره هر پیکسل
+            یک گره است، پس مقدار ۱ یا بیشتر گره‌های تک (کادر ۱×۱) را حذف می‌کند.
+        merge_paths (bool): ادغام مسیرهای متوالی هم‌رنگ.
+    """
+    def __init__(self, precision=1, min_path_area=0.0, merge_paths=True):
+        self.precision = precision
+        self.min_path_area = min_path_area
+        self.merge_paths = merge_paths
+
+    def optimize(self, input_path, output_path=None, compress=False):
+        """
+        بهینه‌سازی input_path و نوشتن نتیجه در output_path (پیش‌فرض: همان مسیر؛ با compress=True فایل .svgz).
+
+        Returns:
+            dict: مسیر خروجی، حجم قبل و بعد (بایت)، تعداد مسیرها قبل و بعد، مسیرهای حذف‌شده و زمان.
+        """
+        start = time.perf_counter()
+        bytes_before = os.path.getsize(input_path)
+        if output_path is None:
+            output_path = os.path.splitext(input_path)[0] + '.svgz' if compress else input_path
+        temp_path = output_path + '.tmp'
+        stats = {'paths_before': 0, 'paths_after': 0, 'paths_dropped': 0}
+
+        opener = (lambda p: gzip.open(p, 'wt', encoding='utf-8', compresslevel=6)) if compress else \
+            (lambda p: open(p, 'w', encoding='utf-8'))
+        with open(input_path, encoding='utf-8') as src, opener(temp_path) as dst:
+            merged_key, merged_attrs, merged_data = None, None, []
+
+            def flush():
+                nonlocal merged_key, merged_attrs, merged_data
+                if merged_data:
+                    attrs = ''.join(f' {name}="{value}"' for name, value in merged_attrs)
+                    dst.write(f'<path d="{" ".join(merged_data)}"{attrs}/>\n')
+                    stats['paths_after'] += 1
+                merged_key, merged_attrs, merged_data = None, None, []
+
+            for piece in _iter_tags(src):
+                match = _PATH_TAG_RE.search(piece)
+                if not match:
+                    if piece.strip():
+                        flush()
+                        dst.write(piece.strip() + '\n')
+                    continue
+                stats['paths_before'] += 1
+                attrs = _ATTR_RE.findall(match.group(1))
+                values = dict(attrs)
+                translate = _parse_translate(values.get('transform'))
+                rewritten = None
+                if translate is not None and 'd' in values:
+                    rewritten = _rewrite_path_data(values['d'], *translate, self.precision)
+                if rewritten is None:
+                    # مسیر قابل بازنویسی نیست؛ همان‌طور که هست نوشته می‌شود
+                    flush()
+                    dst.write(f'<path{match.group(1)}/>\n')
+                    stats['paths_after'] += 1
+                    continue
+
+                data, area = rewritten
+                if area < self.min_path_area:
+                    stats['paths_dropped'] += 1
+                    continue
+                other = tuple((name, value) for name, value in attrs if name not in ('d', 'transform'))
+                if not self.merge_paths or other != merged_key:
+                    flush()
+                    merged_key, merged_attrs = other, other
+                merged_data.append(data)
+            flush()
+        os.replace(temp_path, output_path)
+
+        stats.update({
+            'output_path': output_path,
+            'bytes_before': bytes_before,
+            'bytes_after': os.path.getsize(output_path),
+            'seconds': round(time.perf_counter() - start, 3),
+        })
+        return stats
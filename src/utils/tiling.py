@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+import struct
+import numpy as np
+from PIL import Image
+
+# تخمین حافظه کاری هر پیکسل در پردازش نواری (ورودی، خروجی و آرایه‌های موقت numpy)
+WORKING_BYTES_PER_PIXEL = 16
+
+def rows_per_strip(width, memory_budget_mb, bytes_per_pixel=WORKING_BYTES_PER_PIXEL, min_rows=8):
+    """تعداد سطرهای هر نوار افقی به گونه‌ای که حافظه کاری یک نوار از بودجه تعیین‌شده بیشتر نشود."""
+    budget_bytes = int(memory_budget_mb * 1024 * 1024)
+    return max(min_rows, budget_bytes // max(1, width * bytes_per_pixel))
+
+def iter_strips(height, strip_rows):
+    """تولید بازه‌های (y0, y1) نوارهای افقی پشت سر هم."""
+    for y0 in range(0, height, strip_rows):
+        yield y0, min(height, y0 + strip_rows)
+
+def resize_in_strips(image, size, strip_rows, resample=Image.LANCZOS):
+    """
+    تغییر اندازه تصویر به صورت نوار به نوار.
+    هر نوار خروجی با پارامتر box فقط از ناحیه متناظر تصویر مبدأ محاسبه می‌شود
+    (فیلتر از پیکسل‌های همسایه بیرون از box هم استفاده می‌کند، پس درز نواری ایجاد نمی‌شود)
+    و حافظه موقت به اندازه یک نوار محدود می‌ماند.
+    """
+    width, height = size
+    result = Image.new(image.mode, size)
+    scale_y = image.height / height
+    for y0, y1 in iter_strips(height, strip_rows):
+        strip = image.resize((width, y1 - y0), resample, box=(0, y0 * scale_y, image.width, y1 * scale_y))
+        result.paste(strip, (0, y0))
+    return result
+
+def apply_mask_in_strips(image, mask, background_color=(255, 255, 255), strip_rows=None):
+    """
+    جایگزینی پیکسل‌های بیرون ماسک با رنگ پس‌زمینه، نوار به نوار و بدون ساخت ماسک سه‌کاناله.
+    هر نوار جداگانه برش داده، ماسک و در تصویر خروجی جای‌گذاری می‌شود، بنابراین به جز خود تصویر خروجی
+    فقط یک نوار (و نه کپی کامل تصویر) در حافظه ساخته می‌شود.
+    """
+    result = Image.new("RGB", image.size)
+    background = np.array(background_color, dtype=np.uint8)
+    strip_rows = strip_rows or image.height
+    for y0, y1 in iter_strips(image.height, strip_rows):
+        strip = np.array(image.crop((0, y0, image.width, y1)).convert("RGB"))
+        strip[~(mask[y0:y1] > 0)] = background
+        result.paste(Image.fromarray(strip), (0, y0))
+    return result
+
+
+class StripPNGWriter:
+    """
+    نویسنده PNG جریانی: سطرهای تصویر به صورت نوار به نوار فشرده و در فایل نوشته می‌شوند،
+    بنابراین بافر فشرده‌سازی کل تصویر هیچ‌گاه در حافظه ساخته نمی‌شود.
+    از مدهای 'RGB'، 'RGBA'، 'L' و 'P' (با پالت) پشتیبانی می‌کند.
+    """
+    COLOR_TYPES = {'L': (0, 1), 'RGB': (2, 3), 'P': (3, 1), 'RGBA': (6, 4)}
+
+    def __init__(self, path, width, height, mode='RGB', palette=None, compress_level=6):
+        if mode not in self.COLOR_TYPES:
+            raise ValueError(f"مد تصویر '{mode}' برای نوشتن PNG جریانی پشتیبانی نمی‌شود.")
+        if mode == 'P' and palette is None:
+            raise ValueError("برای مد 'P' پالت رنگی لازم است.")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.color_type, self.channels = self.COLOR_TYPES[mode]
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(path, 'wb')
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, self.color_type, 0, 0, 0))
+        if mode == 'P':
+            palette_bytes = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)[:256].tobytes()
+            self._write_chunk(b'PLTE', palette_bytes)
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def write(self, strip):
+        """نوشتن یک نوار (تصویر PIL یا آرایه numpy با ابعاد (h, w[, c]))."""
+        if isinstance(strip, Image.Image):
+            strip = np.asarray(strip)
+        rows = np.ascontiguousarray(strip, dtype=np.uint8).reshape(strip.shape[0], self.width * self.channels)
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("تعداد سطرهای نوشته‌شده از ارتفاع تصویر بیشتر است.")
+
+        # فیلتر Sub برای هر سطر: اختلاف هر بایت با پیکسل سمت چپ (فشرده‌سازی بهتر نواحی یک‌رنگ فرش)
+        filtered = rows.copy()
+        if self.mode != 'P':
+            filtered[:, self.channels:] -= rows[:, :-self.channels]
+            filter_type = 1
+        else:
+            filter_type = 0
+        payload = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        payload[:, 0] = filter_type
+        payload[:, 1:] = filtered
+
+        data = self._compressor.compress(payload.tobytes())
+        if data:
+            self._write_chunk(b'IDAT', data)
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            self._write_chunk(b'IDAT', self._compressor.flush())
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._file.close()
+            self._file = None
+        if self.rows_written != self.height:
+            raise ValueError(f"فایل PNG ناقص است: {self.rows_written} از {self.height} سطر نوشته شد.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
+
+def save_png_in_strips(image, path, strip_rows):
+    """ذخیره یک تصویر PIL به صورت PNG با نویسنده جریانی، نوار به نوار."""
+    mode = image.mode if image.mode in StripPNGWriter.COLOR_TYPES else 'RGB'
+    if mode != image.mode:
+        image = image.convert(mode)
+    palette = image.getpalette() if mode == 'P' else None
+    with StripPNGWriter(path, image.width, image.height, mode=mode, palette=palette) as writer:
+        for y0, y1 in iter_strips(image.height, strip_rows):
+            writer.write(image.crop((0, y0, image.width, y1)))
+    return path
+
+def replace_png_palette(path, palette, output_path=None):
+    """
+    جایگزینی پالت (چانک PLTE) یک PNG پالت‌دار بدون رمزگشایی و فشرده‌سازی دوباره پیکسل‌ها.
+    سایر چانک‌ها بدون تغییر کپی می‌شوند، بنابراین زمان آن مستقل از ابعاد تصویر و در حد کپی فایل است.
+    """
+    output_path = output_path or path
+    palette_bytes = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)[:256].tobytes()
+    temp_path = output_path + '.tmp'
+    replaced = False
+    with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+        signature = src.read(8)
+        if signature != b'\x89PNG\r\n\x1a\n':
+            raise ValueError(f"فایل PNG معتبر نیست: {path}")
+        dst.write(signature)
+        while True:
+            header = src.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'PLTE':
+                src.seek(length + 4, os.SEEK_CUR)
+                dst.write(struct.pack('>I', len(palette_bytes)) + chunk_type + palette_bytes)
+                dst.write(struct.pack('>I', zlib.crc32(palette_bytes, zlib.crc32(chunk_type)) & 0xffffffff))
+                replaced = True
+            else:
+                dst.write(header)
+                remaining = length + 4
+                while remaining:
+                    block = src.read(min(remaining, 1 << 20))
+                    if not block:
+                        raise ValueError(f"فایل PNG ناقص است: {path}")
+                    dst.write(block)
+                    remaining -= len(block)
+            if chunk_type == b'IEND':
+                break
+    if not replaced:
+        os.remove(temp_path)
+        raise ValueError(f"فایل PNG پالت‌دار نیست (چانک PLTE ندارد): {path}")
+    os.replace(temp_path, output_path)
+    return output_path
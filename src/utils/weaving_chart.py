@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+import struct
+import numpy as np
+from PIL import Image
+
+from .tiling import iter_strips
+
+# قالب دودویی نقشه رج‌به‌رج:
+#   سرآیند: 'WRLE' | نسخه (u8) | پرچم‌ها (u8، بیت ۰ = فشرده با zlib) | عرض (u32) | ارتفاع (u32) | تعداد رنگ (u16) | پالت (n × 3 بایت)
+#   بدنه (در صورت فشرده بودن، یک جریان zlib): برای هر رج، تعداد اجراها (u16) و سپس هر اجرا: اندیس رنگ (u8) + طول (u16)
+# همه اعداد little-endian هستند و رج‌ها به ترتیب سطرهای تصویر (از بالا به پایین) ذخیره می‌شوند.
+BINARY_MAGIC = b'WRLE'
+BINARY_VERSION = 1
+FLAG_COMPRESSED = 1
+_HEADER = struct.Struct('<4sBBIIH')
+_RUN_DTYPE = np.dtype([('index', 'u1'), ('length', '<u2')])
+# حداکثر عرض نقشه در قالب دودویی (طول اجرا و تعداد اجراهای هر رج با u16 ذخیره می‌شود)
+MAX_WIDTH = 65535
+
+TEXT_MAGIC = '# WEAVING-CHART RLE v1'
+
+def encode_runs(strip):
+    """
+    کدگذاری طول اجرای همه سطرهای یک نوار به صورت برداری.
+
+    Returns:
+        tuple: (اندیس رنگ هر اجرا، طول هر اجرا، تعداد اجراهای هر سطر)
+    """
+    height, width = strip.shape
+    starts = np.ones((height, width), dtype=bool)
+    starts[:, 1:] = strip[:, 1:] != strip[:, :-1]
+    positions = np.flatnonzero(starts)
+    values = strip.reshape(-1)[positions]
+    lengths = np.diff(np.append(positions, height * width))
+    runs_per_row = np.bincount(positions // width, minlength=height)
+    return values, lengths, runs_per_row
+
+def _row_bytes(values, lengths, runs_per_row):
+    """چیدمان دودویی رج‌های یک نوار (تعداد اجرا + جفت‌های اندیس/طول) بدون حلقه پایتونی روی اجراها."""
+    row_sizes = 2 + 3 * runs_per_row
+    row_offsets = np.concatenate(([0], np.cumsum(row_sizes)[:-1]))
+    out = np.empty(int(row_sizes.sum()), dtype=np.uint8)
+    counts = runs_per_row.astype('<u2').view(np.uint8).reshape(-1, 2)
+    out[row_offsets] = counts[:, 0]
+    out[row_offsets + 1] = counts[:, 1]
+
+    run_rows = np.repeat(np.arange(len(runs_per_row)), runs_per_row)
+    first_run = np.concatenate(([0], np.cumsum(runs_per_row)[:-1]))
+    run_offsets = row_offsets[run_rows] + 2 + 3 * (np.arange(len(values)) - first_run[run_rows])
+    runs = np.empty(len(values), dtype=_RUN_DTYPE)
+    runs['index'] = values
+    runs['length'] = lengths
+    run_bytes = runs.view(np.uint8).reshape(-1, 3)
+    for k in range(3):
+        out[run_offsets + k] = run_bytes[:, k]
+    return out.tobytes()
+
+
+class WeavingChartWriter:
+    """
+    نویسنده جریانی نقشه رج‌به‌رج با کدگذاری طول اجرا (RLE): نقشه گره اندیس‌دار نوار به نوار دریافت
+    و هر رج به صورت جفت‌های (اندیس رنگ، طول اجرا) نوشته می‌شود؛ هیچ تصویر RGB ساخته نمی‌شود.
+
+    Args:
+        binary (bool): قالب دودویی فشرده (پیش‌فرض) یا قالب متنی خوانا برای بافنده.
+        compress (bool): فشرده‌سازی بدنه قالب دودویی با zlib.
+    """
+    def __init__(self, path, width, height, palette, binary=True, compress=True):
+        palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        if not 0 < len(palette) <= 256:
+            raise ValueError("پالت باید بین ۱ تا ۲۵۶ رنگ داشته باشد.")
+        if binary and width > MAX_WIDTH:
+            raise ValueError(f"عرض نقشه برای قالب دودویی حداکثر {MAX_WIDTH} گره است: {width}")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.palette = palette
+        self.binary = binary
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(6) if binary and compress else None
+        if binary:
+            self._file = open(path, 'wb')
+            flags = FLAG_COMPRESSED if self._compressor else 0
+            self._file.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, width, height, len(palette)))
+            self._file.write(palette.tobytes())
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='\n')
+            self._file.write(f"{TEXT_MAGIC}\n")
+            self._file.write(f"size {width} {height}\n")
+            for i, color in enumerate(palette):
+                self._file.write(f"color {i + 1} #{int(color[0]):02x}{int(color[1]):02x}{int(color[2]):02x}\n")
+            self._file.write("# هر رج: شماره رج، سپس جفت‌های «شماره رنگ x تعداد گره» از چپ به راست\n")
+
+    def write(self, strip):
+        """نوشتن یک نوار از نقشه (آرایه uint8 اندیس‌ها با ابعاد (h, width) یا تصویر مد 'P')."""
+        if isinstance(strip, Image.Image):
+            strip = np.asarray(strip)
+        strip = np.ascontiguousarray(strip, dtype=np.uint8)
+        if strip.shape[1] != self.width:
+            raise ValueError(f"عرض نوار ({strip.shape[1]}) با عرض نقشه ({self.width}) برابر نیست.")
+        if self.rows_written + strip.shape[0] > self.height:
+            raise ValueError("تعداد رج‌های نوشته‌شده از ارتفاع نقشه بیشتر است.")
+        values, lengths, runs_per_row = encode_runs(strip)
+
+        if self.binary:
+            data = _row_bytes(values, lengths, runs_per_row)
+            self._file.write(self._compressor.compress(data) if self._compressor else data)
+        else:
+            run_index = 0
+            for row, count in enumerate(runs_per_row):
+                pairs = ' '.join(f"{v + 1}x{n}" for v, n in zip(values[run_index:run_index + count].tolist(),
+                                                                lengths[run_index:run_index + count].tolist()))
+                self._file.write(f"{self.rows_written + row + 1}: {pairs}\n")
+                run_index += count
+        self.rows_written += strip.shape[0]
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            if self._compressor:
+                self._file.write(self._compressor.flush())
+        finally:
+            self._file.close()
+            self._file = None
+        if self.rows_written != self.height:
+            raise ValueError(f"نقشه رج‌به‌رج ناقص است: {self.rows_written} از {self.height} رج نوشته شد.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class WeavingChartReader:
+    """
+    خواننده نقشه رج‌به‌رج (قالب دودویی یا متنی، با تشخیص خودکار).
+    رج‌ها به صورت جریانی خوانده می‌شوند؛ iter_rows هر بار فقط یک رج (آرایه اندیس‌ها) می‌سازد.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(_HEADER.size)
+        self.binary = head[:4] == BINARY_MAGIC
+        if self.binary:
+            magic, version, flags, self.width, self.height, n_colors = _HEADER.unpack(head)
+            if version != BINARY_VERSION:
+                raise ValueError(f"نسخه قالب نقشه رج‌به‌رج پشتیبانی نمی‌شود: {version}")
+            self.compressed = bool(flags & FLAG_COMPRESSED)
+            with open(path, 'rb') as f:
+                f.seek(_HEADER.size)
+                self.palette = np.frombuffer(f.read(n_colors * 3), dtype=np.uint8).reshape(-1, 3).copy()
+            self._body_offset = _HEADER.size + n_colors * 3
+        else:
+            self._read_text_header()
+
+    def _read_text_header(self):
+        colors = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            if f.readline().strip() != TEXT_MAGIC:
+                raise ValueError(f"فایل نقشه رج‌به‌رج معتبر نیست: {self.path}")
+            for line in f:
+                if line.startswith('size '):
+                    self.width, self.height = map(int, line.split()[1:3])
+                elif line.startswith('color '):
+                    _, index, hex_color = line.split()
+                    colors[int(index)] = [int(hex_color[i:i + 2], 16) for i in (1, 3, 5)]
+                elif line[:1].isdigit():
+                    break
+        self.palette = np.array([colors[i] for i in sorted(colors)], dtype=np.uint8).reshape(-1, 3)
+
+    def _binary_chunks(self):
+        decompressor = zlib.decompressobj() if self.compressed else None
+        with open(self.path, 'rb') as f:
+            f.seek(self._body_offset)
+            while True:
+                block = f.read(1 << 20)
+                if not block:
+                    break
+                yield decompressor.decompress(block) if decompressor else block
+            if decompressor:
+                yield decompressor.flush()
+                # بدون انتهای جریان zlib (و checksum آن) فایل بریده شده است، حتی اگر همه رج‌ها خوانده شوند
+                if not decompressor.eof:
+                    raise ValueError(f"بدنه فشرده نقشه رج‌به‌رج ناقص است: {self.path}")
+                if decompressor.unused_data:
+                    raise ValueError(f"نقشه رج‌به‌رج پس از بدنه فشرده داده اضافه دارد: {self.path}")
+
+    def iter_rows(self):
+        """
+        تولید رج‌ها به ترتیب، هر رج به صورت آرایه uint8 اندیس‌های پالت با طول width.
+        اگر تعداد رج‌ها با height یا مجموع گره‌های یک رج با width برابر نباشد (مثلاً فایل ناقص)، ValueError.
+        """
+        if not self.binary:
+            yield from self._iter_text_rows()
+            return
+        buffer = bytearray()
+        position = 0
+        rows = 0
+        for chunk in self._binary_chunks():
+            buffer += chunk
+            while rows < self.height:
+                if len(buffer) - position < 2:
+                    break
+                count = int.from_bytes(buffer[position:position + 2], 'little')
+                end = position + 2 + 3 * count
+                if len(buffer) < end:
+                    break
+                runs = np.frombuffer(bytes(buffer[position + 2:end]), dtype=_RUN_DTYPE)
+                yield self._expand(runs['index'], runs['length'])
+                position = end
+                rows += 1
+            # حذف بایت‌های مصرف‌شده تا بافر به اندازه یک بلوک محدود بماند
+            del buffer[:position]
+            position = 0
+        if rows != self.height:
+            raise ValueError(f"نقشه رج‌به‌رج ناقص است: {rows} از {self.height} رج خوانده شد.")
+        if buffer:
+            raise ValueError(f"نقشه رج‌به‌رج پس از {self.height} رج داده اضافه دارد.")
+
+    def _iter_text_rows(self):
+        rows = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line[:1].isdigit():
+                    continue
+                if rows == self.height:
+                    raise ValueError(f"نقشه رج‌به‌رج بیش از {self.height} رج دارد.")
+                try:
+                    number, pairs = line.split(':', 1)
+                    runs = np.array([pair.split('x') for pair in pairs.split()], dtype=np.int64).reshape(-1, 2)
+                except ValueError:
+                    raise ValueError(f"سطر {rows + 1} نقشه رج‌به‌رج خراب است: {line.strip()!r}") from None
+                if int(number) != rows + 1:
+                    raise ValueError(f"رج {rows + 1} در نقشه رج‌به‌رج یافت نشد (سطر بعدی: رج {int(number)}).")
+                yield self._expand(runs[:, 0] - 1, runs[:, 1])
+                rows += 1
+        if rows != self.height:
+            raise ValueError(f"نقشه رج‌به‌رج ناقص است: {rows} از {self.height} رج خوانده شد.")
+
+    def _expand(self, values, lengths):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if lengths.sum() != self.width or (lengths < 0).any():
+            raise ValueError(f"طول رج ({lengths.sum()}) با عرض نقشه ({self.width}) برابر نیست.")
+        return np.repeat(np.asarray(values, dtype=np.uint8), lengths)
+
+    def to_indices(self):
+        """بازسازی کامل آرایه اندیس‌های نقشه (uint8، یک بایت برای هر گره)."""
+        indices = np.empty((self.height, self.width), dtype=np.uint8)
+        rows = 0
+        for rows, row in enumerate(self.iter_rows(), start=1):
+            indices[rows - 1] = row
+        if rows != self.height:
+            raise ValueError(f"نقشه رج‌به‌رج ناقص است: {rows} از {self.height} رج خوانده شد.")
+        return indices
+
+    def to_image(self):
+        """بازسازی نقشه به صورت تصویر پالت‌دار (مد 'P')."""
+        image = Image.fromarray(self.to_indices())
+        image.putpalette(self.palette.reshape(-1).tolist())
+        return image
+
+def replace_chart_palette(path, palette):
+    """
+    جایگزینی پالت یک نقشه رج‌به‌رج (پس از تعویض رنگ‌ها) بدون بازنویسی اجراها.
+    در قالب دودویی پالت درجا بازنویسی می‌شود و در قالب متنی فقط سطرهای color تغییر می‌کنند.
+    """
+    reader = WeavingChartReader(path)
+    palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+    if len(palette) != len(reader.palette):
+        raise ValueError(f"پالت جدید باید {len(reader.palette)} رنگ داشته باشد، نه {len(palette)}.")
+    if reader.binary:
+        with open(path, 'r+b') as f:
+            f.seek(_HEADER.size)
+            f.write(palette.tobytes())
+        return path
+
+    temp_path = path + '.tmp'
+    with open(path, 'r', encoding='utf-8') as src, open(temp_path, 'w', encoding='utf-8', newline='\n') as dst:
+        for line in src:
+            if line.startswith('color '):
+                index = int(line.split()[1])
+                color = palette[index - 1]
+                line = f"color {index} #{int(color[0]):02x}{int(color[1]):02x}{int(color[2]):02x}\n"
+            dst.write(line)
+    os.replace(temp_path, path)
+    return path
+
+def export_weaving_chart(knot_map, path, binary=True, strip_rows=1024):
+    """ذخیره یک نقشه گره اندیس‌دار (تصویر مد 'P') به صورت نقشه رج‌به‌رج RLE، نوار به نوار."""
+    if knot_map.mode != 'P':
+        raise ValueError("نقشه رج‌به‌رج به نقشه گره اندیس‌دار (تصویر با مد P) نیاز دارد.")
+    indices = np.asarray(knot_map)
+    palette = np.array(knot_map.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    with WeavingChartWriter(path, knot_map.width, knot_map.height, palette, binary=binary) as writer:
+        for y0, y1 in iter_strips(knot_map.height, strip_rows):
+            writer.write(indices[y0:y1])
+    return path
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# اجرای تست‌ها از ریشه پروژه با pytest (بدون نصب بسته)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
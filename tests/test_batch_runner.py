@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from PIL import Image
+
+from src.models.dummy_generator import DummyGenerator
+from src.pipeline.batch_runner import BatchRunner
+from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+
+
+def test_pipelined_batch_reports_cpu_stage_metrics(tmp_path):
+    rng = np.random.default_rng(0)
+    image_path = str(tmp_path / 'input.png')
+    Image.fromarray(rng.integers(0, 256, size=(30, 20, 3), dtype=np.uint8)).resize((80, 120)).save(image_path)
+
+    pipeline = CarpetDesignPipeline(generator_class=DummyGenerator)
+    pipeline.config['processing']['edge_detection']['method'] = 'Canny'
+    pipeline.config['processing']['color_quantization']['n_colors'] = 6
+    pipeline.carpet_specs = {'width_cm': 40, 'height_cm': 60, 'shaneh': 10, 'tar': 10}
+    run_config = {
+        'remove_background': False, 'detect_edges': True, 'generate_design': True, 'quantize_colors': True,
+        'apply_symmetry': True, 'vectorize': False, 'save_intermediate': False, 'use_cache': False
+    }
+    events = []
+    runner = BatchRunner(pipeline, str(tmp_path / 'out'), run_config, log_callback=lambda message: None,
+                         cpu_workers=1, metrics_callback=events.append)
+    manifest = runner.run([image_path])
+
+    assert manifest['succeeded'] == 1
+    stages = [event['stage'] for event in events if event['event'] == 'stage_metrics' and event['source'] == 'run']
+    assert 'generate_design' in stages
+    assert 'quantize_colors' in stages and 'save_final' in stages
+    assert sorted(event['phase'] for event in events if event['event'] == 'run_metrics') == ['all', 'gpu']
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+import torch
+from PIL import Image
+
+from src.pipeline import carpet_pipeline
+from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+
+# حجم هر مدل ساختگی (مگابایت)
+BASE_MB = 50
+CONTROLNET_MB = 30
+
+
+def fake_module(size_mb):
+    module = torch.nn.Module()
+    module.weight = torch.nn.Parameter(torch.zeros(size_mb * 1024 * 1024 // 4))
+    return module
+
+
+class StubGenerator:
+    """ژنراتور ساختگی با همان رابط ControlNetGenerator که پایپلاین استفاده می‌کند."""
+    def __init__(self, base_model, controlnet_model, controlnet_loader, **kwargs):
+        self.base_model = base_model
+        self.controlnet_loader = controlnet_loader
+        self.attached = None
+        self.unloaded = False
+        self.set_controlnet(controlnet_model)
+
+    @staticmethod
+    def load_controlnet(path, dtype=None):
+        return fake_module(CONTROLNET_MB)
+
+    def set_controlnet(self, paths):
+        if self.attached == list(paths):
+            return
+        self.attached = list(paths)
+        self.controlnets = [self.controlnet_loader(path) for path in paths]
+
+    def base_memory_mb(self):
+        return BASE_MB
+
+    def unload(self):
+        self.unloaded = True
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(carpet_pipeline, 'ControlNetGenerator', StubGenerator)
+    instance = CarpetDesignPipeline()
+    instance.log_callback = lambda message: None
+    instance.device = 'cpu'
+    instance.model_registry.max_memory_mb = 140
+    return instance
+
+
+def test_attached_controlnets_stay_registered_with_their_base(pipeline):
+    registry = pipeline.model_registry
+    sd15 = pipeline._lazy_load_controlnet('sd15', 'A')
+    assert pipeline._lazy_load_controlnet('sd15', 'C') is sd15
+    pipeline._lazy_load_controlnet('sd15', 'C')
+    assert registry.total_mb == BASE_MB + 2 * CONTROLNET_MB
+
+    pipeline._lazy_load_controlnet('sdxl', 'D')
+    # A متصل نیست و اول حذف می‌شود؛ C تا وقتی ژنراتور sd15 زنده است حذف نمی‌شود
+    assert ('controlnet', 'A') not in registry
+    if ('base', 'sd15') in registry:
+        assert ('controlnet', 'C') in registry
+    else:
+        assert sd15.unloaded
+    assert registry.total_mb <= registry.max_memory_mb
+
+
+def test_reusing_a_controlnet_refreshes_it(pipeline):
+    registry = pipeline.model_registry
+    registry.max_memory_mb = 0
+    pipeline._lazy_load_controlnet('sd15', 'A')
+    pipeline._lazy_load_controlnet('sdxl', 'D')
+    pipeline._lazy_load_controlnet('sd15', 'A')
+    assert registry.keys()[-2:] == [('base', 'sd15'), ('controlnet', 'A')]
+
+
+class StubVectorizer:
+    def __init__(self, error=None):
+        self.error = error
+
+    def vectorize(self, image, output_path, **kwargs):
+        if self.error:
+            raise self.error
+        with open(output_path, 'w') as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+        return output_path
+
+    def svg_to_pdf(self, svg_path, output_path):
+        with open(output_path, 'wb') as f:
+            f.write(b'%PDF-1.4')
+        return output_path
+
+
+def test_failed_vectorization_is_retried_on_resume(pipeline, tmp_path):
+    pipeline.config['processing']['edge_detection']['method'] = 'Canny'
+    pipeline.carpet_specs = {'width_cm': 20, 'height_cm': 20, 'shaneh': 10, 'tar': 10}
+    image = Image.new('RGB', (40, 40), (200, 30, 30))
+    run_config = {'detect_edges': True, 'quantize_colors': True, 'vectorize': True, 'use_cache': False}
+
+    pipeline.vectorizer = StubVectorizer(RuntimeError("vtracer crashed"))
+    results = pipeline.process_image(image, output_dir=str(tmp_path), run_config=run_config, run_name='run',
+                                     log_callback=lambda message: None)
+    run_dir = str(tmp_path / 'run')
+    assert results['failed_stages'] == ['vectorize']
+    assert os.path.exists(results['final_png']) and 'svg_path' not in results
+    assert os.path.exists(os.path.join(run_dir, 'carpet_specifications.json'))
+    with open(os.path.join(run_dir, 'stages', 'state.json'), encoding='utf-8') as f:
+        assert 'vectorize' not in json.load(f)['stages']
+
+    pipeline.vectorizer = StubVectorizer()
+    results = pipeline.process_image(image, run_config=run_config, resume_dir=run_dir,
+                                     log_callback=lambda message: None)
+    assert results['svg_path'] == os.path.join(run_dir, 'final_design.svg')
+    assert os.path.exists(results['pdf_path'])
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.processors.color_quantizer import ColorQuantizer
+from src.processors.dithering import DITHER_METHODS
+
+
+def two_color_image(width=64, height=64):
+    array = np.zeros((height, width, 3), dtype=np.uint8)
+    array[:, width // 2:] = (200, 40, 40)
+    return Image.fromarray(array)
+
+
+@pytest.mark.parametrize('dither', DITHER_METHODS)
+def test_quantize_with_fewer_colors_than_palette(dither):
+    """تصویر با رنگ‌های متمایز کمتر از n_colors: پالت کوتاه‌تر، بدون خطا."""
+    image = two_color_image()
+    knot_map, palette = ColorQuantizer(n_colors=10).quantize(image, indexed=True, dither=dither)
+    assert palette.shape == (2, 3)
+    assert knot_map.mode == 'P'
+    assert np.array_equal(np.asarray(knot_map.convert('RGB')), np.asarray(image))
+
+
+@pytest.mark.parametrize('strip_rows', [None, 8])
+def test_quantize_with_dithering_with_fewer_colors(strip_rows):
+    image = two_color_image()
+    knot_map, palette = ColorQuantizer(n_colors=10).quantize_with_dithering(image, strip_rows=strip_rows, indexed=True)
+    assert len(palette) == 2
+    assert np.array_equal(np.asarray(knot_map.convert('RGB')), np.asarray(image))
+
+
+def test_strip_quantize_matches_full_quantize():
+    """اعمال پالت نوار به نوار (بدون دیترینگ) همان نقشه گره حالت یکجا را می‌دهد."""
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, size=(50, 40, 3), dtype=np.uint8))
+    palette = rng.integers(0, 256, size=(8, 3), dtype=np.uint8)
+    quantizer = ColorQuantizer()
+    full, _ = quantizer.apply_palette(image, palette, indexed=True)
+    strips, _ = quantizer.apply_palette(image, palette, strip_rows=7, indexed=True)
+    assert np.array_equal(np.asarray(full), np.asarray(strips))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import base64
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from PIL import Image
+
+from src.models.dummy_generator import DummyGenerator
+from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+from src.pipeline.job_service import Job, JobService, create_server, JOB_DONE
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    pipeline = CarpetDesignPipeline(generator_class=DummyGenerator)
+    pipeline.config['processing']['edge_detection']['method'] = 'Canny'
+    pipeline.config['cache']['enable'] = False
+    service = JobService(pipeline, str(tmp_path_factory.mktemp('jobs')), log_callback=lambda message: None,
+                         default_carpet_specs={'width_cm': 20, 'height_cm': 30, 'shaneh': 10, 'tar': 10},
+                         max_finished_jobs=2)
+    httpd = create_server(service, host='127.0.0.1', port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield service, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    service.stop()
+
+
+def request(url, payload=None):
+    data = None if payload is None else json.dumps(payload).encode('utf-8')
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=60) as response:
+            return response.status, response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8')
+
+
+def image_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), (120, 60, 30)).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def submit(base_url, **fields):
+    payload = {
+        'image_base64': image_base64(),
+        'run_config': {'detect_edges': True, 'generate_design': True, 'quantize_colors': True,
+                       'base_model_path': 'dummy/base', 'controlnet_path': 'dummy/canny'},
+    }
+    payload.update(fields)
+    return request(f"{base_url}/jobs", payload)
+
+
+def test_job_runs_end_to_end_with_dummy_generator(server):
+    service, base_url = server
+    status, body = submit(base_url, priority=2)
+    assert status == 201
+    job_id = json.loads(body)['id']
+
+    status, body = request(f"{base_url}/jobs/{job_id}/events")
+    events = [json.loads(line) for line in body.splitlines()]
+    assert events[-1]['type'] == 'status' and events[-1]['status'] == JOB_DONE
+    assert [event['seq'] for event in events] == list(range(len(events)))
+    assert any(event['type'] == 'progress' for event in events)
+    assert any('طرح جدید' in event.get('message', '') for event in events)
+    job = json.loads(request(f"{base_url}/jobs/{job_id}")[1])
+    assert job['result']['final_png'].endswith('final_design.png')
+
+
+@pytest.mark.parametrize('payload', [{'priority': {}}, {'priority': 'high'}, {'priority': None}])
+def test_invalid_priority_is_rejected(server, payload):
+    _, base_url = server
+    status, body = submit(base_url, **payload)
+    assert status == 400 and 'error' in json.loads(body)
+
+
+def test_non_object_body_is_rejected(server):
+    _, base_url = server
+    assert request(f"{base_url}/jobs", [1, 2])[0] == 400
+
+
+def test_finished_jobs_are_capped(server):
+    service, base_url = server
+    for _ in range(3):
+        job_id = json.loads(submit(base_url)[1])['id']
+        request(f"{base_url}/jobs/{job_id}/events")
+    assert len(service.jobs) <= service.max_finished_jobs
+    assert job_id in service.jobs
+
+
+def test_job_events_are_capped_with_stable_sequence(monkeypatch):
+    monkeypatch.setattr(Job, 'MAX_EVENTS', 5)
+    job = Job(None, {})
+    for i in range(12):
+        job.add_event('log', message=str(i))
+    assert len(job.events) == 5 and job.event_count == 12
+    assert [event['seq'] for event in job.wait_events(9, timeout=0)] == [9, 10, 11]
+    assert [event['seq'] for event in job.wait_events(0, timeout=0)] == [7, 8, 9, 10, 11]
+
+
+def test_listing_jobs_while_pruning(server):
+    service, _ = server
+    stop = threading.Event()
+    errors = []
+
+    def list_continuously():
+        while not stop.is_set():
+            try:
+                service.list_jobs()
+            except RuntimeError as e:
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=list_continuously)
+    reader.start()
+    try:
+        with service._condition:
+            for _ in range(200):
+                job = Job(None, {})
+                job.status = JOB_DONE
+                service.jobs[job.id] = job
+        for _ in range(50):
+            with service._condition:
+                for _ in range(20):
+                    job = Job(None, {})
+                    job.status = JOB_DONE
+                    service.jobs[job.id] = job
+                service._prune_finished()
+    finally:
+        stop.set()
+        reader.join()
+    assert not errors
+    assert len(service.list_jobs()) <= service.max_finished_jobs
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.models.model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.unloaded = False
+
+    def unload(self):
+        self.unloaded = True
+
+
+def make_registry(max_memory_mb=100):
+    return ModelRegistry(max_memory_mb=max_memory_mb, log_callback=lambda message: None)
+
+
+def test_get_loads_once_and_counts_hits():
+    registry = make_registry()
+    calls = []
+    for _ in range(3):
+        registry.get('a', lambda: calls.append(1) or FakeModel('a'), size_mb=10)
+    assert len(calls) == 1
+    assert registry.stats == {'hits': 2, 'misses': 1, 'evictions': 0}
+    with pytest.raises(KeyError):
+        registry.get('missing')
+
+
+def test_least_recently_used_entry_is_evicted():
+    registry = make_registry(100)
+    a = registry.get('a', lambda: FakeModel('a'), size_mb=40)
+    registry.get('b', lambda: FakeModel('b'), size_mb=40)
+    registry.get('a')
+    registry.get('c', lambda: FakeModel('c'), size_mb=40)
+    assert registry.keys() == ['a', 'c']
+    assert not a.unloaded
+    assert registry.total_mb == 80
+
+
+def test_removing_dependency_removes_dependents():
+    registry = make_registry(0)
+    registry.get('controlnet', lambda: FakeModel('controlnet'), size_mb=10)
+    base = registry.get('base', lambda: FakeModel('base'), size_mb=50, depends_on=('controlnet',))
+    assert registry.unload('controlnet') == ['base', 'controlnet']
+    assert base.unloaded
+    assert len(registry) == 0
+
+
+def test_attached_dependency_is_not_evicted_before_its_dependent():
+    registry = make_registry(100)
+    registry.get('controlnet', lambda: FakeModel('controlnet'), size_mb=30)
+    registry.get('base', lambda: FakeModel('base'), size_mb=50, depends_on=('controlnet',))
+    # ControlNet کم‌استفاده‌ترین ورودی است، اما تا وقتی ژنراتور به آن متصل است حذف نمی‌شود
+    registry._entries.move_to_end('controlnet', last=False)
+    registry.get('other', lambda: FakeModel('other'), size_mb=40)
+    assert registry.keys() == ['controlnet', 'other']
+    assert registry.total_mb == 70
+
+
+def test_set_dependencies_tracks_swapped_attachment():
+    registry = make_registry(100)
+    registry.get('cn_a', lambda: FakeModel('cn_a'), size_mb=20)
+    registry.get('base', lambda: FakeModel('base'), size_mb=40, depends_on=('cn_a',))
+    registry.get('cn_b', lambda: FakeModel('cn_b'), size_mb=20, protect=('base',))
+    registry.set_dependencies('base', ('cn_b',))
+    # cn_a دیگر متصل نیست و اولین گزینه حذف است
+    registry.get('cn_c', lambda: FakeModel('cn_c'), size_mb=30)
+    assert 'cn_a' not in registry
+    assert {'base', 'cn_b', 'cn_c'} == set(registry.keys())
+    with pytest.raises(KeyError):
+        registry.set_dependencies('missing', ())
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from src.processors.palette_mapper import PaletteMapper, srgb_to_lab
+
+
+def brute_force(pixels, palette, metric):
+    space = srgb_to_lab if metric == 'lab' else (lambda colors: np.asarray(colors, dtype=np.float64))
+    pixel_space = space(pixels.reshape(-1, 3)).astype(np.float64)
+    palette_space = space(palette).astype(np.float64)
+    distances = ((pixel_space[:, None, :] - palette_space[None, :, :]) ** 2).sum(axis=2)
+    return distances, np.argmin(distances, axis=1)
+
+
+@pytest.mark.parametrize('metric', ['rgb', 'lab'])
+@pytest.mark.parametrize('bins', [8, 32])
+@pytest.mark.parametrize('n_colors', [2, 7, 24])
+def test_lut_matches_brute_force(metric, bins, n_colors):
+    rng = np.random.default_rng(n_colors)
+    palette = rng.integers(0, 256, size=(n_colors, 3), dtype=np.uint8)
+    image = rng.integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    # پیکسل‌هایی دقیقاً روی رنگ‌های پالت و نزدیک مرز آن‌ها
+    image[0, :n_colors] = palette
+    image[1, :n_colors] = np.clip(palette.astype(int) + 1, 0, 255)
+
+    indices = PaletteMapper(bins=bins, metric=metric).map_indices(image, palette).reshape(-1)
+    distances, expected = brute_force(image, palette, metric)
+    rows = np.arange(len(indices))
+    # در فاصله‌های برابر هر دو اندیس درست‌اند؛ خطای گرد شدن float32 در حد 1e-3 مجاز است
+    assert np.all(distances[rows, indices] <= distances[rows, expected] + 1e-3)
+    assert np.mean(indices == expected) > 0.999
+
+
+def test_map_image_returns_palette_colours():
+    palette = np.array([[0, 0, 0], [255, 255, 255], [200, 30, 30]], dtype=np.uint8)
+    image = np.array([[[10, 10, 10], [250, 240, 245], [190, 40, 20]]], dtype=np.uint8)
+    result = np.asarray(PaletteMapper().map_image(image, palette))
+    assert result.reshape(-1, 3).tolist() == palette.tolist()
+
+
+def test_fine_level_is_stored_compactly():
+    palette = np.random.default_rng(3).integers(0, 256, size=(16, 3), dtype=np.uint8)
+    tracemalloc.start()
+    try:
+        coarse, (ambiguous_ids, block, factor) = PaletteMapper(bins=64).get_lut(palette)
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert factor == 4 and block.shape == (len(ambiguous_ids), factor ** 3)
+    assert np.all(coarse.reshape(-1)[ambiguous_ids] == PaletteMapper.AMBIGUOUS)
+    # سطح ریز ۲۵۶³ خانه‌ای به صورت کامل (۳۲ مگابایت) یا هندسه آن نگه داشته نمی‌شود
+    assert retained < 16 * 1024 * 1024
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+
+import torch
+
+from src.models.prompt_cache import PromptEmbeddingCache
+
+
+class CountingEncoder:
+    """text encoder ساختگی: embedding هر متن از طول آن ساخته می‌شود."""
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return torch.stack([torch.full((4, 8), len(text) * self.scale) for text in texts])
+
+
+def test_encodes_only_new_texts_in_one_call():
+    cache = PromptEmbeddingCache(max_entries=8)
+    encoder = CountingEncoder()
+    first = cache.encode('sd15', ['carpet', 'ugly', 'ugly'], encoder)
+    second = cache.encode('sd15', ['carpet', 'rug'], encoder)
+    assert encoder.calls == [['carpet', 'ugly'], ['rug']]
+    assert first.shape == (3, 4, 8)
+    assert torch.equal(second[0], first[0])
+    assert cache.stats == {'hits': 1, 'disk_hits': 0, 'misses': 3}
+
+
+def test_variants_and_base_models_do_not_share_embeddings():
+    cache = PromptEmbeddingCache()
+    full, quantized = CountingEncoder(1.0), CountingEncoder(2.0)
+    a = cache.encode('sd15', ['carpet'], full, variant='float32')
+    b = cache.encode('sd15', ['carpet'], quantized, variant='float32-int8')
+    cache.encode('sdxl', ['carpet'], full, variant='float32')
+    assert not torch.equal(a, b)
+    assert cache.stats['misses'] == 3
+
+
+def test_memory_cache_is_bounded():
+    cache = PromptEmbeddingCache(max_entries=2)
+    encoder = CountingEncoder()
+    cache.encode('sd15', ['a', 'b', 'c'], encoder)
+    assert len(cache) == 2
+    cache.encode('sd15', ['a'], encoder)
+    assert encoder.calls[-1] == ['a']
+
+
+def test_disk_persistence_and_size_limit(tmp_path):
+    cache_dir = str(tmp_path / 'prompt_embeds')
+    encoder = CountingEncoder()
+    cache = PromptEmbeddingCache(cache_dir=cache_dir)
+    expected = cache.encode('sd15', ['carpet', 'ugly'], encoder, variant='float32')
+
+    reloaded = PromptEmbeddingCache(cache_dir=cache_dir)
+    result = reloaded.encode('sd15', ['carpet', 'ugly'], encoder, variant='float32')
+    assert torch.equal(result, expected)
+    assert reloaded.stats == {'hits': 0, 'disk_hits': 2, 'misses': 0}
+
+    file_size = max(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+    bounded = PromptEmbeddingCache(cache_dir=cache_dir, max_disk_mb=3.5 * file_size / (1024 * 1024))
+    bounded.encode('sd15', [f'carpet {size}x{size}cm' for size in range(10)], encoder, variant='float32')
+    assert len(os.listdir(cache_dir)) == 3
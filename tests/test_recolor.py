@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.pipeline.carpet_pipeline import CarpetDesignPipeline
+
+
+@pytest.fixture(scope='module')
+def pipeline():
+    instance = CarpetDesignPipeline()
+    instance.config['processing']['edge_detection']['method'] = 'Canny'
+    instance.config['processing']['color_quantization']['n_colors'] = 6
+    instance.config['output']['chart_pdf'] = {'enable': True, 'knots_per_page': 50}
+    instance.carpet_specs = {'width_cm': 40, 'height_cm': 60, 'shaneh': 10, 'tar': 10}
+    return instance
+
+
+@pytest.fixture(scope='module')
+def run_dir(pipeline, tmp_path_factory):
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, size=(30, 20, 3), dtype=np.uint8)).resize((80, 120))
+    run_config = {
+        'remove_background': False, 'detect_edges': True, 'generate_design': False, 'quantize_colors': True,
+        'apply_symmetry': True, 'vectorize': False, 'save_intermediate': True, 'use_cache': False
+    }
+    results = pipeline.process_image(image, output_dir=str(tmp_path_factory.mktemp('runs')),
+                                     run_config=run_config, log_callback=lambda message: None)
+    return results['output_path']
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_recolor_replaces_palette_everywhere(pipeline, run_dir):
+    with Image.open(os.path.join(run_dir, 'final_design.png')) as image:
+        knots_before = np.asarray(image).copy()
+    specs = read_json(os.path.join(run_dir, 'carpet_specifications.json'))
+    index = specs['colors'][0]['index'] - 1
+
+    with open(os.path.join(run_dir, 'final_design_chart.pdf'), 'rb') as f:
+        assert b'0A0B0C' not in f.read()
+
+    result = pipeline.recolor(run_dir, {index: (255, 0, 0), index + 1: (10, 11, 12)}, log_callback=lambda message: None)
+
+    with Image.open(os.path.join(run_dir, 'final_design.png')) as image:
+        assert np.array_equal(np.asarray(image), knots_before)
+        assert image.getpalette()[index * 3:index * 3 + 3] == [255, 0, 0]
+    assert result['palette'][index].tolist() == [255, 0, 0]
+    assert read_json(os.path.join(run_dir, 'color_info.json'))['palette'][index]['hex'] == '#ff0000'
+
+    recolored = read_json(os.path.join(run_dir, 'carpet_specifications.json'))
+    color = next(color for color in recolored['colors'] if color['index'] == index + 1)
+    assert color['hex'] == '#ff0000' and color['rgb'] == [255, 0, 0]
+    assert [c['knots'] for c in recolored['colors']] == [c['knots'] for c in specs['colors']]
+    with open(os.path.join(run_dir, 'carpet_specifications.txt'), 'r', encoding='utf-8') as f:
+        assert '#ff0000' in f.read()
+    with open(os.path.join(run_dir, 'final_design_chart.pdf'), 'rb') as f:
+        assert b'0A0B0C' in f.read()
+    assert os.path.join(run_dir, 'final_design_chart.pdf') in result['recolored_files']
+
+
+def test_recolor_rejects_out_of_range_index(pipeline, run_dir):
+    with pytest.raises(ValueError):
+        pipeline.recolor(run_dir, {999: (0, 0, 0)}, log_callback=lambda message: None)
+
+
+def test_specs_stage_signature_follows_yarn_estimate(pipeline, tmp_path, monkeypatch):
+    def specs_signature():
+        graph = pipeline.build_stage_graph({'quantize_colors': True}, str(tmp_path))
+        stage = next(stage for stage in graph.stages if stage.name == 'save_specs')
+        return stage.signature({'layout_image': 'layout'})
+
+    before = specs_signature()
+    monkeypatch.setitem(pipeline.config['output'], 'yarn_estimate', {'pile_grams_per_m2': 3000, 'waste_percent': 99})
+    assert specs_signature() != before
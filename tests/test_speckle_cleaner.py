@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.processors.speckle_cleaner import SpeckleCleaner
+
+
+def test_single_knot_takes_the_surrounding_colour():
+    indices = np.zeros((5, 5), dtype=np.uint8)
+    indices[2, 2] = 1
+    cleaned, stats = SpeckleCleaner(min_knots=2).clean_indices(indices, 2)
+    assert not cleaned.any()
+    assert stats == {'islands_merged': 1, 'knots_changed': 1, 'passes': 1}
+
+
+def test_majority_vote_and_tie_break():
+    indices = np.array([
+        [2, 2, 2, 2],
+        [2, 1, 3, 3],
+        [0, 0, 3, 3],
+    ], dtype=np.uint8)
+    # جزیره تک‌گره رنگ ۱: دو همسایه ۲، یک همسایه ۰ و یک همسایه ۳
+    cleaned, _ = SpeckleCleaner(min_knots=2).clean_indices(indices, 4)
+    assert cleaned[1, 1] == 2
+    # تساوی آرا به نفع اندیس کوچک‌تر
+    cleaned, _ = SpeckleCleaner(min_knots=2).clean_indices(np.array([[2, 2, 1, 0, 0]], dtype=np.uint8), 3)
+    assert cleaned.tolist() == [[2, 2, 0, 0, 0]]
+
+
+def test_large_dithered_map_is_cleaned_with_bounded_memory():
+    # نقشه‌ای شبیه خروجی دیترینگ: تقریباً هر گره یک جزیره است (۲٫۲۵ میلیون گره، ۳۲ رنگ)
+    indices = np.random.default_rng(0).integers(0, 32, size=(1500, 1500), dtype=np.uint8)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        cleaned, stats = SpeckleCleaner().clean_indices(indices, 32)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert stats['islands_merged'] > 0
+    # چند آرایه هم‌اندازه نقشه، نه (تعداد جزیره‌ها × تعداد رنگ‌ها)
+    assert peak < 64 * indices.size
+    assert seconds < 30
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.utils.stage_cache import StageCache
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = StageCache(cache_dir=str(tmp_path))
+    cache.put('key', {'array': np.arange(6).reshape(2, 3), 'count': 3})
+    values = cache.get('key')
+    assert values['count'] == 3 and values['array'].tolist() == [[0, 1, 2], [3, 4, 5]]
+    assert cache.stats() == {'hits': 1, 'misses': 0}
+
+
+def test_evict_skips_in_flight_temp_dirs(tmp_path):
+    cache = StageCache(cache_dir=str(tmp_path), max_size_mb=0)
+    temp_dir = tmp_path / 'other.0123.tmp'
+    temp_dir.mkdir()
+    (temp_dir / StageCache.META_FILE).write_text('{"values": {}}')
+    (temp_dir / 'data.bin').write_bytes(b'x' * 1024)
+    cache.put('key', {'count': 1})
+    assert temp_dir.exists()
+    assert cache.get('key') is None
+
+
+def test_get_survives_concurrent_eviction(tmp_path, monkeypatch):
+    cache = StageCache(cache_dir=str(tmp_path))
+    cache.put('key', {'count': 1})
+
+    def removed(path, times=None):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, 'utime', removed)
+    assert cache.get('key') == {'count': 1}
+
+
+def test_put_survives_eviction_errors(tmp_path, monkeypatch):
+    cache = StageCache(cache_dir=str(tmp_path))
+
+    def broken_evict():
+        raise PermissionError("locked")
+    monkeypatch.setattr(cache, 'evict', broken_evict)
+    cache.put('key', {'count': 1})
+    assert cache.get('key') == {'count': 1}
+
+
+def test_evict_skips_entries_vanishing_mid_scan(tmp_path, monkeypatch):
+    cache = StageCache(cache_dir=str(tmp_path), max_size_mb=0)
+    for key in ('a', 'b'):
+        os.makedirs(tmp_path / key)
+        (tmp_path / key / StageCache.META_FILE).write_text('{"values": {}}')
+    original = cache._entry_size
+
+    def entry_size(entry_dir):
+        if entry_dir.endswith('a'):
+            raise FileNotFoundError(entry_dir)
+        return original(entry_dir)
+    monkeypatch.setattr(cache, '_entry_size', entry_size)
+    cache.evict()
+    assert not (tmp_path / 'b').exists()
+
+
+def _hammer(cache_dir, worker):
+    cache = StageCache(cache_dir=cache_dir, max_size_mb=0.05)
+    rng = np.random.default_rng(worker)
+    for i in range(40):
+        key = f"k{rng.integers(0, 6)}"
+        cache.put(key, {'array': rng.integers(0, 255, size=(64, 64), dtype=np.uint8), 'i': i})
+        cache.get(f"k{rng.integers(0, 6)}")
+    return worker
+
+
+def test_processes_can_share_the_cache_dir(tmp_path):
+    with ProcessPoolExecutor(max_workers=3, mp_context=multiprocessing.get_context('spawn')) as pool:
+        assert sorted(pool.map(_hammer, [str(tmp_path)] * 3, range(3))) == [0, 1, 2]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.pipeline.stage_graph import Stage, StageGraph
+
+
+def chain_graph(seen):
+    def step(source_name, output_name):
+        def run(**inputs):
+            seen.append(dict(inputs))
+            return {output_name: f"{inputs[source_name]}>{output_name}"}
+        return run
+
+    return StageGraph([
+        Stage('a', step('original', 'x'), inputs=('original',), outputs=('x',)),
+        Stage('b', step('x', 'y'), inputs=('x',), outputs=('y',)),
+        Stage('c', step('y', 'z'), inputs=('y',), outputs=('z',)),
+    ])
+
+
+def test_execute_keeps_all_artifacts_by_default():
+    artifacts = chain_graph([]).execute({'original': 'o'}, max_workers=1)
+    assert artifacts == {'original': 'o', 'x': 'o>x', 'y': 'o>x>y', 'z': 'o>x>y>z'}
+
+
+def test_execute_releases_consumed_artifacts_outside_keep():
+    seen = []
+    artifacts = chain_graph(seen).execute({'original': 'o'}, max_workers=1, keep={'z'})
+    assert artifacts == {'z': 'o>x>y>z'}
+    assert [inputs for inputs in seen] == [{'original': 'o'}, {'x': 'o>x'}, {'y': 'o>x>y'}]
+
+
+def test_optional_stage_failure_is_not_recorded_and_retried(tmp_path):
+    from src.pipeline.stage_graph import ArtifactStore
+    calls = []
+
+    def flaky(x):
+        calls.append(x)
+        if len(calls) == 1:
+            raise RuntimeError("optional failed")
+        return {'v': x + '>v'}
+
+    def graph():
+        return StageGraph([
+            Stage('a', lambda original: {'x': original + '>x'}, inputs=('original',), outputs=('x',)),
+            Stage('v', flaky, inputs=('x',), outputs=('v',), optional=True),
+        ])
+
+    first = graph()
+    artifacts = first.execute({'original': 'o'}, store=ArtifactStore(str(tmp_path)), max_workers=1)
+    assert artifacts['x'] == 'o>x' and artifacts['v'] is None
+    assert list(first.failures) == ['v']
+    assert first.metrics[-1]['source'] == 'failed' and 'optional failed' in first.metrics[-1]['error']
+
+    second = graph()
+    artifacts = second.execute({'original': 'o'}, store=ArtifactStore(str(tmp_path)), max_workers=1)
+    assert artifacts['v'] == 'o>x>v' and not second.failures
+    assert [m['source'] for m in second.metrics] == ['resume', 'run']
+
+
+def test_required_stage_failure_still_raises():
+    def broken(original):
+        raise RuntimeError("required failed")
+    graph = StageGraph([Stage('a', broken, inputs=('original',), outputs=('x',))])
+    with pytest.raises(RuntimeError, match="required failed"):
+        graph.execute({'original': 'o'}, max_workers=1)
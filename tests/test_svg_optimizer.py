@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from src.utils.svg_optimizer import SVGOptimizer
+
+SVG = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" width="10" height="10">\n'
+    '<path d="M0 0 L1 0 L1 1 L0 1 Z" fill="#ff0000" transform="translate(3,4)"/>\n'
+    '<path d="M0 0 L6 0 L6 5 L0 5 Z" fill="#00ff00" transform="translate(1,1)"/>\n'
+    '</svg>\n'
+)
+
+
+def write_svg(tmp_path):
+    path = tmp_path / 'design.svg'
+    path.write_text(SVG, encoding='utf-8')
+    return str(path)
+
+
+def test_single_knot_paths_are_kept_by_default(tmp_path):
+    path = write_svg(tmp_path)
+    stats = SVGOptimizer().optimize(path)
+    assert stats['paths_dropped'] == 0
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    assert 'M3 4' in content and '#ff0000' in content
+
+
+def test_min_path_area_drops_paths_below_threshold(tmp_path):
+    path = write_svg(tmp_path)
+    stats = SVGOptimizer(min_path_area=2).optimize(path)
+    assert stats['paths_dropped'] == 1
+    with open(path, encoding='utf-8') as f:
+        assert '#ff0000' not in f.read()
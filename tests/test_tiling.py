@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.utils.tiling import apply_mask_in_strips
+
+
+@pytest.mark.parametrize('strip_rows', [None, 1, 5, 100])
+def test_apply_mask_in_strips_matches_full_mask(strip_rows):
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, size=(37, 23, 3), dtype=np.uint8)
+    mask = rng.random((37, 23)) > 0.5
+    expected = image.copy()
+    expected[~mask] = (1, 2, 3)
+    result = apply_mask_in_strips(Image.fromarray(image), mask, (1, 2, 3), strip_rows=strip_rows)
+    assert np.array_equal(np.asarray(result), expected)
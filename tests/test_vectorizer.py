@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.processors import vectorizer as vectorizer_module
+from src.processors.vectorizer import Vectorizer
+
+
+class FakeBinding:
+    """ماژول پایتونی ساختگی vtracer: برای هر ماسک یک مسیر مربعی برمی‌گرداند."""
+    def convert_raw_image_to_svg(self, png_bytes, img_format='png', **params):
+        return '<svg><path d="M0 0 L1 0 L1 1 Z" fill="#000000" transform="translate(0,0)"/></svg>'
+
+
+@pytest.fixture
+def vectorizer(monkeypatch):
+    monkeypatch.setattr(vectorizer_module, 'load_vtracer_binding', lambda: FakeBinding())
+    instance = Vectorizer(backend='python')
+    yield instance
+    instance.close()
+
+
+def test_per_color_tracing_uses_no_temp_files(vectorizer, monkeypatch, tmp_path):
+    def no_temp_dir(*args, **kwargs):
+        raise AssertionError("temporary directory created")
+    monkeypatch.setattr(vectorizer_module.tempfile, 'TemporaryDirectory', no_temp_dir)
+    indices = np.zeros((8, 8), dtype=np.uint8)
+    indices[2:4, 2:4] = 1
+    indices[5:7, 1:3] = 2
+    image = Image.fromarray(indices, 'P')
+    image.putpalette([255, 255, 255, 255, 0, 0, 0, 255, 0])
+
+    output_path = str(tmp_path / 'design.svg')
+    vectorizer.vectorize_per_color(image, output_path, workers=1)
+    with open(output_path, encoding='utf-8') as f:
+        content = f.read()
+    assert content.count('<path') == 2 and 'fill="#000000"' not in content
+
+
+def test_process_pool_is_reused_across_calls(vectorizer):
+    pool = vectorizer._get_pool(2)
+    assert vectorizer._get_pool(2) is pool
+    assert vectorizer._get_pool(3) is not pool
+    vectorizer.close()
+    assert vectorizer._pool is None
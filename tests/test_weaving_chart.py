@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.utils.weaving_chart import (WeavingChartReader, WeavingChartWriter, encode_runs, export_weaving_chart,
+                                     replace_chart_palette)
+
+
+def knot_map(height=37, width=53, n_colors=5, seed=0):
+    rng = np.random.default_rng(seed)
+    # رج‌هایی با اجراهای طولانی و کوتاه، و یک رج تک‌رنگ
+    indices = np.repeat(rng.integers(0, n_colors, size=(height, width // 4 + 1)), 4, axis=1)[:, :width]
+    indices[::3] = rng.integers(0, n_colors, size=(len(indices[::3]), width))
+    indices[5] = 2
+    image = Image.fromarray(indices.astype(np.uint8), 'P')
+    image.putpalette(rng.integers(0, 256, size=n_colors * 3).tolist())
+    return image
+
+
+def test_encode_runs_expands_back_to_the_rows():
+    strip = np.array([[1, 1, 2, 2, 2, 0], [3, 3, 3, 3, 3, 3]], dtype=np.uint8)
+    values, lengths, runs_per_row = encode_runs(strip)
+    assert runs_per_row.tolist() == [3, 1]
+    assert np.array_equal(np.repeat(values, lengths), strip.reshape(-1))
+
+
+@pytest.mark.parametrize('binary', [True, False])
+@pytest.mark.parametrize('strip_rows', [1, 8, 1024])
+def test_round_trip(tmp_path, binary, strip_rows):
+    image = knot_map()
+    path = str(tmp_path / ('chart.wrle' if binary else 'chart.txt'))
+    export_weaving_chart(image, path, binary=binary, strip_rows=strip_rows)
+
+    reader = WeavingChartReader(path)
+    assert (reader.width, reader.height) == image.size
+    assert np.array_equal(reader.to_indices(), np.asarray(image))
+    assert reader.palette[:5].tolist() == np.array(image.getpalette()[:15]).reshape(-1, 3).tolist()
+
+
+def test_writer_rejects_rows_beyond_height(tmp_path):
+    palette = np.zeros((2, 3), dtype=np.uint8)
+    with pytest.raises(ValueError):
+        with WeavingChartWriter(str(tmp_path / 'chart.wrle'), 4, 1, palette) as writer:
+            writer.write(np.zeros((2, 4), dtype=np.uint8))
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_replace_palette_keeps_runs(tmp_path, binary):
+    image = knot_map()
+    path = str(tmp_path / 'chart')
+    export_weaving_chart(image, path, binary=binary)
+    palette = WeavingChartReader(path).palette.copy()
+    palette[0] = (1, 2, 3)
+
+    replace_chart_palette(path, palette)
+    reader = WeavingChartReader(path)
+    assert reader.palette[0].tolist() == [1, 2, 3]
+    assert np.array_equal(reader.to_indices(), np.asarray(image))
+
+
+def exported_chart(tmp_path, binary, compress=True):
+    image = knot_map()
+    path = str(tmp_path / ('chart.wrle' if binary else 'chart.txt'))
+    with WeavingChartWriter(path, image.width, image.height, image.getpalette()[:15], binary=binary,
+                            compress=compress) as writer:
+        writer.write(image)
+    with open(path, 'rb') as f:
+        return path, f.read()
+
+
+def rewrite(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize('cut', ['last_row', 'mid_row', 'mid_run'])
+def test_truncated_text_chart_is_rejected(tmp_path, cut):
+    path, data = exported_chart(tmp_path, binary=False)
+    lines = data.splitlines(keepends=True)
+    if cut == 'last_row':
+        data = b''.join(lines[:-1])
+    elif cut == 'mid_row':
+        data = b''.join(lines[:-1]) + lines[-1][:len(lines[-1]) // 2].rsplit(b' ', 1)[0] + b'\n'
+    else:
+        data = data.rstrip(b'\n')[:-1]
+    rewrite(path, data)
+    with pytest.raises(ValueError):
+        WeavingChartReader(path).to_indices()
+
+
+def test_text_chart_with_a_missing_or_extra_row_is_rejected(tmp_path):
+    path, data = exported_chart(tmp_path, binary=False)
+    lines = data.splitlines(keepends=True)
+    rewrite(path, b''.join(lines[:-3] + lines[-2:]))
+    with pytest.raises(ValueError):
+        WeavingChartReader(path).to_indices()
+    rewrite(path, data + lines[-1])
+    with pytest.raises(ValueError):
+        WeavingChartReader(path).to_indices()
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_truncated_binary_chart_is_rejected(tmp_path, compress):
+    path, data = exported_chart(tmp_path, binary=True, compress=compress)
+    for size in (len(data) - 1, len(data) * 2 // 3):
+        rewrite(path, data[:size])
+        with pytest.raises(ValueError):
+            WeavingChartReader(path).to_indices()
+    if not compress:
+        rewrite(path, data + b'\x00')
+        with pytest.raises(ValueError):
+            WeavingChartReader(path).to_indices()